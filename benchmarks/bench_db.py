@@ -0,0 +1,107 @@
+# benchmarks/bench_db.py
+#
+# Сравнение пропускной способности: sqlite3.connect() на каждый вызов
+# против долгоживущего соединения из utils.db_connection.
+#
+# Одна "операция" повторяет горячий путь личного сообщения:
+# is_banned + is_muted + save_mapping.
+#
+# Запуск: python -m benchmarks.bench_db [--ops 2000]
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+from utils.db_connection import ConnectionManager
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS relay_map (
+        forwarded_id INTEGER PRIMARY KEY,
+        original_user_id INTEGER NOT NULL,
+        original_message_id INTEGER NOT NULL,
+        timestamp TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS moderation (
+        user_id INTEGER PRIMARY KEY,
+        banned INTEGER DEFAULT 0,
+        banned_at TEXT DEFAULT NULL,
+        muted_until TEXT DEFAULT NULL
+    )
+    """,
+]
+
+SELECT_BANNED = "SELECT banned FROM moderation WHERE user_id = ?"
+SELECT_MUTED = "SELECT muted_until FROM moderation WHERE user_id = ?"
+INSERT_MAPPING = """
+    INSERT OR REPLACE INTO relay_map (forwarded_id, original_user_id, original_message_id)
+    VALUES (?, ?, ?)
+"""
+
+
+def _prepare(path: str) -> None:
+    with sqlite3.connect(path) as conn:
+        for ddl in SCHEMA:
+            conn.execute(ddl)
+        conn.executemany(
+            "INSERT OR REPLACE INTO moderation (user_id, banned) VALUES (?, ?)",
+            [(uid, uid % 50 == 0) for uid in range(1000)],
+        )
+
+
+def bench_per_call_connect(path: str, ops: int) -> float:
+    start = time.perf_counter()
+    for i in range(ops):
+        user_id = i % 1000
+        with sqlite3.connect(path) as conn:
+            conn.execute(SELECT_BANNED, (user_id,)).fetchone()
+        with sqlite3.connect(path) as conn:
+            conn.execute(SELECT_MUTED, (user_id,)).fetchone()
+        with sqlite3.connect(path) as conn:
+            conn.execute(INSERT_MAPPING, (i, user_id, i))
+            conn.commit()
+    return ops / (time.perf_counter() - start)
+
+
+def bench_connection_manager(path: str, ops: int) -> float:
+    manager = ConnectionManager(path)
+    try:
+        start = time.perf_counter()
+        for i in range(ops):
+            user_id = i % 1000
+            with manager.get() as conn:
+                conn.execute(SELECT_BANNED, (user_id,)).fetchone()
+            with manager.get() as conn:
+                conn.execute(SELECT_MUTED, (user_id,)).fetchone()
+            with manager.get() as conn:
+                conn.execute(INSERT_MAPPING, (i, user_id, i))
+        return ops / (time.perf_counter() - start)
+    finally:
+        manager.close_all()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк соединений SQLite")
+    parser.add_argument("--ops", type=int, default=2000, help="число операций на прогон")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        per_call_path = os.path.join(tmp, "per_call.db")
+        managed_path = os.path.join(tmp, "managed.db")
+        _prepare(per_call_path)
+        _prepare(managed_path)
+
+        per_call = bench_per_call_connect(per_call_path, args.ops)
+        managed = bench_connection_manager(managed_path, args.ops)
+
+    print(f"connect() на каждый вызов : {per_call:10.0f} ops/s")
+    print(f"ConnectionManager (WAL)   : {managed:10.0f} ops/s")
+    print(f"Ускорение                 : {managed / per_call:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
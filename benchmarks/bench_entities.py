@@ -0,0 +1,96 @@
+# benchmarks/bench_entities.py
+#
+# Раскладка entities по кускам длинного отформатированного поста:
+#   - прежний способ: slice_entities на каждый кусок (полный просмотр списка
+#     entities и новый MessageEntity через конструктор с валидацией для каждого);
+#   - utils.sender.split_entities: одна сортировка и проход по границам кусков,
+#     новый объект только при изменении offset/length (model_copy).
+# Отдельно — shift_entities (смещение на длину префикса) до и после.
+#
+# Запуск: python -m benchmarks.bench_entities [--entities 2000] [--chunks 25]
+
+import argparse
+import random
+import time
+
+from aiogram.types import MessageEntity
+
+from utils.sender import shift_entities, split_entities
+
+
+def old_slice_entities(entities, start, end):
+    new_entities = []
+    for ent in entities or []:
+        ent_start = ent.offset
+        ent_end = ent.offset + ent.length
+        if ent_start >= start and ent_end <= end:
+            new_entities.append(MessageEntity(
+                type=ent.type, offset=ent_start - start, length=ent.length,
+                url=ent.url, user=ent.user, language=ent.language,
+            ))
+        elif ent_start < end and ent_end > start:
+            clipped_start = max(ent_start, start)
+            clipped_end = min(ent_end, end)
+            new_entities.append(MessageEntity(
+                type=ent.type, offset=clipped_start - start, length=clipped_end - clipped_start,
+                url=ent.url, user=ent.user, language=ent.language,
+            ))
+    return new_entities
+
+
+def old_shift_entities(entities, offset):
+    return [
+        MessageEntity(
+            type=ent.type, offset=ent.offset + offset, length=ent.length,
+            url=ent.url, user=ent.user, language=ent.language,
+        )
+        for ent in entities
+    ]
+
+
+def _entities(count: int, text_len: int) -> list[MessageEntity]:
+    rng = random.Random(11)
+    result = []
+    for _ in range(count):
+        kind = rng.choice(["bold", "italic", "text_link", "code", "underline"])
+        result.append(MessageEntity(
+            type=kind,
+            offset=rng.randrange(text_len - 50),
+            length=rng.randint(1, 40),
+            url="https://example.com" if kind == "text_link" else None,
+        ))
+    return result
+
+
+def _timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк раскладки entities по кускам")
+    parser.add_argument("--entities", type=int, default=2000, help="число entities в посте")
+    parser.add_argument("--chunks", type=int, default=25, help="число кусков по 4096")
+    parser.add_argument("--repeat", type=int, default=20, help="повторов на замер")
+    args = parser.parse_args()
+
+    text_len = args.chunks * 4096
+    entities = _entities(args.entities, text_len)
+    bounds = [(i * 4096, min((i + 1) * 4096, text_len)) for i in range(args.chunks)]
+
+    old = _timed(lambda: [old_slice_entities(entities, start, end) for start, end in bounds], args.repeat)
+    new = _timed(lambda: split_entities(entities, bounds), args.repeat)
+    old_shift = _timed(lambda: old_shift_entities(entities, 17), args.repeat)
+    new_shift = _timed(lambda: shift_entities(entities, 17), args.repeat)
+
+    print(f"entities={args.entities}, кусков={args.chunks}")
+    print(f"slice_entities на кусок       : {old:8.2f} мс")
+    print(f"split_entities (один проход)  : {new:8.2f} мс  ({old / new:.1f}x)")
+    print(f"shift_entities (конструктор)  : {old_shift:8.2f} мс")
+    print(f"shift_entities (model_copy)   : {new_shift:8.2f} мс  ({old_shift / new_shift:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
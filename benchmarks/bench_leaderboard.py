@@ -0,0 +1,101 @@
+# benchmarks/bench_leaderboard.py
+#
+# /top10 на синтетической таблице thanks из 100k пользователей:
+# ORDER BY count DESC LIMIT 10 без индекса (как было), с индексом idx_thanks_count
+# и чтение из in-memory топа utils.leaderboard. Отдельно — стоимость инкремента топа.
+#
+# Запуск: python -m benchmarks.bench_leaderboard [--users 100000] [--queries 200]
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from utils.leaderboard import Leaderboard
+
+TOP_SQL = "SELECT name, count FROM thanks ORDER BY count DESC, user_id LIMIT 10"
+LOAD_SQL = "SELECT user_id, name, count FROM thanks ORDER BY count DESC, user_id LIMIT 10"
+
+
+def _prepare(path: str, users: int, with_index: bool) -> None:
+    rng = random.Random(42)
+    with sqlite3.connect(path) as conn:
+        conn.execute("""
+            CREATE TABLE thanks (
+                user_id INTEGER PRIMARY KEY,
+                name TEXT,
+                count INTEGER DEFAULT 0
+            )
+        """)
+        conn.executemany(
+            "INSERT INTO thanks (user_id, name, count) VALUES (?, ?, ?)",
+            # Длинный хвост: большинство с 1–3 благодарностями, немногие — с сотнями
+            ((uid, f"user{uid}", int(rng.paretovariate(1.2))) for uid in range(users)),
+        )
+        if with_index:
+            conn.execute("CREATE INDEX idx_thanks_count ON thanks (count DESC, user_id)")
+
+
+def bench_sql(path: str, queries: int) -> float:
+    with sqlite3.connect(path) as conn:
+        start = time.perf_counter()
+        for _ in range(queries):
+            conn.execute(TOP_SQL).fetchall()
+        return (time.perf_counter() - start) / queries * 1000
+
+
+def bench_memory(path: str, queries: int) -> tuple[float, float]:
+    board = Leaderboard(10)
+    with sqlite3.connect(path) as conn:
+        start = time.perf_counter()
+        board.load(conn.execute(LOAD_SQL).fetchall())
+        load_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    for _ in range(queries):
+        board.top(10)
+    return load_ms, (time.perf_counter() - start) / queries * 1000
+
+
+def bench_updates(users: int, updates: int) -> float:
+    rng = random.Random(7)
+    counts = [0] * users
+    board = Leaderboard(10)
+    start = time.perf_counter()
+    for _ in range(updates):
+        uid = rng.randrange(users)
+        counts[uid] += 1
+        board.update(uid, f"user{uid}", counts[uid])
+    return (time.perf_counter() - start) / updates * 1_000_000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк /top10")
+    parser.add_argument("--users", type=int, default=100_000, help="число пользователей в thanks")
+    parser.add_argument("--queries", type=int, default=200, help="число запросов топа на прогон")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        plain_path = os.path.join(tmp, "plain.db")
+        indexed_path = os.path.join(tmp, "indexed.db")
+        _prepare(plain_path, args.users, with_index=False)
+        _prepare(indexed_path, args.users, with_index=True)
+
+        plain = bench_sql(plain_path, args.queries)
+        indexed = bench_sql(indexed_path, args.queries)
+        load_ms, memory = bench_memory(indexed_path, args.queries)
+
+    update_us = bench_updates(args.users, 100_000)
+
+    print(f"Пользователей в thanks          : {args.users}")
+    print(f"ORDER BY без индекса            : {plain:10.3f} мс/запрос")
+    print(f"ORDER BY по idx_thanks_count    : {indexed:10.3f} мс/запрос")
+    print(f"Leaderboard.top() из памяти     : {memory:10.4f} мс/запрос")
+    print(f"Загрузка топа при старте        : {load_ms:10.3f} мс")
+    print(f"Инкремент топа                  : {update_us:10.2f} мкс/обновление")
+
+
+if __name__ == "__main__":
+    main()
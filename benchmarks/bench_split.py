@@ -0,0 +1,81 @@
+# benchmarks/bench_split.py
+#
+# Разбиение патологических входов ~100 KB на части по 4096 единиц UTF-16:
+#   - старый split_text: срезы по символам Python (части с эмодзи превышают лимит);
+#   - "наивный" корректный вариант: подрезать часть, пока utf16_len() > limit
+#     (перекодирование строки на каждой проверке);
+#   - utils.text_split.split_text: одно сканирование + бинарный поиск по смещениям UTF-16.
+#
+# Запуск: python -m benchmarks.bench_split [--size 100000] [--repeat 5]
+
+import argparse
+import random
+import time
+
+from utils.sender import utf16_len
+from utils.text_split import split_text
+
+LIMIT = 4096
+
+
+def old_split_text(text: str, limit: int) -> list[str]:
+    return [text[i:i + limit] for i in range(0, len(text), limit)]
+
+
+def naive_utf16_split(text: str, limit: int) -> list[str]:
+    parts = []
+    start = 0
+    while start < len(text):
+        chunk = text[start:start + limit]
+        while utf16_len(chunk) > limit:
+            chunk = chunk[:-1]
+        parts.append(chunk)
+        start += len(chunk)
+    return parts
+
+
+def _corpus(size: int) -> dict[str, str]:
+    rng = random.Random(3)
+    words = ["медицинская", "физика", "дозиметрия", "📡", "линак", "👍🏽", "QA", "протокол", "🧪"]
+    prose = []
+    while sum(map(len, prose)) < size:
+        sentence = " ".join(rng.choice(words) for _ in range(rng.randint(5, 15)))
+        prose.append(sentence.capitalize() + rng.choice([". ", "! ", ".\n\n"]))
+    return {
+        "эмодзи без пробелов": "📨" * (size // 2),
+        "ASCII без пробелов": "x" * size,
+        "одни пробелы": " " * size,
+        "текст с эмодзи": "".join(prose)[:size],
+        "ZWJ-последовательности": ("👨\u200d👩\u200d👧" * size)[:size],
+    }
+
+
+def _run(fn, text: str, repeat: int) -> tuple[float, list[str]]:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parts = fn(text, LIMIT)
+    return (time.perf_counter() - start) / repeat * 1000, parts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк разбиения текста по лимиту UTF-16")
+    parser.add_argument("--size", type=int, default=100_000, help="размер входа в символах")
+    parser.add_argument("--repeat", type=int, default=5, help="повторов на замер")
+    args = parser.parse_args()
+
+    splitters = {
+        "старый split_text": old_split_text,
+        "utf16_len на проверку": naive_utf16_split,
+        "text_split.split_text": split_text,
+    }
+
+    for name, text in _corpus(args.size).items():
+        print(f"\n{name} ({utf16_len(text)} единиц UTF-16)")
+        for label, fn in splitters.items():
+            ms, parts = _run(fn, text, args.repeat)
+            over = sum(utf16_len(part) > LIMIT for part in parts)
+            print(f"  {label:24s}: {ms:9.2f} мс, частей={len(parts):3d}, сверх лимита={over}")
+
+
+if __name__ == "__main__":
+    main()
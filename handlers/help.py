@@ -52,7 +52,7 @@ async def help_command(message: Message, bot: Bot):
             "🙏 <b>Благодарности (only in PRO):</b>\n"
             "Если пользователь отвечает с фразой типа «спасибо» — бот учитывает это в статистике\n\n"
             "📊 <b>Статистика (only in PRO):</b>\n"
-            "/top10 — показать (на 1 минуту) ТОП-10 по благодарностям\n\n"
+            "/top10 [week|month|all] — показать (на 1 минуту) ТОП-10 по благодарностям за неделю, месяц или всё время\n\n"
             "ℹ️ Некоторые команды автоматически удаляются из чата для чистоты\n"
         )
     else:
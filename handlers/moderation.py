@@ -7,7 +7,7 @@ from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import Message
 from aiogram.filters import Command
 
-from utils.db import (
+from utils.async_db import (
     mute_user,
     unmute_user,
     ban_user,
@@ -30,16 +30,18 @@ logger.info("[MOD] moderation.py загружен")
 MAX_CAPTION = 1024
 MAX_TEXT = 4096  # лимит для обычного send_message
 
-def split_text(text: str, limit: int) -> list[str]:
-    """Разбивает текст на части по limit символов."""
-    return [text[i:i+limit] for i in range(0, len(text), limit)]
+def format_utc(ts: int | None) -> str:
+    """Unix-секунды из БД → строка для сообщений (без суффикса UTC)."""
+    if ts is None:
+        return "—"
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
 
-def extract_user_id_from_reply(message: Message) -> int | None:
+async def extract_user_id_from_reply(message: Message) -> int | None:
     if not message.reply_to_message:
         return None
 
     # Пробуем получить ID через карту пересылки
-    mapped_id = get_user_by_forwarded(message.reply_to_message.message_id)
+    mapped_id = await get_user_by_forwarded(message.reply_to_message.message_id)
     if mapped_id:
         return mapped_id
 
@@ -111,7 +113,7 @@ async def cmd_mute(message: Message, bot: Bot):
         await reply_required(message, "/mute")
         return
 
-    user_id = extract_user_id_from_reply(message)
+    user_id = await extract_user_id_from_reply(message)
     logger.info(f"[MOD] user_id из reply: {user_id}")
     if not user_id:
         await reply_required(message, "/mute")
@@ -128,8 +130,9 @@ async def cmd_mute(message: Message, bot: Bot):
             logger.warning(f"[MOD] Не удалось удалить сообщения при ошибке mute: {e}")
         return
 
-    muted_until = (datetime.now(timezone.utc) + duration).isoformat()
-    mute_user(user_id, muted_until=muted_until)
+    muted_until_ts = int((datetime.now(timezone.utc) + duration).timestamp())
+    await mute_user(user_id, muted_until=muted_until_ts)
+    muted_until = format_utc(muted_until_ts)
 
     duration_str = message.text.split(maxsplit=1)[1].strip() if len(message.text.split(maxsplit=1)) > 1 else "2h"
     logger.info(f"[MOD] Замьючен user_id={user_id} до {muted_until} UTC (на {duration_str})")
@@ -153,13 +156,13 @@ async def cmd_unmute(message: Message, bot: Bot):
         await reply_required(message, "/unmute")
         return
 
-    user_id = extract_user_id_from_reply(message)
+    user_id = await extract_user_id_from_reply(message)
     logger.info(f"[MOD] user_id из reply: {user_id}")
     if not user_id:
         await reply_required(message, "/unmute")
         return
 
-    unmute_user(user_id)
+    await unmute_user(user_id)
     logger.info(f"[MOD] Размьючен user_id={user_id}")
     await message.reply(f"🔊 Пользователь {user_id} размьючен.")
 
@@ -169,6 +172,12 @@ async def cmd_unmute(message: Message, bot: Bot):
         logger.warning(f"[MOD] Не удалось отправить уведомление user_id={user_id}: {e}")
 
 
+async def notify_mute_expired(bot: Bot, user_id: int):
+    """Уведомление от планировщика utils/mute_scheduler.py, когда срок мута истёк."""
+    await bot.send_message(user_id, "🔊 Срок мута истёк — вы снова можете писать боту.")
+    logger.info(f"[MOD] Мут истёк, user_id={user_id} уведомлён")
+
+
 # 🚫 /ban
 @router.message(F.chat.id == ADMIN_GROUP_ID, Command("ban", ignore_mention=True, ignore_case=True))
 async def cmd_ban(message: Message, bot: Bot):
@@ -180,14 +189,15 @@ async def cmd_ban(message: Message, bot: Bot):
         await reply_required(message, "/ban")
         return
 
-    user_id = extract_user_id_from_reply(message)
+    user_id = await extract_user_id_from_reply(message)
     logger.info(f"[MOD] user_id из reply: {user_id}")
     if not user_id:
         await reply_required(message, "/ban")
         return
 
-    banned_at = (datetime.now(timezone.utc) + timedelta(hours=2)).isoformat()
-    ban_user(user_id, banned_at=banned_at)
+    banned_at_ts = int((datetime.now(timezone.utc) + timedelta(hours=2)).timestamp())
+    await ban_user(user_id, banned_at=banned_at_ts)
+    banned_at = format_utc(banned_at_ts)
 
     logger.info(f"[MOD] Забанен user_id={user_id} в {banned_at} UTC")
     await message.reply(f"🚫 Пользователь {user_id} заблокирован в {banned_at} UTC.")
@@ -209,13 +219,13 @@ async def cmd_unban(message: Message, bot: Bot):
         await reply_required(message, "/unban")
         return
 
-    user_id = extract_user_id_from_reply(message)
+    user_id = await extract_user_id_from_reply(message)
     logger.info(f"[MOD] user_id из reply: {user_id}")
     if not user_id:
         await reply_required(message, "/unban")
         return
 
-    unban_user(user_id)
+    await unban_user(user_id)
     logger.info(f"[MOD] Разбанен user_id={user_id}")
     await message.reply(f"✅ Пользователь {user_id} разблокирован.")
 
@@ -228,7 +238,7 @@ async def cmd_unban(message: Message, bot: Bot):
 # ❓ /status
 @router.message(F.chat.id == ADMIN_GROUP_ID, Command("status", ignore_mention=True, ignore_case=True))
 async def cmd_status(message: Message):
-    user_id = extract_user_id_from_reply(message)
+    user_id = await extract_user_id_from_reply(message)
     if not user_id:
         await reply_required(message, "/status")
         return
@@ -236,7 +246,7 @@ async def cmd_status(message: Message):
     logger.info(f"[STATUS] Запрос статуса для user_id={user_id}")
 
     try:
-        status = get_user_status(user_id)
+        status = await get_user_status(user_id)
     except Exception as e:
         logger.error(f"[STATUS] Ошибка при получении статуса: {e}")
         await message.answer("⚠️ Не удалось получить статус. Попробуйте позже.")
@@ -247,12 +257,12 @@ async def cmd_status(message: Message):
         return
 
     if status.get("banned"):
-        banned_at = status.get("banned_at")
+        banned_at = format_utc(status.get("banned_at"))
         await message.answer(f"🚫 Пользователь {user_id} заблокирован с {banned_at} UTC.")
         return
 
     if status.get("muted"):
-        muted_until = status.get("muted_until")
+        muted_until = format_utc(status.get("muted_until"))
         await message.answer(f"🔇 Пользователь {user_id} замьючен до {muted_until} UTC.")
         return
 
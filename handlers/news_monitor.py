@@ -1,36 +1,23 @@
 # handlers/news_monitor.py
 
 import html
-import sqlite3
 import hashlib
-from datetime import timedelta, datetime, timezone
 
 from aiogram import Router, Bot
 from aiogram.types import Message
 from aiogram.exceptions import TelegramBadRequest
-from utils.config import MEDPHYSPRO_CHANNEL_ID, MEDPHYSPRO_GROUP_ID, DB_PATH, MEDPHYSPRO_CHANNEL_USERNAME
+from utils.config import MEDPHYSPRO_CHANNEL_ID, MEDPHYSPRO_GROUP_ID, MEDPHYSPRO_CHANNEL_USERNAME
+from utils.async_db import is_hash_already_forwarded, save_forwarded_news, save_news_parts, \
+    get_group_msg_ids, delete_news_parts, get_content_hashes, save_content_hashes
 from utils.logger import get_logger
-from utils.sender import send_content_to_group
+from utils.sender import SentAlbum, chunk_hashes, edit_parts, send_content_to_group, sent_part_pairs
 from utils.topics import resolve_topic_id_by_keywords
 
 router = Router()
 logger = get_logger("news")  # ← вместо "news_monitor"
 logger.info("[NEWS_MONITOR] news_monitor.py загружен")
 
-def init_forwarded_news_table():
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS forwarded_news (
-                message_id INTEGER PRIMARY KEY,
-                content_hash TEXT NOT NULL,
-                group_msg_id INTEGER,
-                forwarded_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
-
-def hash_message_content(message: Message) -> str:
+def _message_content(message: Message) -> str:
     content = (message.text or "") + (message.caption or "")
     # Добавляем уникальные идентификаторы для медиа, чтобы избежать одинаковых хешей для постов без текста
     if message.photo:
@@ -51,45 +38,39 @@ def hash_message_content(message: Message) -> str:
         content += message.video_note.file_unique_id
     elif message.poll:
         content += message.poll.question + ''.join(opt.text for opt in message.poll.options)
+    return content
+
+def hash_message_content(message: Message) -> str:
+    return hashlib.sha256(_message_content(message).encode("utf-8")).hexdigest()
+
+def hash_album_content(album: list[Message]) -> str:
+    """Хеш альбома целиком: подписи и file_unique_id всех элементов по порядку."""
+    content = "".join(_message_content(m) for m in sorted(album, key=lambda m: m.message_id))
     return hashlib.sha256(content.encode("utf-8")).hexdigest()
 
-def is_hash_already_forwarded(content_hash: str) -> bool:
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1 FROM forwarded_news WHERE content_hash = ?", (content_hash,))
-        result = cursor.fetchone()
-        return result is not None
-
-def save_forwarded_news(message_id: int, content_hash: str, group_msg_id: int = None):
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT OR REPLACE INTO forwarded_news (message_id, content_hash, group_msg_id)
-            VALUES (?, ?, ?)
-        """, (message_id, content_hash, group_msg_id))
-        conn.commit()
-
-def get_group_msg_id(message_id: int) -> int | None:
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT group_msg_id FROM forwarded_news WHERE message_id = ?", (message_id,))
-        result = cursor.fetchone()
-        return result[0] if result else None
+def album_caption_item(album: list[Message]) -> Message:
+    """Элемент альбома с подписью — его подпись отправляется под альбомом в группе."""
+    ordered = sorted(album, key=lambda m: m.message_id)
+    return next((m for m in ordered if m.caption), ordered[0])
 
 def contains_deleted_marker(text: str | None) -> bool:
     return text and "deleted" in text.lower()
 
-init_forwarded_news_table()
-
 
 @router.channel_post()
-async def forward_news(message: Message, bot: Bot):
+async def forward_news(message: Message, bot: Bot, album: list[Message] | None = None):
     if message.chat.id != MEDPHYSPRO_CHANNEL_ID:
         return
 
-    content_hash = hash_message_content(message)
+    # Альбом (собран AlbumMiddleware) — один пост: один хеш, одна тема, один send_media_group
+    if album and len(album) > 1:
+        content_hash = hash_album_content(album)
+        message = album_caption_item(album)
+    else:
+        album = None
+        content_hash = hash_message_content(message)
 
-    if is_hash_already_forwarded(content_hash):
+    if await is_hash_already_forwarded(content_hash):
         logger.info(f"[NEWS] Пропущено по хешу: message_id={message.message_id}")
         return
 
@@ -102,7 +83,8 @@ async def forward_news(message: Message, bot: Bot):
             bot=bot,
             chat_id=MEDPHYSPRO_GROUP_ID,
             thread_id=thread_id,
-            suffix=suffix
+            suffix=suffix,
+            album=album
         )
 
         if not sent_messages:
@@ -110,9 +92,22 @@ async def forward_news(message: Message, bot: Bot):
                 f"[NEWS] Неизвестный тип сообщения: message_id={message.message_id}, content_type={message.content_type}")
             return
 
-        # Сохраняем ID первого сообщения (или все, если save_forwarded_news поддерживает list)
-        group_msg_id = sent_messages[0].message_id
-        save_forwarded_news(message.message_id, content_hash, group_msg_id=group_msg_id)
+        # Каждый пост канала (и каждый элемент альбома) — со всеми своими сообщениями в группе:
+        # правка длинного поста доходит до всех частей. Хеш альбома общий для всех элементов
+        parts: dict[int, list[int]] = {}
+        for source_id, group_msg_id in sent_part_pairs(album or [message], sent_messages, headers=False):
+            parts.setdefault(source_id, []).append(group_msg_id)
+        for source_id, group_msg_ids in parts.items():
+            await save_forwarded_news(source_id, content_hash, group_msg_id=group_msg_ids[0])
+            if len(group_msg_ids) > 1:
+                await save_news_parts(source_id, group_msg_ids)
+
+        # Хеши частей с текстом поста — по ним правка канала обновит только изменившиеся части.
+        # Копии альбома (copy_messages) несут исходную подпись без суффикса — их хеши неизвестны
+        if not (isinstance(sent_messages, SentAlbum) and sent_messages.copied):
+            text_parts = parts.get(message.message_id, [])
+            hashes = chunk_hashes(message.html_text + suffix, caption=not message.text)
+            await save_content_hashes(MEDPHYSPRO_GROUP_ID, dict(zip(text_parts, hashes)))
 
         # Если частей >1, логируем все IDs
         ids_str = ", ".join(str(m.message_id) for m in sent_messages)
@@ -122,9 +117,12 @@ async def forward_news(message: Message, bot: Bot):
         logger.exception(f"[NEWS] Ошибка при отправке: {e}")
 
 @router.edited_channel_post()
-async def handle_edited_news(message: Message, bot: Bot):
-    group_msg_id = get_group_msg_id(message.message_id)
-    if not group_msg_id:
+async def handle_edited_news(message: Message, bot: Bot, album: list[Message] | None = None):
+    if album and len(album) > 1:
+        message = album_caption_item(album)
+
+    parts = await get_group_msg_ids(message.message_id)
+    if not parts:
         logger.info(f"[NEWS] Нет group_msg_id для message_id={message.message_id}")
         return
 
@@ -134,56 +132,42 @@ async def handle_edited_news(message: Message, bot: Bot):
     ) or (
         contains_deleted_marker(message.text) or contains_deleted_marker(message.caption)
     ):
-        try:
-            await bot.delete_message(chat_id=MEDPHYSPRO_GROUP_ID, message_id=group_msg_id)
-            logger.info(f"[NEWS] Удалено сообщение в группе: message_id={group_msg_id} (маркер или пустое)")
-        except Exception as e:
-            logger.error(f"[NEWS] Ошибка при удалении: {e}")
+        for group_msg_id in parts:
+            try:
+                await bot.delete_message(chat_id=MEDPHYSPRO_GROUP_ID, message_id=group_msg_id)
+                logger.info(f"[NEWS] Удалено сообщение в группе: message_id={group_msg_id} (маркер или пустое)")
+            except Exception as e:
+                logger.error(f"[NEWS] Ошибка при удалении: {e}")
         return
 
     suffix = f"\n\nИсточник: @{html.escape(MEDPHYSPRO_CHANNEL_USERNAME)}"
 
     try:
-        if message.text:
+        if message.text or message.caption:
             text = message.html_text
             if suffix not in text:
                 text += suffix
 
-            await bot.edit_message_text(
-                chat_id=MEDPHYSPRO_GROUP_ID,
-                message_id=group_msg_id,
-                text=text,
-                parse_mode="HTML"
-            )
-        elif message.caption:
-            caption = message.html_text
-            if suffix not in caption:
-                caption += suffix
-
-            await bot.edit_message_caption(
-                chat_id=MEDPHYSPRO_GROUP_ID,
-                message_id=group_msg_id,
-                caption=caption,
-                parse_mode="HTML"
+            # Пост мог разойтись на несколько частей — правим изменившиеся, лишние удаляем, новые досылаем
+            hashes = await get_content_hashes(MEDPHYSPRO_GROUP_ID, parts)
+            result = await edit_parts(
+                bot, MEDPHYSPRO_GROUP_ID, parts, text, caption=not message.text, hashes=hashes
             )
+            added, removed = result.added, result.removed
+            await save_content_hashes(MEDPHYSPRO_GROUP_ID, dict(zip(result.message_ids, result.hashes)))
+            if added:
+                await save_news_parts(message.message_id, parts + [m.message_id for m in added])
+            if removed:
+                await delete_news_parts(message.message_id, removed)
         else:
             logger.warning(f"[NEWS] Не удалось отредактировать: message_id={message.message_id} — нет текста или caption")
             return
 
-        logger.info(f"[NEWS] Обновлено сообщение: message_id={message.message_id}")
+        if not (result.edited or added or removed):
+            logger.info(f"[NEWS] Правка без изменений текста пропущена: message_id={message.message_id}")
+        else:
+            logger.info(f"[NEWS] Обновлено сообщение: message_id={message.message_id}, частей={len(result.message_ids)}, изменено={result.edited}")
     except TelegramBadRequest as e:
         logger.warning(f"[NEWS] Ошибка Telegram при редактировании: {e}")
     except Exception as e:
         logger.exception(f"[NEWS] Неожиданная ошибка при редактировании: {e}")
-
-def cleanup_forwarded_news(days: int = 7):
-    threshold = datetime.now(timezone.utc) - timedelta(days=days)
-    db_threshold = threshold.strftime("%Y-%m-%d %H:%M:%S")
-
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM forwarded_news WHERE forwarded_at < ?", (db_threshold,))
-        deleted = cursor.rowcount
-        conn.commit()
-
-    logger.debug(f"[DB] Очистка новостей: удалено {deleted} записей старше {db_threshold}")
@@ -2,14 +2,19 @@
 
 import html
 from aiogram import Router, F, Bot
-from aiogram.types import Message, MessageEntity, InputMediaPhoto, InputMediaVideo, InputMediaDocument, InputMediaAudio, User
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, InputMediaPhoto, InputMediaVideo, InputMediaDocument, InputMediaAudio, User
 
 from typing import List
-from utils.config import ADMIN_GROUP_ID
-from utils.db import save_mapping, get_user_by_forwarded, is_banned, is_muted, get_admin_msg_id, get_user_reply_msg, \
-    save_reply_mapping
+from utils.config import ADMIN_GROUP_ID, RELAY_COALESCE_MS
+from utils.async_db import save_mappings, delete_mappings, get_user_by_forwarded, get_restriction, \
+    get_admin_msg_ids, get_user_reply_msg, save_reply_mapping, save_reply_mappings, get_forwarded_originals, \
+    get_content_hashes, save_content_hashes
+from utils.coalesce import BurstCoalescer
+from utils.html_split import rendered_utf16_len
 from utils.logger import get_logger
-from utils.sender import send_content_to_group, shift_entities, utf16_len
+from utils.moderation_cache import BANNED, MUTED
+from utils.sender import MAX_TEXT, content_hash, edit_parts, send_content_to_group, sent_part_pairs
 
 router = Router()
 logger = get_logger("relay")
@@ -30,50 +35,100 @@ def format_header(user: User) -> str:
     return header_content.as_html()
 
 
-async def relay_content(message: Message, bot: Bot, header_html: str = "") -> List[Message]:
-    """Forwards a single user message to the admin group with the relay header."""
+async def relay_content(message: Message, bot: Bot, header_html: str = "", album: List[Message] = None) -> List[Message]:
+    """Forwards a user message (or a whole album) to the admin group with the relay header."""
     return await send_content_to_group(
         message=message,
         bot=bot,
         chat_id=ADMIN_GROUP_ID,
         prefix=header_html,
-        parse_mode="HTML"
+        parse_mode="HTML",
+        album=album
     )
 
+# Разделитель сообщений серии в объединённом посте
+BURST_SEPARATOR = "\n\n"
+
+
+def is_coalescible(message: Message) -> bool:
+    """Простой текст без пересылки — такие сообщения можно объединять в серию."""
+    return bool(message.text) and not (message.forward_from or message.forward_from_chat)
+
+
+async def relay_burst(user_id: int, items: list[tuple[Message, Bot]]) -> None:
+    """Отправляет серию текстов пользователя одним постом с одним заголовком и одним подтверждением."""
+    messages = [message for message, _ in items]
+    bot = items[-1][1]
+    last = messages[-1]
+    try:
+        header_html = format_header(last.from_user)
+        if len(messages) == 1:
+            sent = await relay_content(last, bot, header_html=header_html)
+        else:
+            text = header_html + BURST_SEPARATOR.join(message.html_text for message in messages)
+            sent = [await bot.send_message(chat_id=ADMIN_GROUP_ID, text=text, parse_mode="HTML")]
+        if sent:
+            # Каждое сообщение серии связано с постом — ответы и правки находят его по любому
+            await save_mappings([
+                (part.message_id, user_id, message.message_id)
+                for message in messages
+                for part in sent
+            ])
+            logger.info(f"[RELAY] Серия от {user_id}: сообщений={len(messages)}")
+        await last.answer("✅ Ваше сообщение получено!")
+    except Exception as e:
+        logger.error(f"[RELAY] Ошибка пересылки серии: {e}")
+        await last.answer("⚠️ Не удалось переслать сообщение.")
+
+
+# None — объединение выключено (RELAY_COALESCE_MS=0)
+relay_bursts = BurstCoalescer(RELAY_COALESCE_MS / 1000, relay_burst) if RELAY_COALESCE_MS else None
+
+
+async def coalesce_message(message: Message, bot: Bot, header_html: str) -> None:
+    """Добавляет текст в серию пользователя; если пост вышел бы длиннее 4096, прежняя серия уходит сразу."""
+    user_id = message.from_user.id
+    pending = relay_bursts.pending(user_id)
+    if pending:
+        texts = [m.html_text for m, _ in pending] + [message.html_text]
+        if rendered_utf16_len(header_html + BURST_SEPARATOR.join(texts)) > MAX_TEXT:
+            await relay_bursts.flush(user_id)
+    relay_bursts.add(user_id, (message, bot))
+
+
+async def flush_relay_bursts() -> None:
+    if relay_bursts:
+        await relay_bursts.flush_all()
+
+
 @router.message(F.chat.type == "private")
 async def handle_private_message(message: Message, bot: Bot, album: List[Message] = None):
     user = message.from_user
 
-    if is_banned(user.id):
+    restriction = await get_restriction(user.id)
+    if restriction == BANNED:
         await message.answer("🚫 Вы заблокированы.")
         return
 
-    if is_muted(user.id):
+    if restriction == MUTED:
         await message.answer("🔇 Вы временно замьючены.")
         return
 
     try:
         header_html = format_header(user)
 
+        if relay_bursts:
+            if not album and is_coalescible(message):
+                await coalesce_message(message, bot, header_html)
+                return
+            # Незавершённая серия текстов уходит раньше этого сообщения
+            await relay_bursts.flush(user.id)
+
         # 🖼️ Альбом
         if album:
-            media = []
-            for i, msg in enumerate(album):
-                # Извлекаем оригинальный HTML-контент
-                user_html = msg.html_text or ""
-                
-                if i == 0:
-                    current_caption = header_html + user_html
-                else:
-                    current_caption = user_html
-
-                if msg.photo:
-                    media.append(InputMediaPhoto(media=msg.photo[-1].file_id, caption=current_caption, parse_mode="HTML"))
-                elif msg.video:
-                    media.append(InputMediaVideo(media=msg.video.file_id, caption=current_caption, parse_mode="HTML"))
-            
-            sent = await bot.send_media_group(chat_id=ADMIN_GROUP_ID, media=media)
-            save_mapping(sent[0].message_id, user.id, album[0].message_id)
+            sent = await relay_content(message, bot, header_html=header_html, album=album)
+            # Каждый элемент альбома — к своему сообщению пользователя: ответ на любой из них дойдёт
+            await save_mappings([(sid, user.id, mid) for mid, sid in sent_part_pairs(album, sent)])
             logger.info(f"[RELAY] Альбом от {user.id} ({user.full_name})")
 
         # 🔁 Пересланное сообщение
@@ -85,14 +140,17 @@ async def handle_private_message(message: Message, bot: Bot, album: List[Message
                 from_chat_id=message.chat.id,
                 message_id=message.message_id
             )
-            save_mapping(forwarded.message_id, user.id, message.message_id)
+            await save_mappings([
+                (intro.message_id, user.id, message.message_id),
+                (forwarded.message_id, user.id, message.message_id),
+            ])
 
         # 📦 Всё остальное (единичные сообщения)
         else:
             sent_list = await relay_content(message, bot, header_html=header_html)
             if sent_list:
-                # Мапим первое сообщение из списка (обычно оно единственное)
-                save_mapping(sent_list[0].message_id, user.id, message.message_id)
+                # Все части длинного сообщения: ответ на любую находит пользователя, правка — все части
+                await save_mappings([(sent.message_id, user.id, message.message_id) for sent in sent_list])
                 logger.info(f"[RELAY] Контент от {user.id} ({user.full_name})")
 
         await message.answer("✅ Ваше сообщение получено!")
@@ -109,7 +167,7 @@ async def handle_group_reply(message: Message, bot: Bot, album: list[Message] =
         return
 
     forwarded_id = message.reply_to_message.message_id
-    user_id = get_user_by_forwarded(forwarded_id)
+    user_id = await get_user_by_forwarded(forwarded_id)
 
     if not user_id:
         logger.warning(f"[RELAY] Не найден user_id для forwarded_id={forwarded_id}")
@@ -120,6 +178,7 @@ async def handle_group_reply(message: Message, bot: Bot, album: list[Message] =
         # --- Альбом (несколько фото/видео/доков/аудио) ---
         if album:
             media = []
+            sources = []  # элементы альбома админа, попавшие в media, — по порядку
             for msg in album:
                 if msg.photo:
                     media.append(InputMediaPhoto(
@@ -127,29 +186,35 @@ async def handle_group_reply(message: Message, bot: Bot, album: list[Message] =
                         caption=msg.html_text or "",
                         parse_mode="HTML"
                     ))
+                    sources.append(msg)
                 elif msg.video:
                     media.append(InputMediaVideo(
                         media=msg.video.file_id,
                         caption=msg.html_text or "",
                         parse_mode="HTML"
                     ))
+                    sources.append(msg)
                 elif msg.document:
                     media.append(InputMediaDocument(
                         media=msg.document.file_id,
                         caption=msg.html_text or "",
                         parse_mode="HTML"
                     ))
+                    sources.append(msg)
                 elif msg.audio:
                     media.append(InputMediaAudio(
                         media=msg.audio.file_id,
                         caption=msg.html_text or "",
                         parse_mode="HTML"
                     ))
+                    sources.append(msg)
             if media:
                 sent = await bot.send_media_group(chat_id=user_id, media=media)
-                save_reply_mapping(admin_msg_id=message.message_id,
-                                   user_id=user_id,
-                                   user_msg_id=sent[0].message_id)
+                # Правка любого элемента альбома админа находит свою копию у пользователя
+                await save_reply_mappings([
+                    (source.message_id, user_id, copy.message_id)
+                    for source, copy in zip(sources, sent)
+                ])
                 logger.info(f"[RELAY] Ответ-альбом отправлен пользователю {user_id}")
             else:
                 logger.warning(f"[RELAY] Альбом не содержит поддерживаемых типов")
@@ -221,9 +286,9 @@ async def handle_group_reply(message: Message, bot: Bot, album: list[Message] =
                     message_id=message.message_id
                 )
 
-            save_reply_mapping(admin_msg_id=message.message_id,
-                               user_id=user_id,
-                               user_msg_id=sent.message_id)
+            await save_reply_mapping(admin_msg_id=message.message_id,
+                                     user_id=user_id,
+                                     user_msg_id=sent.message_id)
             logger.info(f"[RELAY] Ответ отправлен пользователю {user_id}")
 
     except Exception as e:
@@ -232,34 +297,58 @@ async def handle_group_reply(message: Message, bot: Bot, album: list[Message] =
 
 @router.edited_message(F.chat.type == "private")
 async def handle_edited_private_message(message: Message, bot: Bot):
-    admin_msg_id = get_admin_msg_id(message.from_user.id, message.message_id)
-    if not admin_msg_id:
-        logger.warning(f"[RELAY] Нет admin_msg_id для user_id={message.from_user.id}, msg_id={message.message_id}")
+    if relay_bursts:
+        await relay_bursts.flush(message.from_user.id)
+
+    user_id = message.from_user.id
+    parts = await get_admin_msg_ids(user_id, message.message_id)
+    if not parts:
+        logger.warning(f"[RELAY] Нет admin_msg_id для user_id={user_id}, msg_id={message.message_id}")
         try:
             await message.reply("⚠️ К сожалению, это сообщение слишком старое (или связь была очищена), и я не могу синхронизировать правки.")
         except:
             pass
         return
 
+    edited_html = f"(отредактировано)\n{message.html_text}"
     try:
-        if message.caption is not None and (message.photo or message.video or message.document):
-            await bot.edit_message_caption(
-                chat_id=ADMIN_GROUP_ID,
-                message_id=admin_msg_id,
-                caption=f"(отредактировано)\n{message.html_text}",
-                parse_mode="HTML"
-            )
+        if message.text and len(await get_forwarded_originals(parts[0])) > 1:
+            # Пост объединяет серию — правку одного сообщения показываем ответом на него,
+            # повторные правки обновляют этот ответ
+            targets, caption = parts[1:], False
+        elif message.caption is not None and (message.photo or message.video or message.document):
+            targets, caption = parts, True
         elif message.text:
-            await bot.edit_message_text(
+            targets, caption = parts, False
+        else:
+            logger.warning(f"[RELAY] Не удалось обновить сообщение от {user_id}: нет text/caption")
+            return
+
+        if targets:
+            # Части с прежним содержимым не трогаем — правка без изменений не стоит запросов
+            hashes = await get_content_hashes(ADMIN_GROUP_ID, targets)
+            result = await edit_parts(bot, ADMIN_GROUP_ID, targets, edited_html, caption=caption, hashes=hashes)
+            added, removed = result.added, result.removed
+            await save_content_hashes(ADMIN_GROUP_ID, dict(zip(result.message_ids, result.hashes)))
+        else:
+            notice = await bot.send_message(
                 chat_id=ADMIN_GROUP_ID,
-                message_id=admin_msg_id,
-                text=f"(отредактировано)\n{message.html_text}",
-                parse_mode="HTML"
+                text=edited_html,
+                parse_mode="HTML",
+                reply_to_message_id=parts[0]
             )
+            added, removed = [notice], []
+            await save_content_hashes(ADMIN_GROUP_ID, {notice.message_id: content_hash(edited_html)})
+
+        # Число частей могло измениться — связи должны указывать на актуальные сообщения
+        if added:
+            await save_mappings([(sent.message_id, user_id, message.message_id) for sent in added])
+        if removed:
+            await delete_mappings(removed)
+        if targets and not (result.edited or added or removed):
+            logger.info(f"[RELAY] Правка от {user_id} не меняет содержимого — пропущена")
         else:
-            logger.warning(f"[RELAY] Не удалось обновить сообщение от {message.from_user.id}: нет text/caption")
-            return
-        logger.info(f"[RELAY] Обновлено сообщение от {message.from_user.id}")
+            logger.info(f"[RELAY] Обновлено сообщение от {user_id}: частей={len(parts) + len(added) - len(removed)}")
     except Exception as e:
         logger.error(f"[RELAY] Ошибка при обновлении сообщения: {e}")
 
@@ -269,7 +358,7 @@ async def handle_admin_edit(message: Message, bot: Bot):
     if not message.reply_to_message or not message.reply_to_message.from_user or message.reply_to_message.from_user.id != bot.id:
         return
 
-    result = get_user_reply_msg(message.message_id)
+    result = await get_user_reply_msg(message.message_id)
     if not result:
         logger.warning(f"[RELAY] Не найдено соответствие для admin_msg_id={message.message_id}")
         await message.reply("⚠️ Не удалось найти пользователя для ответа. Возможно, сообщение слишком старое (более 14 дней).")
@@ -278,23 +367,29 @@ async def handle_admin_edit(message: Message, bot: Bot):
     user_id, user_msg_id = result
     try:
         if message.caption is not None and (message.photo or message.video or message.document):
-            await bot.edit_message_caption(
-                chat_id=user_id,
-                message_id=user_msg_id,
-                caption=f"(отредактировано)\n{message.html_text}",
-                parse_mode="HTML"
-            )
+            caption = True
         elif message.text:
-            await bot.edit_message_text(
-                chat_id=user_id,
-                message_id=user_msg_id,
-                text=f"(отредактировано)\n{message.html_text}",
-                parse_mode="HTML"
-            )
+            caption = False
         else:
             logger.warning(f"[RELAY] Не удалось обновить ответ для {user_id}: нет text/caption")
             return
+
+        # Ответ пользователю — одно сообщение: правим только если текст действительно изменился
+        edited_html = f"(отредактировано)\n{message.html_text}"
+        (previous,) = await get_content_hashes(user_id, [user_msg_id])
+        edited_hash = content_hash(edited_html)
+        if previous == edited_hash:
+            logger.info(f"[RELAY] Правка ответа для {user_id} не меняет содержимого — пропущена")
+            return
+        try:
+            if caption:
+                await bot.edit_message_caption(chat_id=user_id, message_id=user_msg_id, caption=edited_html, parse_mode="HTML")
+            else:
+                await bot.edit_message_text(chat_id=user_id, message_id=user_msg_id, text=edited_html, parse_mode="HTML")
+        except TelegramBadRequest as e:
+            if "not modified" not in str(e):
+                raise
+        await save_content_hashes(user_id, {user_msg_id: edited_hash})
         logger.info(f"[RELAY] Редактированный ответ обновлён для пользователя {user_id}")
     except Exception as e:
         logger.error(f"[RELAY] Ошибка редактирования ответа: {e}")
-
@@ -8,7 +8,8 @@ from aiogram.filters import Command
 from aiogram.types import Message
 
 from utils.config import MEDPHYSPRO_GROUP_ID
-from utils.thanks_db import increment_thanks, get_top_thanked
+from utils.async_db import increment_thanks, get_top_thanked
+from utils.thanks_db import PERIODS, PERIOD_ALL, PERIOD_MONTH, PERIOD_WEEK
 from utils.thanks_words import load_thanks_words
 from utils.logger import get_logger
 
@@ -19,6 +20,20 @@ logger.info("[THANKS] thanks.py загружен")
 THANKS_WORDS = load_thanks_words()
 EMOJI_TRIGGERS = {"🙏", "🤝", "❤️", "💐"}
 
+PERIOD_TITLES = {
+    PERIOD_WEEK: " за неделю",
+    PERIOD_MONTH: " за месяц",
+    PERIOD_ALL: "",
+}
+
+def parse_top_period(text: str | None) -> str | None:
+    """Аргумент /top10: week, month или all (по умолчанию). None — неизвестный период."""
+    parts = (text or "").split(maxsplit=1)
+    if len(parts) < 2:
+        return PERIOD_ALL
+    period = parts[1].strip().lower()
+    return period if period in PERIODS else None
+
 @router.message(F.chat.id == MEDPHYSPRO_GROUP_ID, F.reply_to_message)
 async def detect_thanks(message: Message):
     text = (message.text or "").lower()
@@ -34,7 +49,7 @@ async def detect_thanks(message: Message):
     if fuzzy_hits or emoji_hits:
         target_user = message.reply_to_message.from_user
         if target_user and not target_user.is_bot and target_user.id != message.from_user.id:
-            increment_thanks(target_user.id, target_user.full_name)
+            await increment_thanks(target_user.id, target_user.full_name)
             logger.info(
                 f"[THANKS] +1 для {target_user.full_name} ({target_user.id}) — "
                 f"слова: {fuzzy_hits}, эмодзи: {emoji_hits}"
@@ -44,16 +59,20 @@ async def detect_thanks(message: Message):
 async def show_top_thanked(message: Message):
     logger.info(f"[THANKS] Команда /top10 вызвана пользователем {message.from_user.full_name} ({message.from_user.id})")
 
-    top = get_top_thanked(limit=10)
-    if not top:
-        reply = await message.answer("Пока никто не получил благодарностей.")
-        logger.info("[THANKS] Список благодарностей пуст")
+    period = parse_top_period(message.text)
+    top = await get_top_thanked(limit=10, period=period) if period else []
+    if period is None:
+        reply = await message.answer("❗ Используйте: /top10 [week|month|all]")
+        logger.info(f"[THANKS] Неверный период /top10: {message.text}")
+    elif not top:
+        reply = await message.answer(f"Пока никто не получил благодарностей{PERIOD_TITLES[period]}.")
+        logger.info(f"[THANKS] Список благодарностей пуст (period={period})")
     else:
-        lines = [f"🏆 ТОП-10 по благодарностям:"]
+        lines = [f"🏆 ТОП-10 по благодарностям{PERIOD_TITLES[period]}:"]
         for i, (name, count) in enumerate(top, 1):
             lines.append(f"{i}. {name} — {count}")
         reply = await message.answer("\n".join(lines))
-        logger.info(f"[THANKS] Список ТОП-10 отправлен ({len(top)} записей)")
+        logger.info(f"[THANKS] Список ТОП-10 отправлен ({len(top)} записей, period={period})")
 
     # ⏳ Удаление команды через 3 секунды
     await asyncio.sleep(3)
@@ -1,6 +1,7 @@
 # medphysbot.py
 
 import asyncio
+import functools
 import logging
 
 from aiogram import Bot, Dispatcher
@@ -8,10 +9,14 @@ from aiogram.client.default import DefaultBotProperties
 from aiogram.client.session.aiohttp import AiohttpSession
 
 # Core utilities (loaded at module level — lightweight, no handler code)
-from utils.db import cleanup_old_mappings, init_db
+from utils import async_db
+from utils.db import init_db
+from utils.db_connection import close_connections
 from utils.logger import flush_telegram_loggers, init_all_loggers, start_telegram_loggers
-from utils.config import BOT_TOKEN, DEBUG_MODE
+from utils.config import BOT_TOKEN, DEBUG_MODE, MUTE_EXPIRY_NOTIFY
 from utils.telegram_connect import TELEGRAM_BACKOFF, run_with_network_retry, wait_for_bot_connection
+from middlewares.rate_limit import outbound_limiter
+from utils.retention import RetentionEngine
 from utils.ttl_storage import TTLMemoryStorage
 
 # ---------------------------------------------------------------------------
@@ -20,6 +25,7 @@ from utils.ttl_storage import TTLMemoryStorage
 # and can be inspected / cancelled explicitly before spawning a replacement.
 # ---------------------------------------------------------------------------
 _cleanup_task: asyncio.Task | None = None
+_mute_expiry_task: asyncio.Task | None = None
 
 
 async def main() -> None:
@@ -32,14 +38,9 @@ async def main() -> None:
     #    re-running expensive migrations on every network hiccup.
     try:
         init_db()
-        cleanup_old_mappings(days=14)
-
-        # news_monitor import is deferred to main() below, but cleanup_forwarded_news
-        # is needed here before polling starts — import it directly.
-        from handlers.news_monitor import cleanup_forwarded_news
-        cleanup_forwarded_news(days=7)
-
-        logger.info("[DB] Все старые связи успешно очищены при старте")
+        async_db.mute_scheduler.load()
+        async_db.load_lookup_keys()
+        logger.info("[DB] База данных готова")
     except Exception as e:
         logger.error(f"Ошибка при инициализации БД: {e}")
         return
@@ -55,6 +56,8 @@ async def main() -> None:
         #    previous one may be in a broken state.
         # ------------------------------------------------------------------
         session = AiohttpSession()
+        # All outgoing sends (handlers and the Telegram log handler) share one rate limiter
+        session.middleware(outbound_limiter)
         bot = Bot(
             token=BOT_TOKEN,
             session=session,
@@ -83,9 +86,15 @@ async def main() -> None:
             #    of the while-loop pay only a dict-lookup cost.
             from handlers import moderation, start, help, relay, news_monitor, status, thanks
             from middlewares.album import AlbumMiddleware
+            from middlewares.ordering import ordered_updates
 
             dp = Dispatcher(storage=storage)
             dp.message.middleware(AlbumMiddleware())
+            # Альбомы канала тоже собираются целиком: один пост → один send_media_group в PRO-группу
+            dp.channel_post.middleware(AlbumMiddleware())
+            dp.edited_channel_post.middleware(AlbumMiddleware())
+            # Разные чаты — параллельно, один чат — строго по порядку (после сборки альбомов)
+            ordered_updates.register(dp)
             dp.include_router(moderation.router)
             dp.include_router(start.router)
             dp.include_router(help.router)
@@ -94,25 +103,30 @@ async def main() -> None:
             dp.include_router(status.router)
             dp.include_router(thanks.router)
 
+            if MUTE_EXPIRY_NOTIFY:
+                # Бот пересоздаётся на каждой попытке — уведомления идут через живую сессию
+                async_db.mute_scheduler.notify = functools.partial(moderation.notify_mute_expired, bot)
+
             # 7. Background tasks — start only once per process.
             global _cleanup_task
             if _cleanup_task is None or _cleanup_task.done():
-                async def periodic_cleanup():
-                    while True:
-                        try:
-                            cleanup_old_mappings(days=14)
-                            news_monitor.cleanup_forwarded_news(days=7)
-                            logger.debug("[DB] Периодическая очистка всех старых связей успешно завершена")
-                        except Exception as exc:
-                            logger.error(f"[DB] Ошибка автоочисток: {exc}")
-                        await asyncio.sleep(86400)
+                # Incremental retention: small LIMIT-bounded DELETE batches on the
+                # DB writer thread; the first pass starts right away.
+                retention = RetentionEngine(async_db.run_in_writer, on_purged=async_db.on_retention_purged)
 
                 # Also kick off the TTL eviction loop (safe to call multiple times)
                 storage.start_eviction()
-                _cleanup_task = asyncio.create_task(periodic_cleanup(), name="periodic_db_cleanup")
+                _cleanup_task = asyncio.create_task(retention.run_forever(), name="periodic_db_cleanup")
             else:
                 logger.debug("[STARTUP] periodic_cleanup task already running — skip duplicate")
 
+            global _mute_expiry_task
+            if _mute_expiry_task is None or _mute_expiry_task.done():
+                # Muted users are unmuted exactly at muted_until by a min-heap timer
+                _mute_expiry_task = asyncio.create_task(
+                    async_db.mute_scheduler.run_forever(), name="mute_expiry"
+                )
+
             logger.info(f"Бот запущен в режиме DEBUG: {DEBUG_MODE}")
             logger.info("[STARTUP] Бот полностью готов к работе")
 
@@ -137,17 +151,25 @@ async def main() -> None:
             logger.error(f"Критический сбой polling: {e}. Рестарт через 10 сек...")
             await asyncio.sleep(10)
         finally:
+            # Pending coalesced relay bursts go out while the session is still open.
+            from handlers.relay import flush_relay_bursts
+            await flush_relay_bursts()
             # Always close the session; the next loop iteration creates a new one.
             await bot.session.close()
 
     # Graceful shutdown: cancel background tasks and close storage.
-    if _cleanup_task and not _cleanup_task.done():
-        _cleanup_task.cancel()
-        try:
-            await _cleanup_task
-        except asyncio.CancelledError:
-            pass
+    for task in (_cleanup_task, _mute_expiry_task):
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
     await storage.close()
+    # Write-behind buffer must be on disk before the writer thread stops
+    await async_db.flush_pending_writes()
+    async_db.shutdown_async_db()
+    close_connections()
 
 
 if __name__ == "__main__":
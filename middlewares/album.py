@@ -1,15 +1,118 @@
 # middlewares/album.py
+#
+# Сборка альбомов (media_group) в одно событие.
+# Telegram присылает элементы альбома отдельными апдейтами; обработчик вызывается
+# один раз — на первом элементе — со всем альбомом в data["album"].
+#
+# Состояние своё у каждой группы (chat_id, media_group_id), общей блокировки нет:
+# первый элемент ждёт события своей группы, остальные только дописываются в неё
+# и сразу возвращаются. Ожидание — debounce: таймер перезапускается на каждом
+# новом элементе, а на 10-м (максимум Telegram) альбом отправляется сразу.
+# Время ожидания подстраивается под наблюдаемые интервалы между элементами
+# (EWMA × запас), но не выходит за [min_wait, max_wait]; если элемент пришёл уже
+# после отправки своего альбома, ожидание возвращается к max_wait.
+# Число одновременно собираемых групп ограничено — при переполнении самая старая
+# отправляется досрочно.
+
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List
 
 from aiogram import BaseMiddleware
 from aiogram.types import Message
-from typing import Callable, Awaitable, Dict, Any, List
-import asyncio
+
+from utils.config import ALBUM_MAX_PENDING, ALBUM_MAX_WAIT_MS
+from utils.logger import get_logger
+
+logger = get_logger("album")
+
+# Максимум элементов в альбоме Telegram
+MAX_ALBUM_ITEMS = 10
+
+# Ожидание = средний интервал между элементами × GAP_FACTOR
+GAP_FACTOR = 3.0
+GAP_EWMA_ALPHA = 0.2
+
+
+class _PendingAlbum:
+    __slots__ = ("messages", "ready", "timer", "last_seen")
+
+    def __init__(self, first: Message, now: float) -> None:
+        self.messages: List[Message] = [first]
+        self.ready = asyncio.Event()
+        self.timer: asyncio.TimerHandle | None = None
+        self.last_seen = now
+
+    def arm(self, loop: asyncio.AbstractEventLoop, wait: float) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = loop.call_later(wait, self.ready.set)
+
+    def release(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.ready.set()
+
 
 class AlbumMiddleware(BaseMiddleware):
-    def __init__(self, wait_time: float = 0.3):
-        self.wait_time = wait_time
-        self.albums: Dict[str, List[Message]] = {}
-        self.lock = asyncio.Lock()
+    """
+    Args:
+        wait_time: Максимальная пауза после последнего элемента, секунды.
+        min_wait: Нижняя граница адаптивной паузы, секунды.
+        max_pending: Сколько альбомов может собираться одновременно.
+    """
+
+    def __init__(
+        self,
+        wait_time: float = ALBUM_MAX_WAIT_MS / 1000,
+        min_wait: float = 0.05,
+        max_pending: int = ALBUM_MAX_PENDING,
+    ):
+        self.max_wait = wait_time
+        self.min_wait = min(min_wait, wait_time)
+        self.max_pending = max_pending
+        self.albums: Dict[tuple[int, str], _PendingAlbum] = {}
+        # Недавно отправленные группы — чтобы заметить опоздавшие элементы
+        self._recent: OrderedDict[tuple[int, str], None] = OrderedDict()
+        self._gap: float | None = None
+
+        # Метрики
+        self.dispatched = 0
+        self.dispatched_full = 0
+        self.evicted = 0
+        self.late_items = 0
+
+    @property
+    def wait_time(self) -> float:
+        if self._gap is None:
+            return self.max_wait
+        return min(self.max_wait, max(self.min_wait, self._gap * GAP_FACTOR))
+
+    def _observe_gap(self, gap: float) -> None:
+        if self._gap is None:
+            self._gap = gap
+        else:
+            self._gap += GAP_EWMA_ALPHA * (gap - self._gap)
+
+    def _dispatch(self, key: tuple[int, str]) -> None:
+        album = self.albums.pop(key)
+        self._recent[key] = None
+        if len(self._recent) > self.max_pending:
+            self._recent.popitem(last=False)
+        album.release()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "pending": len(self.albums),
+            "dispatched": self.dispatched,
+            "dispatched_full": self.dispatched_full,
+            "evicted": self.evicted,
+            "late_items": self.late_items,
+            "wait_time": self.wait_time,
+        }
 
     async def __call__(
         self,
@@ -20,17 +123,42 @@ class AlbumMiddleware(BaseMiddleware):
         if not event.media_group_id:
             return await handler(event, data)
 
-        group_key = f"{event.chat.id}:{event.media_group_id}"
-        
-        async with self.lock:
-            album = self.albums.setdefault(group_key, [])
-            album.append(event)
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        key = (event.chat.id, event.media_group_id)
+
+        album = self.albums.get(key)
+        if album is not None:
+            self._observe_gap(now - album.last_seen)
+            album.last_seen = now
+            album.messages.append(event)
+            if len(album.messages) >= MAX_ALBUM_ITEMS:
+                self.dispatched_full += 1
+                self._dispatch(key)
+            else:
+                album.arm(loop, self.wait_time)
+            return None
+
+        if key in self._recent:
+            # Элемент опоздал: его альбом уже ушёл. Возвращаемся к осторожной паузе
+            self.late_items += 1
+            self._gap = None
+            logger.warning(f"[ALBUM] Элемент пришёл после отправки альбома: chat_id={event.chat.id}, media_group_id={event.media_group_id}")
+
+        if len(self.albums) >= self.max_pending:
+            self.evicted += 1
+            self._dispatch(next(iter(self.albums)))
+            logger.warning(f"[ALBUM] Слишком много незавершённых альбомов ({self.max_pending}), самый старый отправлен досрочно")
 
-        await asyncio.sleep(self.wait_time)
+        album = _PendingAlbum(event, now)
+        self.albums[key] = album
+        album.arm(loop, self.wait_time)
+        try:
+            await album.ready.wait()
+        finally:
+            if self.albums.get(key) is album:
+                self._dispatch(key)
 
-        async with self.lock:
-            if group_key in self.albums and self.albums[group_key][0] == event:
-                data["album"] = self.albums[group_key].copy()
-                del self.albums[group_key]
-                return await handler(event, data)
-        return None
+        self.dispatched += 1
+        data["album"] = sorted(album.messages, key=lambda m: m.message_id)
+        return await handler(event, data)
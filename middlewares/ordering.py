@@ -0,0 +1,179 @@
+# middlewares/ordering.py
+#
+# Порядок обработки апдейтов: разные чаты обрабатываются параллельно,
+# апдейты одного чата (или пользователя) — строго по очереди прихода.
+#
+# aiogram запускает каждый апдейт отдельной задачей (handle_as_tasks), поэтому без
+# упорядочивания два быстрых сообщения одного пользователя могут попасть в
+# админ-группу в обратном порядке, а без ограничения — все задачи конкурируют разом.
+#
+# Работает в две фазы:
+#   1. outer-middleware апдейта при приходе выдаёт апдейту "билет" в очереди его чата;
+#   2. inner-middleware обработчика ждёт, пока завершатся все более ранние билеты
+#      чата, и выполняет обработчик на одном из UPDATE_WORKERS слотов пула.
+# Билет закрывается, только когда закрыты все предыдущие, поэтому апдейты, которые
+# до обработчика не доходят (элементы альбома, кроме первого, неподходящие фильтры),
+# не пропускают вперёд следующие. Inner-фаза стоит после AlbumMiddleware: первый
+# элемент альбома держит место в очереди, пока собирается альбом, а остальные
+# элементы просто дописываются в него — взаимной блокировки нет.
+#
+# Очередь одного чата ограничена UPDATE_QUEUE_PER_CHAT: лишние апдейты флуда
+# отбрасываются с предупреждением. Задержки (приход → конец обработки) копятся в
+# скользящем окне, перцентили раз в минуту пишутся в лог и доступны через stats().
+
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import Dispatcher
+from aiogram.types import TelegramObject
+
+from utils.config import UPDATE_QUEUE_PER_CHAT, UPDATE_WORKERS
+from utils.logger import get_logger
+from utils.stats_window import StatsWindow
+
+logger = get_logger("updates")
+
+TICKET_KEY = "_order_ticket"
+
+# Сколько последних задержек хранить для перцентилей
+LATENCY_WINDOW = 1024
+
+Handler = Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]]
+
+
+class _Ticket:
+    __slots__ = ("prev", "done", "arrived")
+
+    def __init__(self, prev: _Ticket | None, arrived: float) -> None:
+        self.prev = prev
+        self.done = asyncio.Event()
+        self.arrived = arrived
+
+    async def wait_turn(self) -> None:
+        if self.prev is not None:
+            await self.prev.done.wait()
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class OrderedUpdates:
+    """
+    Args:
+        workers: Сколько обработчиков выполняется одновременно.
+        max_queue_per_chat: Сколько апдейтов одного чата может ждать своей очереди.
+    """
+
+    def __init__(self, workers: int = UPDATE_WORKERS, max_queue_per_chat: int = UPDATE_QUEUE_PER_CHAT) -> None:
+        self.workers = workers
+        self.max_queue_per_chat = max_queue_per_chat
+        self._pool: asyncio.Semaphore | None = None
+        self._tails: dict[int, _Ticket] = {}
+        self._queued: dict[int, int] = {}
+
+        # Метрики
+        self.processed = 0
+        self.dropped = 0
+        self.busy = 0
+        self._latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._window = StatsWindow()
+        self._window_processed = 0
+
+    def register(self, dp: Dispatcher) -> None:
+        """Подключает обе фазы к диспетчеру. Вызывать после регистрации AlbumMiddleware."""
+        dp.update.outer_middleware(self.reserve)
+        for observer in (dp.message, dp.edited_message, dp.channel_post, dp.edited_channel_post):
+            observer.middleware(self.run)
+
+    async def reserve(self, handler: Handler, event: TelegramObject, data: Dict[str, Any]) -> Any:
+        """Фаза 1: место в очереди чата в порядке прихода апдейтов."""
+        chat = data.get("event_chat")
+        user = data.get("event_from_user")
+        key = chat.id if chat else user.id if user else None
+        if key is None:
+            return await handler(event, data)
+
+        queued = self._queued.get(key, 0)
+        if queued >= self.max_queue_per_chat:
+            self.dropped += 1
+            logger.warning(f"[UPDATES] Очередь чата {key} переполнена ({queued}), апдейт отброшен")
+            return None
+
+        ticket = _Ticket(self._tails.get(key), asyncio.get_running_loop().time())
+        self._tails[key] = ticket
+        self._queued[key] = queued + 1
+        data[TICKET_KEY] = ticket
+        try:
+            return await handler(event, data)
+        finally:
+            try:
+                await ticket.wait_turn()
+            finally:
+                ticket.done.set()
+                ticket.prev = None
+                self._queued[key] -= 1
+                if not self._queued[key]:
+                    del self._queued[key]
+                if self._tails.get(key) is ticket:
+                    del self._tails[key]
+
+    async def run(self, handler: Handler, event: TelegramObject, data: Dict[str, Any]) -> Any:
+        """Фаза 2: дождаться своей очереди и выполнить обработчик в пуле."""
+        ticket: _Ticket | None = data.get(TICKET_KEY)
+        if ticket is None:
+            return await handler(event, data)
+
+        await ticket.wait_turn()
+        if self._pool is None:
+            self._pool = asyncio.Semaphore(self.workers)
+        async with self._pool:
+            self.busy += 1
+            try:
+                return await handler(event, data)
+            finally:
+                self.busy -= 1
+                self.processed += 1
+                self._window_processed += 1
+                self._latencies.append(asyncio.get_running_loop().time() - ticket.arrived)
+                self._maybe_log()
+
+    def latency_percentiles(self) -> dict[str, float]:
+        ordered = sorted(self._latencies)
+        return {
+            "p50": _percentile(ordered, 0.50),
+            "p95": _percentile(ordered, 0.95),
+            "p99": _percentile(ordered, 0.99),
+        }
+
+    def _maybe_log(self) -> None:
+        elapsed = self._window.elapsed()
+        if elapsed is None:
+            return
+        if self._window_processed:
+            p = self.latency_percentiles()
+            logger.info(
+                f"[UPDATES] За {elapsed:.0f} с обработано={self._window_processed}, "
+                f"задержка p50={p['p50'] * 1000:.0f} мс, p95={p['p95'] * 1000:.0f} мс, "
+                f"p99={p['p99'] * 1000:.0f} мс, чатов в очереди={len(self._queued)}, отброшено={self.dropped}"
+            )
+        self._window_processed = 0
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "busy": self.busy,
+            "queued_chats": len(self._queued),
+            "queued": sum(self._queued.values()),
+            **self.latency_percentiles(),
+        }
+
+
+# Один экземпляр на процесс: диспетчер пересоздаётся при рестарте polling, очереди чатов — нет
+ordered_updates = OrderedUpdates()
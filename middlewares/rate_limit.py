@@ -0,0 +1,300 @@
+# middlewares/rate_limit.py
+#
+# Исходящий ограничитель запросов к Bot API — middleware сессии aiogram.
+# Через него проходят все вызовы бота (sender, relay, moderation, TelegramLogHandler),
+# поэтому всплески не упираются в лимиты Telegram (~30 сообщений/с на бота,
+# ~20 сообщений/мин в группу, ~1 сообщение/с в личный чат) и не получают 429:
+# вызов ждёт свой слот вместо ошибки.
+#
+# Бакеты чатов работают по принципу резервирования: каждый вызов сразу забирает
+# токен (баланс может уйти в минус) и спит ровно до момента, когда этот токен
+# появится — вызовы в один чат идут по очереди FIFO.
+# Глобальные токены раздаются очередью с фиксированными приоритетами: ответы
+# пользователям в личку, затем админская и прочие группы, последним — лог-канал,
+# так что отправка логов не может задержать доставку пользователям.
+#
+# Альбом (SendMediaGroup) и пакетные CopyMessages/ForwardMessages создают по сообщению
+# на элемент и забирают столько же токенов.
+#
+# TelegramRetryAfter (429) не теряет сообщение: чат блокируется на retry_after
+# секунд, и вызов повторяется прозрачно для вызывающего кода.
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+from typing import Any
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from utils.config import (
+    LOG_CHANNEL_ID,
+    RATE_LIMIT_GLOBAL_PER_SEC,
+    RATE_LIMIT_GROUP_PER_MIN,
+    RATE_LIMIT_PRIVATE_PER_SEC,
+)
+from utils.logger import get_logger
+from utils.stats_window import StatsWindow
+
+logger = get_logger("rate_limit")
+
+# Методы, которые создают или меняют сообщения и поэтому считаются в лимитах Telegram
+LIMITED_METHOD_PREFIXES = ("Send", "Copy", "Forward", "Edit")
+
+# Сколько бакетов чатов держать, прежде чем выбрасывать простаивающие
+MAX_CHAT_BUCKETS = 1000
+
+# Сколько раз повторять вызов после TelegramRetryAfter, прежде чем отдать ошибку вызывающему
+MAX_RETRY_AFTER_ATTEMPTS = 5
+
+# Приоритеты глобальной очереди: меньше — раньше
+PRIORITY_USER = 0   # личные чаты: ответы пользователям через relay
+PRIORITY_ADMIN = 1  # админская группа и остальные группы/каналы
+PRIORITY_LOG = 2    # лог-канал (TelegramLogHandler)
+
+
+def message_cost(method: TelegramMethod) -> int:
+    """Сколько сообщений создаёт вызов: альбом и пакетное копирование — по одному на элемент."""
+    for field in ("media", "message_ids"):
+        items = getattr(method, field, None)
+        if isinstance(items, list):
+            return max(1, len(items))
+    return 1
+
+
+def chat_priority(chat_id: int | str) -> int:
+    if chat_id == LOG_CHANNEL_ID:
+        return PRIORITY_LOG
+    if isinstance(chat_id, int) and chat_id > 0:
+        return PRIORITY_USER
+    return PRIORITY_ADMIN
+
+
+class TokenBucket:
+    """Бакет на rate токенов в секунду с запасом capacity."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def reserve(self, now: float, tokens: int = 1) -> float:
+        """Забирает tokens токенов; возвращает, сколько секунд ждать, пока они станут доступны."""
+        self._refill(now)
+        self.tokens -= tokens
+        wait = max(0.0, self.updated - now)  # бакет заблокирован до updated (RetryAfter)
+        if self.tokens < 0:
+            wait += -self.tokens / self.rate
+        return wait
+
+    def time_until_token(self, now: float, tokens: int = 1) -> float:
+        self._refill(now)
+        return max(0.0, self.updated - now) + max(0.0, (tokens - self.tokens) / self.rate)
+
+    def take(self, now: float, tokens: int = 1) -> bool:
+        """Забирает tokens токенов, только если они доступны прямо сейчас."""
+        if self.time_until_token(now, tokens) > 0:
+            return False
+        self.tokens -= tokens
+        return True
+
+    def block(self, now: float, seconds: float) -> None:
+        """Новые токены не выдаются ближайшие seconds секунд."""
+        self._refill(now)
+        self.updated = max(self.updated, now + seconds)
+        self.tokens = min(self.tokens, 0)
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class OutboundRateLimiter(BaseRequestMiddleware):
+    """
+    Глобальный бакет на все исходящие сообщения плюс бакет на каждый чат.
+
+    Args:
+        global_per_sec: Лимит сообщений в секунду на весь бот.
+        group_per_min: Лимит сообщений в минуту в одну группу/канал.
+        private_per_sec: Лимит сообщений в секунду в один личный чат.
+    """
+
+    def __init__(
+        self,
+        global_per_sec: float = 30,
+        group_per_min: float = 20,
+        private_per_sec: float = 1,
+    ) -> None:
+        self.global_per_sec = global_per_sec
+        self.group_per_min = group_per_min
+        self.private_per_sec = private_per_sec
+
+        self._global: TokenBucket | None = None
+        self._chats: dict[int | str, TokenBucket] = {}
+
+        # Ожидающие глобальных токенов: (приоритет, порядковый номер, future, число токенов)
+        self._waiters: list[tuple[int, int, asyncio.Future, int]] = []
+        self._seq = itertools.count()
+        self._pump: asyncio.Task | None = None
+
+        # Метрики
+        self.queued = 0          # вызовов ждут слот прямо сейчас
+        self.max_queued = 0
+        self.calls = 0
+        self.delayed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.retries = 0
+        self._window = StatsWindow()
+        self._window_delayed = 0
+        self._window_wait = 0.0
+
+    def _chat_bucket(self, chat_id: int | str, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                self._chats = {cid: b for cid, b in self._chats.items() if not b.is_idle(now)}
+            if isinstance(chat_id, int) and chat_id > 0:
+                # Личный чат: без запаса, не чаще private_per_sec
+                bucket = TokenBucket(self.private_per_sec, 1, now)
+            else:
+                # Группа или канал (@username): небольшой запас, средний темп group_per_min
+                bucket = TokenBucket(self.group_per_min / 60, 3, now)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def acquire(self, chat_id: int | str, cost: int = 1) -> float:
+        """Ждёт слот для cost сообщений в chat_id. Возвращает время ожидания в секундах."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        if self._global is None:
+            self._global = TokenBucket(self.global_per_sec, self.global_per_sec, started)
+
+        self.calls += 1
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        # Больше запаса глобального бакета токенов не накопится никогда
+        global_cost = min(cost, int(self._global.capacity))
+        slept = False
+        try:
+            delay = self._chat_bucket(chat_id, started).reserve(started, cost)
+            if delay:
+                slept = True
+                await asyncio.sleep(delay)
+            if not self._take_global(loop, global_cost):
+                slept = True
+                await self._wait_global(loop, chat_priority(chat_id), global_cost)
+        finally:
+            self.queued -= 1
+
+        waited = loop.time() - started if slept else 0.0
+        if slept:
+            self.delayed += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            self._window_delayed += 1
+            self._window_wait += waited
+        self._maybe_log()
+        return waited
+
+    def _take_global(self, loop: asyncio.AbstractEventLoop, cost: int) -> bool:
+        # Без очереди токены берутся сразу; при очереди — только через неё, чтобы не обгонять приоритеты
+        return not self._waiters and self._global.take(loop.time(), cost)
+
+    async def _wait_global(self, loop: asyncio.AbstractEventLoop, priority: int, cost: int) -> None:
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future, cost))
+        if self._pump is None or self._pump.done() or self._pump.get_loop() is not loop:
+            self._pump = loop.create_task(self._run_pump(loop), name="outbound_rate_pump")
+        await future
+
+    async def _run_pump(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Выдаёт глобальные токены ожидающим по приоритету, в темпе глобального бакета."""
+        while self._waiters:
+            _, _, future, cost = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)  # вызывающий отменён
+                continue
+            wait = self._global.time_until_token(loop.time(), cost)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            heapq.heappop(self._waiters)
+            self._global.tokens -= cost
+            future.set_result(None)
+
+    def _maybe_log(self) -> None:
+        elapsed = self._window.elapsed()
+        if elapsed is None:
+            return
+        if self._window_delayed:
+            logger.info(
+                f"[RATE] За {elapsed:.0f} с задержано вызовов={self._window_delayed}, "
+                f"среднее ожидание={self._window_wait / self._window_delayed * 1000:.0f} мс, "
+                f"в очереди сейчас={self.queued}"
+            )
+        self._window_delayed = 0
+        self._window_wait = 0.0
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "calls": self.calls,
+            "delayed": self.delayed,
+            "avg_wait": self.total_wait / self.delayed if self.delayed else 0.0,
+            "max_wait": self.max_wait,
+            "retries": self.retries,
+            "waiting_by_priority": {
+                priority: sum(1 for p, _, f, _ in self._waiters if p == priority and not f.done())
+                for priority in (PRIORITY_USER, PRIORITY_ADMIN, PRIORITY_LOG)
+            },
+            "chat_buckets": len(self._chats),
+        }
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or not type(method).__name__.startswith(LIMITED_METHOD_PREFIXES):
+            return await make_request(bot, method)
+
+        for attempt in itertools.count(1):
+            await self.acquire(chat_id, message_cost(method))
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt >= MAX_RETRY_AFTER_ATTEMPTS:
+                    raise
+                self.retries += 1
+                # Блокируем чат целиком: остальные вызовы в него тоже подождут
+                now = asyncio.get_running_loop().time()
+                self._chat_bucket(chat_id, now).block(now, e.retry_after)
+                logger.warning(
+                    f"[RATE] RetryAfter {e.retry_after} с для chat_id={chat_id} "
+                    f"({type(method).__name__}), попытка {attempt}"
+                )
+
+
+# Один ограничитель на процесс: сессия бота пересоздаётся при рестарте polling, бакеты — нет
+outbound_limiter = OutboundRateLimiter(
+    global_per_sec=RATE_LIMIT_GLOBAL_PER_SEC,
+    group_per_min=RATE_LIMIT_GROUP_PER_MIN,
+    private_per_sec=RATE_LIMIT_PRIVATE_PER_SEC,
+)
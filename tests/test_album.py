@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+from unittest.mock import MagicMock
+from aiogram.types import Chat, Message
+
+from middlewares.album import AlbumMiddleware
+
+
+def _item(message_id: int, chat_id: int = 1, group: str | None = "g"):
+    message = MagicMock(spec=Message)
+    message.chat = Chat(id=chat_id, type="private")
+    message.message_id = message_id
+    message.media_group_id = group
+    return message
+
+
+def _recorder():
+    calls = []
+
+    async def handler(event, data):
+        calls.append((event.message_id, [m.message_id for m in data.get("album", [])]))
+        return "handled"
+
+    return calls, handler
+
+
+@pytest.mark.asyncio
+async def test_album_collected_after_debounce():
+    middleware = AlbumMiddleware(wait_time=0.05)
+    calls, handler = _recorder()
+
+    results = await asyncio.gather(*(middleware(handler, _item(i), {}) for i in (3, 1, 2)))
+
+    assert results == ["handled", None, None]
+    assert calls == [(3, [1, 2, 3])]
+    assert middleware.stats()["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_full_album_dispatched_without_waiting():
+    middleware = AlbumMiddleware(wait_time=10)
+    calls, handler = _recorder()
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    await asyncio.gather(*(middleware(handler, _item(i), {}) for i in range(10)))
+
+    assert loop.time() - started < 1
+    assert calls == [(0, list(range(10)))]
+    assert middleware.stats()["dispatched_full"] == 1
+
+
+@pytest.mark.asyncio
+async def test_albums_of_different_chats_do_not_block_each_other():
+    middleware = AlbumMiddleware(wait_time=0.05)
+    calls, handler = _recorder()
+
+    await asyncio.gather(
+        middleware(handler, _item(1, chat_id=1), {}),
+        middleware(handler, _item(1, chat_id=2), {}),
+        middleware(handler, _item(2, chat_id=1), {}),
+        middleware(handler, _item(5, group=None), {}),
+    )
+
+    assert sorted(calls) == [(1, [1]), (1, [1, 2]), (5, [])]
+
+
+@pytest.mark.asyncio
+async def test_wait_adapts_to_observed_gaps_and_pending_is_capped():
+    middleware = AlbumMiddleware(wait_time=0.3, min_wait=0.01, max_pending=2)
+    calls, handler = _recorder()
+
+    first = asyncio.create_task(middleware(handler, _item(1, group="a"), {}))
+    await asyncio.sleep(0)
+    await middleware(handler, _item(2, group="a"), {})  # интервал ~0
+    assert middleware.wait_time == pytest.approx(0.01)
+
+    second = asyncio.create_task(middleware(handler, _item(1, group="b"), {}))
+    await asyncio.sleep(0)
+    third = asyncio.create_task(middleware(handler, _item(1, group="c"), {}))
+    await asyncio.gather(first, second, third)
+
+    assert middleware.stats()["evicted"] == 1
+    assert len(calls) == 3
@@ -0,0 +1,612 @@
+import asyncio
+import random
+import threading
+import time
+
+import pytest
+
+from utils import async_db, db, news_db, thanks_db
+from utils.db_connection import get_connection, reset_connections
+from utils.leaderboard import Leaderboard
+from utils.moderation_cache import BANNED, MUTED
+from utils.mute_scheduler import MuteExpiryScheduler
+from utils.news_dedup import BloomFilter
+from utils.retention import RetentionEngine, RetentionPolicy
+from utils.write_behind import WriteBehindBuffer
+
+
+@pytest.fixture
+async def temp_db(tmp_path):
+    reset_connections(str(tmp_path / "test.db"))
+    db.init_db()
+    async_db.relay_cache.clear()
+    async_db.reply_cache.clear()
+    yield
+    await async_db.flush_pending_writes()
+    async_db.shutdown_async_db()
+    reset_connections()
+
+
+@pytest.mark.asyncio
+async def test_async_mapping_roundtrip(temp_db):
+    await async_db.save_mapping(1001, 42, 7)
+
+    assert await async_db.get_user_by_forwarded(1001) == 42
+    assert await async_db.get_admin_msg_id(42, 7) == 1001
+    assert await async_db.get_user_by_forwarded(9999) is None
+
+
+@pytest.mark.asyncio
+async def test_async_db_runs_off_event_loop(temp_db):
+    loop_thread = threading.current_thread().name
+
+    writer_thread = await async_db._db.write(lambda: threading.current_thread().name)
+    reader_thread = await async_db._db.read(lambda: threading.current_thread().name)
+
+    assert writer_thread != loop_thread
+    assert writer_thread.startswith("db-writer")
+    assert reader_thread.startswith("db-reader")
+
+
+@pytest.mark.asyncio
+async def test_async_moderation(temp_db):
+    await async_db.ban_user(5, banned_at=int(time.time()))
+    assert await async_db.is_banned(5)
+
+    await async_db.unban_user(5)
+    assert not await async_db.is_banned(5)
+
+
+@pytest.mark.asyncio
+async def test_write_behind_reads_own_pending_writes(temp_db):
+    await async_db.save_mapping(2001, 77, 3)
+    await async_db.save_reply_mapping(3001, 77, 4)
+
+    # Ещё не на диске, но чтения через async_db уже видят запись
+    assert db.get_user_by_forwarded(2001) is None
+    assert await async_db.get_user_by_forwarded(2001) == 77
+    assert await async_db.get_admin_msg_id(77, 3) == 2001
+    assert await async_db.get_user_reply_msg(3001) == (77, 4)
+
+    await async_db.flush_pending_writes()
+    assert db.get_user_by_forwarded(2001) == 77
+    assert db.get_user_reply_msg(3001) == (77, 4)
+
+
+@pytest.mark.asyncio
+async def test_write_behind_group_commit(temp_db):
+    calls = []
+
+    async def write(fn, batch):
+        calls.append(len(batch))
+        return fn(batch)
+
+    buffer = WriteBehindBuffer(write, interval_ms=10_000, max_rows=5)
+    for i in range(5):
+        buffer.save_mapping(100 + i, 1, i)
+    await asyncio.sleep(0)  # порог max_rows запускает сброс сразу
+
+    for _ in range(3):
+        buffer.increment_thanks(9, "Name")
+    await buffer.close()
+
+    assert calls == [5, 2]  # благодарность — строка thanks и строка дневного бакета
+    assert db.get_user_by_forwarded(104) == 1
+    assert thanks_db.get_top_thanked(1) == [("Name", 3)]
+
+
+@pytest.mark.asyncio
+async def test_write_behind_retries_failed_timer_flush(temp_db):
+    calls = []
+
+    async def write(fn, batch):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        return fn(batch)
+
+    buffer = WriteBehindBuffer(write, interval_ms=10, max_rows=50)
+    buffer.save_mapping(300, 1, 1)
+    # Без новых записей: повтор должен запуститься сам
+    await asyncio.sleep(0.2)
+
+    assert calls == [1, 1]
+    assert buffer.size == 0
+    assert db.get_user_by_forwarded(300) == 1
+    await buffer.close()
+
+
+@pytest.mark.asyncio
+async def test_top_thanked_sees_pending_increments(temp_db):
+    await async_db.increment_thanks(10, "Alice")
+    await async_db.increment_thanks(10, "Alice")
+
+    statements = []
+    get_connection().set_trace_callback(statements.append)
+    try:
+        assert await async_db.get_top_thanked(limit=1) == [("Alice", 2)]
+    finally:
+        get_connection().set_trace_callback(None)
+    # Чтение топа не сбрасывает буфер: запись остаётся за таймером
+    assert statements == []
+    assert async_db._pending.has_pending_thanks()
+
+
+@pytest.mark.asyncio
+async def test_top_thanked_merges_pending_outside_full_board(temp_db):
+    with get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO thanks (user_id, name, count) VALUES (?, ?, ?)",
+            [(uid, f"user{uid}", 10 + uid) for uid in range(1, 12)] + [(50, "late", 9)],
+        )
+        thanks_db.increment_rollups(conn, [(int(time.time()), 50, 9)])
+    thanks_db.load_leaderboard()
+
+    # user50 вне полного топа: его записанный счётчик читается из базы, буфер не сбрасывается
+    for _ in range(20):
+        await async_db.increment_thanks(50, "late")
+    await async_db.increment_thanks(11, "user11")
+
+    assert await async_db.get_top_thanked(limit=2) == [("late", 29), ("user11", 22)]
+    assert await async_db.get_top_thanked(limit=12) == [
+        ("late", 29), ("user11", 22), *[(f"user{uid}", 10 + uid) for uid in range(10, 0, -1)],
+    ]
+    assert await async_db.get_top_thanked(limit=2, period=thanks_db.PERIOD_WEEK) == [("late", 29), ("user11", 1)]
+    assert async_db._pending.has_pending_thanks()
+
+    await async_db.flush_pending_writes()
+    assert await async_db.get_top_thanked(limit=2) == [("late", 29), ("user11", 22)]
+
+
+def test_moderation_cache_updated_in_place(temp_db):
+    assert db.get_restriction(1) is None
+
+    until = int(time.time()) + 3600
+    db.mute_user(1, until)
+    assert db.get_restriction(1) == MUTED
+    assert db.get_user_status(1) == {"banned": False, "banned_at": None, "muted": True, "muted_until": until}
+
+    db.ban_user(1, int(time.time()))
+    assert db.get_restriction(1) == BANNED
+
+    db.unban_user(1)
+    db.unmute_user(1)
+    assert db.get_restriction(1) is None
+    assert not db.moderation_cache.size
+
+
+def test_moderation_cache_loaded_from_table(temp_db):
+    db.mute_user(2, int(time.time()) + 3600)
+    db.moderation_cache.load([])  # имитация нового процесса
+    assert db.get_restriction(2) is None
+
+    db.load_moderation_cache()
+    assert db.get_restriction(2) == MUTED
+
+
+def test_expired_mute_is_not_a_restriction(temp_db):
+    db.mute_user(3, int(time.time()) - 60)
+    assert db.get_restriction(3) is None
+    assert not db.get_user_status(3)["muted"]
+
+    assert not db.is_muted(3)
+    # Проверка ничего не пишет — мут снимает планировщик истечения
+    assert db.get_user_status(3)["muted_until"] is not None
+
+
+@pytest.mark.asyncio
+async def test_mute_scheduler_expires_due_mutes_in_batches(temp_db):
+    now = int(time.time())
+    for user_id in range(1, 6):
+        db.mute_user(user_id, now - user_id)
+    db.mute_user(6, now + 3600)
+    db.mute_user(1, now + 3600)  # продлён: старый срок в куче устарел
+
+    calls = []
+
+    async def run(fn, *args):
+        calls.append(len(args[0]))
+        return fn(*args)
+
+    notified = []
+
+    async def notify(user_id):
+        notified.append(user_id)
+
+    scheduler = MuteExpiryScheduler(db.moderation_cache, run, db.expire_mutes, batch_size=2)
+    scheduler.load()
+    scheduler.schedule(1, now - 1)  # устаревший элемент
+    scheduler.notify = notify
+
+    assert sorted(await scheduler.run_once(now)) == [2, 3, 4, 5]
+    assert calls == [2, 2]
+    assert sorted(notified) == [2, 3, 4, 5]
+    assert scheduler.next_deadline() == now + 3600
+
+    rows = dict(get_connection().execute("SELECT user_id, muted_until FROM moderation").fetchall())
+    assert rows == {1: now + 3600, 2: None, 3: None, 4: None, 5: None, 6: now + 3600}
+    assert db.get_restriction(1) == MUTED
+
+
+@pytest.mark.asyncio
+async def test_mute_scheduler_wakes_on_earlier_deadline(temp_db):
+    async def run(fn, *args):
+        return fn(*args)
+
+    scheduler = MuteExpiryScheduler(db.moderation_cache, run, db.expire_mutes)
+    scheduler.load()
+    task = asyncio.create_task(scheduler.run_forever())
+    await asyncio.sleep(0)
+
+    until = int(time.time()) + 1
+    db.mute_user(7, until)
+    scheduler.schedule(7, until)
+    assert db.get_restriction(7) == MUTED
+
+    for _ in range(40):
+        if db.get_user_status(7)["muted_until"] is None:
+            break
+        await asyncio.sleep(0.05)
+    task.cancel()
+
+    assert db.get_user_status(7)["muted_until"] is None
+    assert scheduler.size == 0
+
+
+@pytest.mark.parametrize("sql, params", [
+    # get_admin_msg_id
+    ("SELECT forwarded_id FROM relay_map WHERE original_user_id = ? AND original_message_id = ? ORDER BY forwarded_id DESC LIMIT 1", (1, 2)),
+    # get_user_by_forwarded
+    ("SELECT original_user_id FROM relay_map WHERE forwarded_id = ? LIMIT 1", (1,)),
+    # get_admin_msg_ids
+    ("SELECT forwarded_id FROM relay_map WHERE original_user_id = ? AND original_message_id = ? ORDER BY forwarded_id", (1, 2)),
+    # get_group_msg_ids
+    ("SELECT group_msg_id FROM news_parts WHERE message_id = ? ORDER BY group_msg_id", (1,)),
+    ("SELECT message_id, group_msg_id FROM news_parts WHERE forwarded_at < ? ORDER BY forwarded_at LIMIT ?", (1_700_000_000, 500)),
+    # get_content_hashes
+    ("SELECT message_id, content_hash FROM content_hashes WHERE chat_id = ? AND message_id IN (?, ?)", (1, 2, 3)),
+    ("SELECT chat_id, message_id FROM content_hashes WHERE timestamp < ? ORDER BY timestamp LIMIT ?", (1_700_000_000, 500)),
+    # get_forwarded_originals
+    ("SELECT original_message_id FROM relay_map WHERE forwarded_id = ?", (1,)),
+    # get_user_reply_msg
+    ("SELECT user_id, user_msg_id FROM reply_map WHERE admin_msg_id = ?", (1,)),
+    # is_hash_already_forwarded
+    ("SELECT 1 FROM forwarded_news WHERE content_hash = ?", ("abc",)),
+    # get_group_msg_id
+    ("SELECT group_msg_id FROM forwarded_news WHERE message_id = ?", (1,)),
+    # load_leaderboard
+    ("SELECT user_id, name, count FROM thanks ORDER BY count DESC, user_id LIMIT ?", (10,)),
+    # get_top_thanked_for_period
+    ("SELECT r.user_id, r.count FROM thanks_weekly r WHERE r.bucket = ? ORDER BY r.count DESC, r.user_id LIMIT ?", (0, 10)),
+    # get_top_snapshot: счётчики отложенных пользователей
+    ("SELECT r.user_id, r.count FROM thanks_weekly r WHERE r.bucket = ? AND r.user_id IN (?, ?)", (0, 1, 2)),
+    # utils/retention.py: выбор пачки устаревших строк
+    ("SELECT forwarded_id, original_message_id FROM relay_map WHERE timestamp < ? ORDER BY timestamp LIMIT ?", (1_700_000_000, 500)),
+    ("SELECT admin_msg_id FROM reply_map WHERE timestamp < ? ORDER BY timestamp LIMIT ?", (1_700_000_000, 500)),
+    ("SELECT message_id FROM forwarded_news WHERE forwarded_at < ? ORDER BY forwarded_at LIMIT ?", (1_700_000_000, 500)),
+    ("SELECT bucket, user_id FROM thanks_daily WHERE bucket < ? ORDER BY bucket LIMIT ?", (1_700_000_000, 500)),
+])
+def test_hot_queries_use_index(temp_db, sql, params):
+    plan = get_connection().execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    details = " | ".join(row[-1] for row in plan)
+
+    # Допустим только упорядоченный обход индекса (ORDER BY ... LIMIT), не полный скан таблицы
+    assert all("USING" in row[-1] for row in plan if row[-1].startswith("SCAN")), details
+    assert "TEMP B-TREE" not in details, details
+    assert "USING" in details, details
+
+
+@pytest.mark.asyncio
+async def test_retention_deletes_in_bounded_batches(temp_db):
+    now = int(time.time())
+    with get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO relay_map (forwarded_id, original_user_id, original_message_id, timestamp) VALUES (?, 1, ?, ?)",
+            [(i, i, now - 30 * 86400 if i < 25 else now) for i in range(30)],
+        )
+
+    batches = []
+
+    async def run(fn, *args):
+        deleted = fn(*args)
+        batches.append(deleted)
+        return deleted
+
+    policy = RetentionPolicy("relay_map", "forwarded_id", "timestamp", days=14)
+    engine = RetentionEngine(run, policies=[policy], batch_size=10, batch_pause=0)
+
+    purged = []
+    engine.on_purged = lambda table, cutoff: purged.append(table)
+
+    assert await engine.run_once() == {"relay_map": 25}
+    assert batches == [10, 10, 5]
+    assert purged == ["relay_map"]
+    assert get_connection().execute("SELECT COUNT(*) FROM relay_map").fetchone() == (5,)
+
+
+def test_leaderboard_matches_full_sort():
+    rng = random.Random(1)
+    counts: dict[int, int] = {}
+    board = Leaderboard(k=5)
+
+    for _ in range(2000):
+        user_id = rng.randrange(50)
+        counts[user_id] = counts.get(user_id, 0) + rng.randint(1, 3)
+        board.update(user_id, f"u{user_id}", counts[user_id])
+
+    expected = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:5]
+    assert board.top() == [(f"u{uid}", count) for uid, count in expected]
+
+
+@pytest.mark.asyncio
+async def test_top_thanked_served_from_memory(temp_db):
+    for user_id, times in ((1, 3), (2, 5), (3, 1)):
+        for _ in range(times):
+            await async_db.increment_thanks(user_id, f"user{user_id}")
+    await async_db.flush_pending_writes()
+
+    statements = []
+    get_connection().set_trace_callback(statements.append)
+    try:
+        assert await async_db.get_top_thanked(limit=2) == [("user2", 5), ("user1", 3)]
+    finally:
+        get_connection().set_trace_callback(None)
+    assert statements == []
+
+    # После рестарта топ восстанавливается из таблицы
+    thanks_db.leaderboard.load([])
+    thanks_db.load_leaderboard()
+    assert thanks_db.get_top_thanked() == [("user2", 5), ("user1", 3), ("user3", 1)]
+
+
+def test_rollup_buckets():
+    # 2024-05-15 13:45 UTC — среда
+    ts = 1715780700
+    assert thanks_db.rollup_buckets(ts) == {
+        "day": 1715731200,    # 2024-05-15 00:00
+        "week": 1715558400,   # понедельник 2024-05-13 00:00
+        "month": 1714521600,  # 2024-05-01 00:00
+    }
+
+
+@pytest.mark.asyncio
+async def test_top_thanked_by_period(temp_db):
+    now = int(time.time())
+    old = now - 60 * 86400
+    with get_connection() as conn:
+        # Благодарности двухмесячной давности — только в счётчике за всё время
+        conn.execute("INSERT INTO thanks (user_id, name, count) VALUES (1, 'old', 10)")
+        thanks_db.increment_rollups(conn, [(old, 1, 10)])
+    thanks_db.load_leaderboard()
+
+    for _ in range(2):
+        await async_db.increment_thanks(2, "fresh")
+    await async_db.increment_thanks(1, "old")
+
+    assert await async_db.get_top_thanked(period=thanks_db.PERIOD_WEEK) == [("fresh", 2), ("old", 1)]
+    assert await async_db.get_top_thanked(period=thanks_db.PERIOD_MONTH) == [("fresh", 2), ("old", 1)]
+    assert await async_db.get_top_thanked(period=thanks_db.PERIOD_ALL) == [("old", 11), ("fresh", 2)]
+
+    await async_db.flush_pending_writes()
+    daily = get_connection().execute("SELECT SUM(count) FROM thanks_daily WHERE bucket >= ?", (now - 86400,)).fetchone()
+    assert daily == (3,)
+
+
+@pytest.mark.asyncio
+async def test_one_admin_post_maps_several_user_messages(temp_db):
+    for original_id in (5, 6, 7):
+        await async_db.save_mapping(500, 42, original_id)
+
+    assert await async_db.get_forwarded_originals(500) == {5, 6, 7}
+    await async_db.flush_pending_writes()
+    assert db.get_forwarded_originals(500) == {5, 6, 7}
+    assert db.get_user_by_forwarded(500) == 42
+    assert db.get_admin_msg_id(42, 6) == 500
+
+    # Более поздняя связь того же сообщения (уведомление о правке) побеждает
+    await async_db.save_mapping(501, 42, 6)
+    await async_db.flush_pending_writes()
+    assert db.get_admin_msg_id(42, 6) == 501
+
+
+@pytest.mark.asyncio
+async def test_all_parts_mapped_and_removable(temp_db):
+    await async_db.save_mappings([(700, 42, 9), (701, 42, 9), (702, 42, 9)])
+    assert await async_db.get_admin_msg_ids(42, 9) == [700, 701, 702]
+    await async_db.flush_pending_writes()
+    assert db.get_admin_msg_ids(42, 9) == [700, 701, 702]
+    assert db.get_user_by_forwarded(702) == 42
+
+    await async_db.save_mappings([(703, 42, 9)])
+    await async_db.delete_mappings([702, 703])
+    await async_db.flush_pending_writes()
+    assert await async_db.get_admin_msg_ids(42, 9) == [700, 701]
+
+    await async_db.save_forwarded_news(5, "h", group_msg_id=800)
+    assert await async_db.get_group_msg_ids(5) == [800]
+    await async_db.save_news_parts(5, [800, 801])
+    await async_db.flush_pending_writes()
+    assert await async_db.get_group_msg_ids(5) == [800, 801]
+    await async_db.delete_news_parts(5, [801])
+    assert await async_db.get_group_msg_ids(5) == [800]
+
+
+@pytest.mark.asyncio
+async def test_content_hashes_roundtrip(temp_db):
+    await async_db.save_content_hashes(-100, {10: "a", 11: "b"})
+    assert await async_db.get_content_hashes(-100, [11, 10, 12]) == ["b", "a", None]
+    await async_db.flush_pending_writes()
+    assert db.get_content_hashes(-100, [10, 11]) == {10: "a", 11: "b"}
+
+    # Ключ — (чат, сообщение): одинаковые id в другом чате не пересекаются
+    await async_db.save_content_hashes(-200, {10: "c"})
+    assert await async_db.get_content_hashes(-100, [10]) == ["a"]
+    assert await async_db.get_content_hashes(-200, [10]) == ["c"]
+
+
+@pytest.mark.asyncio
+async def test_lookup_cache_write_through_and_negative_filter(temp_db, monkeypatch):
+    reads = []
+
+    async def read_reply(admin_msg_id):
+        reads.append(admin_msg_id)
+        return db.get_user_reply_msg(admin_msg_id)
+
+    monkeypatch.setattr(async_db, "_get_user_reply_msg_db", read_reply)
+    before = async_db.reply_cache.stats()
+
+    # Только что сохранённая связь отдаётся из кэша
+    await async_db.save_reply_mapping(500, 42, 7)
+    assert await async_db.get_user_reply_msg(500) == (42, 7)
+
+    # Правка сообщения без связи идёт в базу один раз, дальше — отрицательный фильтр
+    assert await async_db.get_user_reply_msg(501) is None
+    assert await async_db.get_user_reply_msg(501) is None
+    assert reads == [501]
+
+    # Сохранение снимает ключ с фильтра
+    await async_db.save_reply_mapping(501, 43, 8)
+    assert await async_db.get_user_reply_msg(501) == (43, 8)
+    assert reads == [501]
+    stats = async_db.reply_cache.stats()
+    assert stats["hits"] - before["hits"] == 2
+    assert stats["negative_hits"] - before["negative_hits"] == 1
+    assert stats["misses"] - before["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_reply_keys_answer_absent_lookups_without_sqlite(temp_db, monkeypatch):
+    now = int(time.time())
+    with get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO reply_map (admin_msg_id, user_id, user_msg_id, timestamp) VALUES (?, 42, 7, ?)",
+            [(600, now), (601, now - 30 * 86400)],
+        )
+    async_db.load_lookup_keys()
+
+    reads = []
+
+    async def read_reply(admin_msg_id):
+        reads.append(admin_msg_id)
+        return db.get_user_reply_msg(admin_msg_id)
+
+    monkeypatch.setattr(async_db, "_get_user_reply_msg_db", read_reply)
+
+    # Ключа нет в reply_map — ответ без единого чтения, даже в первый раз
+    assert await async_db.get_user_reply_msg(700) is None
+    assert await async_db.get_user_reply_msg(600) == (42, 7)
+    assert reads == [600]
+
+    await async_db.save_reply_mappings([(701, 43, 8)])
+    assert await async_db.get_user_reply_msg(701) == (43, 8)
+
+    # Очистка убирает ключ и из набора: удалённая связь снова отвечается из памяти
+    engine = RetentionEngine(async_db.run_in_writer, batch_size=10, batch_pause=0,
+                             on_purged=async_db.on_retention_purged)
+    await engine.purge(RetentionPolicy("reply_map", "admin_msg_id", "timestamp", days=14))
+    assert await async_db.get_user_reply_msg(601) is None
+    assert reads == [600]
+    assert async_db.reply_cache.stats()["keys"] == 2
+
+
+@pytest.mark.asyncio
+async def test_lookup_cache_invalidated_by_retention_and_deletes(temp_db):
+    now = int(time.time())
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT INTO relay_map (forwarded_id, original_user_id, original_message_id, timestamp) VALUES (900, 42, 1, ?)",
+            (now - 30 * 86400,),
+        )
+    assert await async_db.get_user_by_forwarded(900) == 42  # прочитано из базы и закэшировано
+    await async_db.save_mapping(901, 43, 2)
+
+    engine = RetentionEngine(async_db.run_in_writer, batch_size=10, batch_pause=0,
+                             on_purged=async_db.on_retention_purged)
+    await engine.purge(RetentionPolicy("relay_map", "forwarded_id, original_message_id", "timestamp", days=14))
+    assert await async_db.get_user_by_forwarded(900) is None
+    assert await async_db.get_user_by_forwarded(901) == 43
+
+    await async_db.delete_mappings([901])
+    assert await async_db.get_user_by_forwarded(901) is None
+
+
+@pytest.mark.asyncio
+async def test_lookup_cache_ignores_result_of_read_raced_by_save(temp_db, monkeypatch):
+    async def slow_read(forwarded_id):
+        # Пока идёт чтение, связь сохраняется — устаревшее "нет связи" не должно попасть в кэш
+        await async_db.save_mapping(forwarded_id, 44, 3)
+        return None
+
+    monkeypatch.setattr(async_db, "_get_user_by_forwarded_db", slow_read)
+    monkeypatch.setattr(async_db._pending, "get_user_by_forwarded", lambda forwarded_id: None)
+    async_db.relay_cache.discard([950])
+    assert await async_db.get_user_by_forwarded(950) is None
+    assert await async_db.get_user_by_forwarded(950) == 44
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, error_rate=0.01)
+    items = [f"hash-{i}" for i in range(1000)]
+    for item in items:
+        bloom.add(item)
+
+    assert all(item in bloom for item in items)
+    false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+    assert false_positives < 300
+
+
+@pytest.mark.asyncio
+async def test_news_dedup_answers_new_posts_without_db(temp_db, monkeypatch):
+    now = int(time.time())
+    with get_connection() as conn:
+        conn.execute("INSERT INTO forwarded_news (message_id, content_hash, forwarded_at) VALUES (1, 'old', ?)",
+                     (now - 30 * 86400,))
+        conn.execute("INSERT INTO forwarded_news (message_id, content_hash, forwarded_at) VALUES (2, 'fresh', ?)", (now,))
+    db.init_db()  # индекс загружается при старте
+
+    async def no_db(content_hash):
+        raise AssertionError("новый пост не должен проверяться в базе")
+
+    monkeypatch.setattr(async_db, "_is_hash_already_forwarded_db", no_db)
+    assert await async_db.is_hash_already_forwarded("fresh")
+    assert not await async_db.is_hash_already_forwarded("brand-new")
+
+    await async_db.save_forwarded_news(3, "brand-new", group_msg_id=300)
+    assert await async_db.is_hash_already_forwarded("brand-new")
+
+    # Очистка удаляет старый хеш из базы и из индекса, фильтр пересобирается
+    monkeypatch.undo()
+    engine = RetentionEngine(async_db.run_in_writer, batch_size=10, batch_pause=0,
+                             on_purged=async_db.on_retention_purged)
+    await engine.purge(RetentionPolicy("forwarded_news", "message_id", "forwarded_at", days=7))
+    await asyncio.gather(*async_db._background)
+    assert not await async_db.is_hash_already_forwarded("old")
+    assert await async_db.is_hash_already_forwarded("brand-new")
+    assert news_db.dedup_index.stats()["bloom_items"] >= 2
+
+
+def test_explicit_zero_disables_mmap(tmp_path, monkeypatch):
+    from utils.config import resolve_int_env
+    from utils.db_connection import ConnectionManager
+
+    monkeypatch.setenv("TEST_MMAP_MIB", "0")
+    assert resolve_int_env("TEST_MMAP_MIB", min_value=0, default=64, zero_disables=True) == 0
+    assert resolve_int_env("TEST_MMAP_MIB", min_value=0, default=64) == 64
+    monkeypatch.delenv("TEST_MMAP_MIB")
+    assert resolve_int_env("TEST_MMAP_MIB", min_value=0, default=64, zero_disables=True) == 64
+
+    manager = ConnectionManager(str(tmp_path / "mmap.db"), mmap_size_mib=0)
+    try:
+        assert manager.get().execute("PRAGMA mmap_size").fetchone() == (0,)
+    finally:
+        manager.close_all()
+
+
+def test_lookup_cache_size_zero_disables_cache():
+    from utils.lookup_cache import MISS, LookupCache
+
+    cache = LookupCache("relay_map", 0)
+    cache.put(1, 42)
+    cache.store_loaded(2, None, cache.version)
+    assert cache.get(1) is MISS and cache.get(2) is MISS
+    assert cache.stats()["size"] == 0 and cache.stats()["negative_size"] == 0
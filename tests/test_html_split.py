@@ -0,0 +1,73 @@
+import html
+import re
+
+import pytest
+
+from utils.html_split import rendered_utf16_len, split_html, tokenize
+from utils.sender import utf16_len
+
+# Корпус длинных отформатированных постов канала в том виде, в каком их отдаёт message.html_text
+_PARAGRAPH = (
+    "<b>Новости медицинской физики</b> 📡\n"
+    "Вышел обновлённый протокол <a href=\"https://example.com/tg?x=1&amp;y=2\">МАГАТЭ TRS-398</a> "
+    "по дозиметрии пучков &amp; калибровке ионизационных камер. "
+    "<i>Ключевые изменения</i>: поправки <code>k_Q</code> &lt;1% и новые <u>таблицы</u> 👍🏽.\n\n"
+)
+
+CORPUS = {
+    "абзацы со ссылками": _PARAGRAPH * 60,
+    "ссылка через границу": "Вступление. " + "<a href=\"https://example.com/long\">" + "очень длинная ссылка " * 400 + "</a> конец.",
+    "вложенные теги": "<b>жирный <i>курсив <u>подчёркнутый " + "текст 📨 " * 900 + "</u></i></b>",
+    "код без пробелов": "<pre><code class=\"language-python\">" + "x=1;" * 3000 + "</code></pre>",
+    "спойлер и цитата": (
+        "<blockquote>Цитата " + "слово " * 500 + "</blockquote>\n"
+        "<span class=\"tg-spoiler\">" + "секрет &#128512; " * 600 + "</span>"
+    ),
+    "мнемоники подряд": "&lt;&gt;&amp;&quot;" * 3000,
+}
+
+
+def _check_balanced(chunk: str) -> None:
+    stack = []
+    for tag in re.findall(r"<[^<>]*>", chunk):
+        name = re.match(r"</?\s*([A-Za-z][\w-]*)", tag).group(1).lower()
+        if tag.startswith("</"):
+            assert stack and stack[-1] == name, chunk[:200]
+            stack.pop()
+        else:
+            stack.append(name)
+    assert not stack, chunk[-200:]
+
+
+def _rendered(markup: str) -> str:
+    return tokenize(markup)[1]
+
+
+@pytest.mark.parametrize("name", CORPUS)
+@pytest.mark.parametrize("limit", [4096, 1024])
+def test_split_html_corpus(name, limit):
+    markup = CORPUS[name]
+    chunks = split_html(markup, limit)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        _check_balanced(chunk)
+        assert rendered_utf16_len(chunk) <= limit
+        # Разрез не попадает внутрь мнемоники: все "&" в разметке — начало целой мнемоники
+        assert not re.search(r"&(?!#?[0-9A-Za-z]+;)", chunk)
+    assert "".join(_rendered(chunk) for chunk in chunks) == _rendered(markup)
+
+
+def test_split_html_reopens_tags_with_attributes():
+    markup = "<a href=\"https://example.com\">" + "ссылка " * 1000 + "</a>"
+    chunks = split_html(markup, 4096)
+
+    assert len(chunks) == 2
+    assert chunks[0].endswith("</a>")
+    assert chunks[1].startswith("<a href=\"https://example.com\">")
+
+
+def test_rendered_length_ignores_markup():
+    markup = "<b>abc</b> &amp; <a href=\"https://example.com/very/long/url\">📨</a>"
+    assert rendered_utf16_len(markup) == utf16_len(html.unescape(re.sub(r"<[^>]+>", "", markup)))
+    assert split_html(markup, 4096) == [markup]
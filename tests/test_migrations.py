@@ -0,0 +1,102 @@
+import sqlite3
+
+from utils.migrations import MIGRATIONS, SCHEMA_VERSION, get_schema_version, migrate
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _indexes(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+
+def test_fresh_database_reaches_latest_version():
+    conn = sqlite3.connect(":memory:")
+
+    assert migrate(conn) == SCHEMA_VERSION
+    assert get_schema_version(conn) == SCHEMA_VERSION
+    assert "group_msg_id" in _columns(conn, "forwarded_news")
+    assert "idx_forwarded_news_hash" in _indexes(conn)
+
+
+def test_legacy_database_is_upgraded_in_place():
+    conn = sqlite3.connect(":memory:")
+    # Схема старого init_db(): forwarded_news без group_msg_id, user_version = 0
+    conn.execute("""
+        CREATE TABLE forwarded_news (
+            message_id INTEGER PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            forwarded_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("INSERT INTO forwarded_news (message_id, content_hash) VALUES (1, 'abc')")
+    conn.commit()
+
+    migrate(conn)
+
+    assert "group_msg_id" in _columns(conn, "forwarded_news")
+    assert conn.execute("SELECT content_hash FROM forwarded_news").fetchall() == [("abc",)]
+    assert {"relay_map", "reply_map", "users", "moderation", "thanks"} <= {
+        row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    }
+
+
+def test_up_to_date_database_costs_single_pragma_read():
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+
+    statements = []
+    conn.set_trace_callback(statements.append)
+    migrate(conn)
+
+    assert statements == ["PRAGMA user_version"]
+
+
+def test_text_timestamps_converted_to_epoch():
+    conn = sqlite3.connect(":memory:")
+    # Схема до перевода дат в INTEGER (версия 3)
+    for _, apply in MIGRATIONS[:3]:
+        apply(conn)
+    conn.execute("PRAGMA user_version = 3")
+
+    conn.execute("INSERT INTO relay_map VALUES (1, 10, 100, '2025-01-01 00:00:00')")
+    conn.execute("INSERT INTO forwarded_news VALUES (5, 'abc', 50, '2025-01-02 00:00:00')")
+    conn.execute("INSERT INTO moderation VALUES (10, 1, '2025-01-01T03:00:00+03:00', 'garbage')")
+    conn.commit()
+
+    migrate(conn)
+
+    assert conn.execute("SELECT timestamp FROM relay_map").fetchone() == (1735689600,)
+    assert conn.execute("SELECT forwarded_at FROM forwarded_news").fetchone() == (1735776000,)
+    assert conn.execute("SELECT banned_at, muted_until FROM moderation").fetchone() == (1735689600, None)
+
+    conn.execute("INSERT INTO reply_map (admin_msg_id, user_id, user_msg_id) VALUES (1, 2, 3)")
+    assert conn.execute("SELECT typeof(timestamp) FROM reply_map").fetchone() == ("integer",)
+
+
+def test_composite_key_tables_are_without_rowid_and_purged_by_key():
+    from utils.retention import DEFAULT_POLICIES
+
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+    conn.execute("INSERT INTO relay_map VALUES (1, 42, 7, 0), (1, 42, 8, 0), (2, 42, 9, 2000000000)")
+    conn.execute("INSERT INTO news_parts VALUES (5, 50, 0), (5, 51, 0)")
+    conn.execute("INSERT INTO content_hashes VALUES (-100, 10, 'h', 0)")
+    conn.execute("INSERT INTO thanks_daily VALUES (0, 42, 3)")
+
+    for table in ("relay_map", "news_parts", "content_hashes", "thanks_daily", "thanks_weekly", "thanks_monthly"):
+        sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = ?", (table,)).fetchone()[0]
+        assert sql.rstrip().endswith("WITHOUT ROWID"), table
+
+    # Тот же DELETE, что в utils/retention.delete_batch, — по полному ключу
+    for policy in DEFAULT_POLICIES:
+        conn.execute(
+            f"DELETE FROM {policy.table} WHERE ({policy.key_column}) IN ("
+            f"SELECT {policy.key_column} FROM {policy.table} WHERE {policy.time_column} < ? "
+            f"ORDER BY {policy.time_column} LIMIT ?)",
+            (1000, 500),
+        )
+    assert conn.execute("SELECT forwarded_id, original_message_id FROM relay_map").fetchall() == [(2, 9)]
+    for table in ("news_parts", "content_hashes", "thanks_daily"):
+        assert conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone() == (0,)
@@ -0,0 +1,57 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from aiogram import Bot
+from aiogram.types import Chat, Message, PhotoSize
+
+
+def _channel_photo(message_id: int, caption: str | None = None, chat_id: int = -1001):
+    message = MagicMock(spec=Message)
+    message.chat = Chat(id=chat_id, type="channel")
+    message.message_id = message_id
+    message.media_group_id = "album1"
+    message.caption = caption
+    message.text = None
+    message.html_text = caption or ""
+    for attr in ("video", "document", "audio", "voice", "animation", "sticker", "video_note", "poll"):
+        setattr(message, attr, None)
+    message.photo = [PhotoSize(file_id=f"p{message_id}", file_unique_id=f"u{message_id}", width=1, height=1)]
+    return message
+
+
+def test_album_hash_covers_all_items_in_order():
+    from handlers.news_monitor import hash_album_content, hash_message_content
+
+    album = [_channel_photo(2), _channel_photo(1, caption="Новость")]
+
+    assert hash_album_content(album) == hash_album_content(list(reversed(album)))
+    assert hash_album_content(album) != hash_message_content(album[1])
+    assert hash_album_content(album) != hash_album_content(album[:1] + [_channel_photo(3)])
+
+
+@pytest.mark.asyncio
+async def test_channel_album_forwarded_once(monkeypatch):
+    from handlers import news_monitor
+
+    saved = []
+
+    async def save_forwarded_news(message_id, content_hash, group_msg_id=None):
+        saved.append((message_id, content_hash, group_msg_id))
+
+    monkeypatch.setattr(news_monitor, "MEDPHYSPRO_CHANNEL_ID", -1001)
+    monkeypatch.setattr(news_monitor, "is_hash_already_forwarded", AsyncMock(return_value=False))
+    monkeypatch.setattr(news_monitor, "save_forwarded_news", save_forwarded_news)
+    # Хеши частей не должны уходить в общий write-behind буфер других тестов
+    monkeypatch.setattr(news_monitor, "save_content_hashes", AsyncMock())
+
+    bot = AsyncMock(spec=Bot)
+    bot.send_media_group.return_value = [MagicMock(message_id=501), MagicMock(message_id=502)]
+    album = [_channel_photo(10), _channel_photo(11, caption="Новость")]
+
+    await news_monitor.forward_news(album[0], bot, album=album)
+
+    bot.send_media_group.assert_called_once()
+    media = bot.send_media_group.call_args.kwargs["media"]
+    assert media[0].caption.startswith("Новость") and "Источник" in media[0].caption
+    # Подпись перенесена в первый отправленный элемент — он и связан с постом с подписью
+    album_hash = news_monitor.hash_album_content(album)
+    assert saved == [(11, album_hash, 501), (10, album_hash, 502)]
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+from aiogram.types import Chat
+
+from middlewares.ordering import OrderedUpdates
+
+
+def _feed(ordering: OrderedUpdates, chat_id: int, handler, reach_handler: bool = True):
+    """Апдейт проходит outer-фазу, затем (если дошёл до обработчика) inner-фазу."""
+
+    async def inner(event, data):
+        if not reach_handler:
+            return None
+        return await ordering.run(handler, event, data)
+
+    return ordering.reserve(inner, chat_id, {"event_chat": Chat(id=chat_id, type="private")})
+
+
+@pytest.mark.asyncio
+async def test_same_chat_is_serialized_other_chats_run_in_parallel():
+    ordering = OrderedUpdates(workers=4)
+    log = []
+
+    def handler(label, delay):
+        async def run(event, data):
+            log.append(f"{label}+")
+            await asyncio.sleep(delay)
+            log.append(f"{label}-")
+        return run
+
+    await asyncio.gather(
+        _feed(ordering, 1, handler("slow", 0.05)),
+        _feed(ordering, 1, handler("next", 0)),
+        _feed(ordering, 2, handler("other", 0)),
+    )
+
+    # Второй апдейт чата 1 начинается только после первого, чат 2 его не ждёт
+    assert log.index("next+") > log.index("slow-")
+    assert log.index("other-") < log.index("slow-")
+    stats = ordering.stats()
+    assert stats["processed"] == 3
+    assert stats["queued"] == 0
+    assert stats["p99"] >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_update_without_handler_does_not_let_later_ones_overtake():
+    ordering = OrderedUpdates(workers=4)
+    log = []
+
+    async def slow(event, data):
+        await asyncio.sleep(0.05)
+        log.append("first")
+
+    async def fast(event, data):
+        log.append("third")
+
+    # Второй апдейт (например, элемент альбома) до обработчика не доходит
+    await asyncio.gather(
+        _feed(ordering, 1, slow),
+        _feed(ordering, 1, fast, reach_handler=False),
+        _feed(ordering, 1, fast),
+    )
+    assert log == ["first", "third"]
+
+
+@pytest.mark.asyncio
+async def test_pool_bounds_concurrency_and_chat_queue_is_capped():
+    ordering = OrderedUpdates(workers=2, max_queue_per_chat=2)
+    running = 0
+    peak = 0
+
+    async def handler(event, data):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    await asyncio.gather(*(_feed(ordering, chat_id, handler) for chat_id in range(1, 7)))
+    assert peak == 2
+
+    await asyncio.gather(*(_feed(ordering, 100, handler) for _ in range(3)))
+    assert ordering.stats()["dropped"] == 1
+    assert ordering.stats()["processed"] == 8
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+from aiogram.methods import GetMe, SendMessage
+
+from middlewares.rate_limit import OutboundRateLimiter, TokenBucket
+
+
+def test_token_bucket_reservations_queue_up():
+    bucket = TokenBucket(rate=2, capacity=2, now=0.0)
+
+    assert bucket.reserve(0.0) == 0.0
+    assert bucket.reserve(0.0) == 0.0
+    # Следующие вызовы ждут по очереди: 0.5 с, 1 с
+    assert bucket.reserve(0.0) == pytest.approx(0.5)
+    assert bucket.reserve(0.0) == pytest.approx(1.0)
+    assert bucket.reserve(1.0) == pytest.approx(0.5)
+    assert not bucket.is_idle(1.0)
+    assert bucket.is_idle(10.0)
+
+
+@pytest.mark.asyncio
+async def test_limiter_spaces_group_burst():
+    limiter = OutboundRateLimiter(global_per_sec=1000, group_per_min=1200, private_per_sec=1000)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    # Запас группового бакета — 3 сообщения, дальше по 1/20 с
+    waits = await asyncio.gather(*(limiter.acquire(-100) for _ in range(6)))
+
+    assert waits[:3] == [0.0, 0.0, 0.0]
+    assert loop.time() - started == pytest.approx(0.15, abs=0.05)
+    stats = limiter.stats()
+    assert stats["delayed"] == 3
+    assert stats["max_queued"] == 3  # без ожидания вызовы в очереди не задерживаются
+    assert stats["queued"] == 0
+    assert stats["max_wait"] == pytest.approx(0.15, abs=0.05)
+
+
+@pytest.mark.asyncio
+async def test_limiter_only_limits_message_methods():
+    limiter = OutboundRateLimiter(global_per_sec=1000, group_per_min=1200, private_per_sec=1000)
+    calls = []
+
+    async def make_request(bot, method):
+        calls.append(type(method).__name__)
+        return "ok"
+
+    assert await limiter(make_request, None, GetMe()) == "ok"
+    assert await limiter(make_request, None, SendMessage(chat_id=-100, text="x")) == "ok"
+
+    assert calls == ["GetMe", "SendMessage"]
+    assert limiter.stats()["calls"] == 1
+
+
+@pytest.mark.asyncio
+async def test_global_tokens_go_to_higher_priority_first(monkeypatch):
+    monkeypatch.setattr("middlewares.rate_limit.LOG_CHANNEL_ID", -999)
+    limiter = OutboundRateLimiter(global_per_sec=20, group_per_min=60000, private_per_sec=1000)
+    order = []
+
+    async def send(chat_id, label):
+        await limiter.acquire(chat_id)
+        order.append(label)
+
+    # Исчерпать запас глобального бакета
+    for _ in range(20):
+        await limiter.acquire(-1)
+
+    # Логи встали в очередь первыми, но пользователи и админ-группа обгоняют их
+    await asyncio.gather(
+        send(-999, "log1"), send(-999, "log2"),
+        send(-1003, "admin"),
+        send(42, "user1"), send(43, "user2"),
+    )
+    assert order == ["user1", "user2", "admin", "log1", "log2"]
+
+
+@pytest.mark.asyncio
+async def test_retry_after_is_retried_transparently():
+    from aiogram.exceptions import TelegramRetryAfter
+
+    limiter = OutboundRateLimiter(global_per_sec=1000, group_per_min=60000, private_per_sec=1000)
+    method = SendMessage(chat_id=-100, text="x")
+    loop = asyncio.get_running_loop()
+    attempts = []
+
+    async def make_request(bot, m):
+        attempts.append(loop.time())
+        if len(attempts) == 1:
+            raise TelegramRetryAfter(method=m, message="Too Many Requests", retry_after=0.2)
+        return "ok"
+
+    assert await limiter(make_request, None, method) == "ok"
+    assert len(attempts) == 2
+    assert attempts[1] - attempts[0] >= 0.19
+    assert limiter.stats()["retries"] == 1
+
+
+@pytest.mark.asyncio
+async def test_album_and_batch_copy_charge_a_token_per_message():
+    from aiogram.methods import CopyMessages, SendMediaGroup
+    from aiogram.types import InputMediaPhoto
+
+    limiter = OutboundRateLimiter(global_per_sec=10, group_per_min=60000, private_per_sec=1000)
+    loop = asyncio.get_running_loop()
+
+    async def make_request(bot, method):
+        return "ok"
+
+    album = SendMediaGroup(chat_id=-100, media=[InputMediaPhoto(media=f"p{i}") for i in range(6)])
+    copies = CopyMessages(chat_id=-100, from_chat_id=1, message_ids=[1, 2, 3, 4, 5, 6])
+
+    started = loop.time()
+    await limiter(make_request, None, album)
+    # Запас глобального бакета — 10 токенов: альбом забрал 6, на 6 копий не хватает 2
+    await limiter(make_request, None, copies)
+    assert loop.time() - started == pytest.approx(0.2, abs=0.05)
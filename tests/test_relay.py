@@ -85,3 +85,156 @@ async def test_handle_admin_edit_ignored_when_not_bot_reply():
     await handle_admin_edit(message=message_admin_reply, bot=bot)
     message_admin_reply.reply.assert_not_called()
 
+
+
+def _private_text(message_id: int, text: str):
+    from unittest.mock import AsyncMock, MagicMock
+
+    message = MagicMock(spec=Message)
+    message.message_id = message_id
+    message.from_user = User(id=42, is_bot=False, first_name="User")
+    message.text = text
+    message.html_text = text
+    message.forward_from = None
+    message.forward_from_chat = None
+    message.answer = AsyncMock()
+    return message
+
+
+@pytest.mark.asyncio
+async def test_burst_of_texts_relayed_as_one_post(monkeypatch):
+    import asyncio
+    from unittest.mock import AsyncMock, MagicMock
+    from aiogram import Bot
+    from handlers import relay
+    from utils.coalesce import BurstCoalescer
+
+    mappings = []
+
+    async def save_mappings(rows):
+        mappings.extend(rows)
+
+    monkeypatch.setattr(relay, "relay_bursts", BurstCoalescer(0.05, relay.relay_burst))
+    monkeypatch.setattr(relay, "get_restriction", AsyncMock(return_value=None))
+    monkeypatch.setattr(relay, "save_mappings", save_mappings)
+    bot = AsyncMock(spec=Bot)
+    bot.send_message.return_value = MagicMock(message_id=900)
+
+    messages = [_private_text(i, f"часть {i}") for i in (1, 2, 3)]
+    for message in messages:
+        await relay.handle_private_message(message, bot)
+    bot.send_message.assert_not_called()
+
+    await asyncio.sleep(0.1)
+
+    bot.send_message.assert_called_once()
+    text = bot.send_message.call_args.kwargs["text"]
+    assert text.count("📨") == 1
+    assert text.endswith("часть 1\n\nчасть 2\n\nчасть 3")
+    assert mappings == [(900, 42, 1), (900, 42, 2), (900, 42, 3)]
+    messages[0].answer.assert_not_called()
+    messages[-1].answer.assert_called_once_with("✅ Ваше сообщение получено!")
+
+
+@pytest.mark.asyncio
+async def test_burst_flushed_before_it_would_exceed_text_limit(monkeypatch):
+    from unittest.mock import AsyncMock, MagicMock
+    from aiogram import Bot
+    from handlers import relay
+    from utils.coalesce import BurstCoalescer
+
+    monkeypatch.setattr(relay, "relay_bursts", BurstCoalescer(10, relay.relay_burst))
+    monkeypatch.setattr(relay, "get_restriction", AsyncMock(return_value=None))
+    monkeypatch.setattr(relay, "save_mappings", AsyncMock())
+    bot = AsyncMock(spec=Bot)
+    bot.send_message.return_value = MagicMock(message_id=900)
+
+    for i in range(3):
+        await relay.handle_private_message(_private_text(i, "x" * 1500), bot)
+
+    # Третий текст не помещается в 4096 вместе с первыми двумя — они ушли сразу
+    bot.send_message.assert_called_once()
+    assert relay.relay_bursts.pending(42)[0][0].message_id == 2
+    await relay.relay_bursts.flush_all()
+
+
+@pytest.mark.asyncio
+async def test_admin_text_edit_reaches_user_with_coalescing_enabled(monkeypatch):
+    from unittest.mock import AsyncMock, MagicMock
+    from aiogram import Bot
+    from handlers import relay
+    from utils.coalesce import BurstCoalescer
+
+    monkeypatch.setattr(relay, "relay_bursts", BurstCoalescer(0.05, relay.relay_burst))
+    monkeypatch.setattr(relay, "get_user_reply_msg", AsyncMock(return_value=(42, 7)))
+    monkeypatch.setattr(relay, "get_content_hashes", AsyncMock(return_value=[None]))
+    monkeypatch.setattr(relay, "save_content_hashes", AsyncMock())
+    bot = AsyncMock(spec=Bot)
+    bot.id = 99999
+
+    reply_to_message = MagicMock(spec=Message)
+    reply_to_message.from_user = User(id=99999, is_bot=True, first_name="Bot")
+    message = MagicMock(spec=Message)
+    message.message_id = 501
+    message.reply_to_message = reply_to_message
+    message.text = "исправленный ответ"
+    message.html_text = "исправленный ответ"
+    message.caption = None
+    message.reply = AsyncMock()
+
+    await relay.handle_admin_edit(message=message, bot=bot)
+
+    bot.edit_message_text.assert_called_once()
+    kwargs = bot.edit_message_text.call_args.kwargs
+    assert (kwargs["chat_id"], kwargs["message_id"]) == (42, 7)
+    assert kwargs["text"] == "(отредактировано)\nисправленный ответ"
+    bot.send_message.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_reply_to_album_header_on_copy_fallback_finds_user(monkeypatch, tmp_path):
+    from unittest.mock import AsyncMock, MagicMock
+    from aiogram import Bot
+    from aiogram.exceptions import TelegramBadRequest
+    from aiogram.types import Chat, PhotoSize
+    from handlers import relay
+    from utils import async_db, db
+    from utils.db_connection import reset_connections
+
+    reset_connections(str(tmp_path / "test.db"))
+    db.init_db()
+    async_db.relay_cache.clear()
+    monkeypatch.setattr(relay, "relay_bursts", None)
+    monkeypatch.setattr(relay, "get_restriction", AsyncMock(return_value=None))
+
+    album = []
+    for message_id in (11, 12):
+        item = MagicMock(spec=Message)
+        item.chat = Chat(id=42, type="private")
+        item.from_user = User(id=42, is_bot=False, first_name="User")
+        item.message_id = message_id
+        item.caption = "подпись" if message_id == 12 else None
+        item.html_text = item.caption or ""
+        item.text = None
+        for attr in ("video", "document", "audio", "voice", "animation", "sticker", "video_note", "poll"):
+            setattr(item, attr, None)
+        item.photo = [PhotoSize(file_id=f"p{message_id}", file_unique_id=f"u{message_id}", width=1, height=1)]
+        item.answer = AsyncMock()
+        album.append(item)
+
+    bot = AsyncMock(spec=Bot)
+    bot.send_media_group.side_effect = TelegramBadRequest(method=MagicMock(), message="Bad Request: group rejected")
+    bot.send_message.return_value = MagicMock(message_id=300)
+    bot.copy_messages.return_value = [MagicMock(message_id=301), MagicMock(message_id=302)]
+
+    try:
+        await relay.handle_private_message(album[0], bot, album=album)
+
+        # Заголовок с именем автора — самое частое, на что отвечают админы
+        assert await async_db.get_user_by_forwarded(300) == 42
+        assert await async_db.get_user_by_forwarded(302) == 42
+        await async_db.flush_pending_writes()
+        assert db.get_user_by_forwarded(300) == 42
+    finally:
+        async_db.shutdown_async_db()
+        reset_connections()
@@ -1,6 +1,7 @@
 import pytest
 from unittest.mock import AsyncMock, MagicMock
 from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import Message, Chat
 from utils.sender import send_content_to_group
 
@@ -45,3 +46,208 @@ async def test_send_content_to_group_html():
     
     assert kwargs["text"] == "<b>HEADER</b> Hello <a href=\"https://world.com\">world</a>"
     assert kwargs["parse_mode"] == "HTML"
+
+
+@pytest.mark.asyncio
+async def test_send_content_to_group_long_html_keeps_tags():
+    bot = AsyncMock(spec=Bot)
+
+    message = MagicMock(spec=Message)
+    message.html_text = "<a href=\"https://example.com\">" + "ссылка &amp; " * 600 + "</a>"
+    message.text = "ссылка & " * 600
+    message.caption = None
+    message.chat = Chat(id=1, type="private")
+    message.message_id = 123
+    for attr in ("photo", "video", "document", "audio", "voice", "animation", "sticker", "video_note", "poll", "media_group_id"):
+        setattr(message, attr, None)
+
+    await send_content_to_group(message=message, bot=bot, chat_id=999, parse_mode="HTML")
+
+    texts = [call.kwargs["text"] for call in bot.send_message.call_args_list]
+    assert len(texts) == 2
+    assert all(text.startswith("<a href=\"https://example.com\">") and text.endswith("</a>") for text in texts)
+
+
+def _album_item(message_id: int, caption: str | None = None, kind: str = "photo"):
+    from aiogram.types import PhotoSize, Sticker
+
+    message = MagicMock(spec=Message)
+    message.chat = Chat(id=1, type="private")
+    message.message_id = message_id
+    message.media_group_id = "g1"
+    message.caption = caption
+    message.text = None
+    message.html_text = caption or ""
+    for attr in ("photo", "video", "document", "audio", "voice", "animation", "sticker", "video_note", "poll"):
+        setattr(message, attr, None)
+    if kind == "photo":
+        message.photo = [PhotoSize(file_id=f"p{message_id}", file_unique_id=f"u{message_id}", width=1, height=1)]
+    else:
+        message.sticker = MagicMock(spec=Sticker)
+    return message
+
+
+@pytest.mark.asyncio
+async def test_album_sent_as_one_media_group_with_prefix_in_first_caption():
+    bot = AsyncMock(spec=Bot)
+    album = [_album_item(12), _album_item(11), _album_item(13, caption="подпись")]
+    bot.send_media_group.return_value = [MagicMock(message_id=i) for i in (101, 102, 103)]
+
+    sent = await send_content_to_group(
+        message=album[0], bot=bot, chat_id=999, prefix="<b>HEADER</b> ", suffix="\nИсточник",
+        parse_mode="HTML", album=album,
+    )
+
+    bot.send_media_group.assert_called_once()
+    bot.forward_message.assert_not_called()
+    bot.send_message.assert_not_called()
+    media = bot.send_media_group.call_args.kwargs["media"]
+    assert [item.media for item in media] == ["p11", "p12", "p13"]
+    assert media[0].caption == "<b>HEADER</b> подпись\nИсточник"
+    assert media[1].caption is None and media[2].caption is None
+    assert [msg.message_id for msg in sent] == [101, 102, 103]
+
+
+@pytest.mark.asyncio
+async def test_album_with_unsupported_item_falls_back_to_copy_messages():
+    bot = AsyncMock(spec=Bot)
+    album = [_album_item(11), _album_item(12, kind="sticker")]
+    bot.send_message.return_value = MagicMock(message_id=201)
+    bot.copy_messages.return_value = [MagicMock(message_id=202), MagicMock(message_id=203)]
+
+    sent = await send_content_to_group(
+        message=album[0], bot=bot, chat_id=999, prefix="<b>HEADER</b>", parse_mode="HTML", album=album,
+    )
+
+    bot.send_media_group.assert_not_called()
+    assert bot.copy_messages.call_args.kwargs["message_ids"] == [11, 12]
+    assert bot.send_message.call_args.kwargs["text"] == "<b>HEADER</b>"
+    assert [msg.message_id for msg in sent] == [201, 202, 203]
+
+
+def test_sent_part_pairs_cover_every_sent_message():
+    from utils.sender import sent_part_pairs
+
+    single = _album_item(5)
+    assert sent_part_pairs([single], [MagicMock(message_id=i) for i in (50, 51)]) == [(5, 50), (5, 51)]
+
+
+
+@pytest.mark.asyncio
+async def test_sent_part_pairs_follow_media_group_caption_move():
+    from utils.sender import MAX_CAPTION, sent_part_pairs
+
+    # Подпись у третьего элемента перенесена в первый отправленный, хвост подписи — отдельным сообщением
+    bot = AsyncMock(spec=Bot)
+    album = [_album_item(11), _album_item(12), _album_item(13, caption="слово " * (MAX_CAPTION // 5))]
+    bot.send_media_group.return_value = [MagicMock(message_id=i) for i in (101, 102, 103)]
+    bot.send_message.return_value = MagicMock(message_id=104)
+
+    sent = await send_content_to_group(message=album[0], bot=bot, chat_id=999, album=album)
+    assert sent_part_pairs(album, sent) == [(13, 101), (12, 102), (11, 103), (13, 104)]
+
+
+@pytest.mark.asyncio
+async def test_sent_part_pairs_one_to_one_on_copy_fallback():
+    from utils.sender import sent_part_pairs
+
+    # copy_messages оставляет подписи на местах; сообщение с префиксом — к элементу с подписью
+    bot = AsyncMock(spec=Bot)
+    album = [_album_item(11), _album_item(12), _album_item(13, caption="подпись", kind="sticker")]
+    bot.send_message.return_value = MagicMock(message_id=200)
+    bot.copy_messages.return_value = [MagicMock(message_id=i) for i in (201, 202, 203)]
+
+    sent = await send_content_to_group(
+        message=album[0], bot=bot, chat_id=999, prefix="<b>HEADER</b>", suffix="\nИсточник", album=album,
+    )
+    assert sent.copied
+    assert [msg.message_id for msg in sent] == [200, 201, 202, 203]
+    assert sent_part_pairs(album, sent) == [(13, 200), (11, 201), (12, 202), (13, 203)]
+    # Правка подписи и хеши частей заголовок не трогают
+    assert sent_part_pairs(album, sent, headers=False) == [(11, 201), (12, 202), (13, 203)]
+
+
+@pytest.mark.asyncio
+async def test_album_copy_fallback_error_returns_header_only():
+    bot = AsyncMock(spec=Bot)
+    album = [_album_item(11), _album_item(12, kind="sticker")]
+    bot.send_message.return_value = MagicMock(message_id=200)
+    bot.copy_messages.side_effect = TelegramBadRequest(
+        method=MagicMock(), message="Bad Request: message to copy not found"
+    )
+
+    sent = await send_content_to_group(
+        message=album[0], bot=bot, chat_id=999, prefix="<b>HEADER</b>", album=album,
+    )
+    assert [msg.message_id for msg in sent] == [200]
+
+
+@pytest.mark.asyncio
+async def test_album_caption_overflow_sent_as_full_text_messages():
+    from utils.sender import MAX_CAPTION, MAX_TEXT
+
+    # ~3000 символов подписи: 1024 в подписи и один текстовый хвост, а не три по 1024
+    bot = AsyncMock(spec=Bot)
+    album = [_album_item(11, caption="слово " * 500), _album_item(12)]
+    bot.send_media_group.return_value = [MagicMock(message_id=i) for i in (101, 102)]
+    bot.send_message.return_value = MagicMock(message_id=103)
+
+    await send_content_to_group(message=album[0], bot=bot, chat_id=999, album=album)
+
+    caption = bot.send_media_group.call_args.kwargs["media"][0].caption
+    assert len(caption) <= MAX_CAPTION
+    texts = [call.kwargs["text"] for call in bot.send_message.call_args_list]
+    assert len(texts) == 1 and len(texts[0]) <= MAX_TEXT
+    assert (caption + texts[0]).split() == ("слово " * 500).split()
+
+
+@pytest.mark.asyncio
+async def test_edit_parts_edits_in_place_and_adjusts_part_count():
+    from utils.sender import edit_parts
+
+    bot = AsyncMock(spec=Bot)
+    bot.send_message.return_value = MagicMock(message_id=30)
+
+    result = await edit_parts(bot, 999, [10, 11, 12], "короткий текст")
+    added, removed = result.added, result.removed
+    bot.edit_message_text.assert_called_once()
+    assert bot.edit_message_text.call_args.kwargs["message_id"] == 10
+    assert added == [] and removed == [11, 12]
+    assert [c.kwargs["message_id"] for c in bot.delete_message.call_args_list] == [11, 12]
+
+    bot.reset_mock()
+    result = await edit_parts(bot, 999, [10], "слово " * 1000, caption=True)
+    added, removed = result.added, result.removed
+    bot.edit_message_caption.assert_called_once()
+    assert [m.message_id for m in added] == [30] * (len(bot.send_message.call_args_list))
+    # Подпись — до 1024, хвост ~5000 символов — обычными сообщениями по 4096
+    assert len(added) == 2 and removed == []
+    assert bot.send_message.call_args_list[0].kwargs["reply_to_message_id"] == 10
+
+
+@pytest.mark.asyncio
+async def test_edit_parts_skips_parts_with_unchanged_content():
+    from utils.sender import chunk_hashes, edit_parts
+
+    bot = AsyncMock(spec=Bot)
+    text = "абзац\n\n" * 1500
+    hashes = chunk_hashes(text)
+    assert len(hashes) >= 3
+
+    # Правка без изменений — ни одного запроса
+    result = await edit_parts(bot, 999, [10, 11, 12], text, hashes=hashes)
+    assert result.edited == 0 and not bot.method_calls
+    assert result.message_ids == [10, 11, 12] and result.hashes == hashes
+
+    # Изменился только хвост — правится только последняя часть
+    result = await edit_parts(bot, 999, [10, 11, 12], text + "P.S.", hashes=hashes)
+    assert result.edited == 1
+    assert bot.edit_message_text.call_args.kwargs["message_id"] == 12
+
+    # Хеш неизвестен, а текст уже такой — "message is not modified" не ошибка
+    bot.reset_mock()
+    bot.edit_message_text.side_effect = TelegramBadRequest(
+        method=MagicMock(), message="Bad Request: message is not modified"
+    )
+    result = await edit_parts(bot, 999, [10], "текст")
+    assert result.edited == 0 and result.message_ids == [10]
@@ -1,7 +1,7 @@
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 from aiogram.types import Message, User
-from handlers.thanks import detect_thanks
+from handlers.thanks import detect_thanks, parse_top_period
 
 @pytest.mark.asyncio
 async def test_detect_thanks_valid():
@@ -58,3 +58,11 @@ async def test_detect_thanks_bot_thank():
     with patch("handlers.thanks.increment_thanks") as mock_increment:
         await detect_thanks(message)
         mock_increment.assert_not_called()
+
+
+def test_parse_top_period():
+    assert parse_top_period("/top10") == "all"
+    assert parse_top_period("/top10 week") == "week"
+    assert parse_top_period("/top10@MedPhysBot MONTH") == "month"
+    assert parse_top_period("/top10 all") == "all"
+    assert parse_top_period("/top10 year") is None
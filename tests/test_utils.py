@@ -1,6 +1,9 @@
 import pytest
 from aiogram.types import MessageEntity
-from utils.sender import utf16_len, shift_entities
+import random
+
+from utils.sender import utf16_len, shift_entities, slice_entities, split_entities
+from utils.text_split import Utf16Index, split_text
 
 def test_utf16_len():
     # Regular text
@@ -34,3 +37,76 @@ def test_shift_entities_zero_offset():
     original = [MessageEntity(type="bold", offset=0, length=5)]
     shifted = shift_entities(original, 0)
     assert shifted == original
+
+def test_utf16_index():
+    text = "a📨b📨c"
+    index = Utf16Index(text)
+    assert index.length == utf16_len(text)
+    assert [index.offset(i) for i in range(len(text) + 1)] == [0, 1, 3, 4, 6, 7]
+    assert index.index(2) == 1  # середина суррогатной пары — к началу эмодзи
+    assert index.index(3) == 2
+
+@pytest.mark.parametrize("text", [
+    "📨" * 5000,
+    "x" * 10000,
+    ("Первое предложение. Второе 📨 предложение! " * 300),
+    ("Абзац один.\n\nАбзац два 👍🏽 со словами\n" * 400),
+])
+def test_split_text_respects_utf16_limit(text):
+    parts = split_text(text, 4096)
+    assert "".join(parts) == text
+    assert all(utf16_len(part) <= 4096 for part in parts)
+
+def test_split_text_prefers_natural_boundaries():
+    paragraph = "слово " * 500
+    text = paragraph.strip() + "\n\n" + paragraph
+    parts = split_text(text, 4096)
+    assert parts[0].endswith("\n\n")
+
+    sentences = "Это предложение. " * 300
+    assert all(part.endswith(". ") for part in split_text(sentences, 1000)[:-1])
+
+def test_split_text_keeps_emoji_sequences():
+    family = "👨\u200d👩\u200d👧"
+    parts = split_text(family * 500, 1000)
+    assert "".join(parts) == family * 500
+    assert all(not part.startswith("\u200d") and not part.endswith("\u200d") for part in parts)
+
+def test_split_text_short_and_empty():
+    assert split_text("", 10) == []
+    assert split_text("коротко", 4096) == ["коротко"]
+
+def test_split_entities_matches_per_chunk_slicing():
+    rng = random.Random(5)
+    entities = []
+    for _ in range(300):
+        offset = rng.randrange(10000)
+        entities.append(MessageEntity(type=rng.choice(["bold", "italic", "code"]), offset=offset, length=rng.randint(1, 600)))
+    cuts = sorted(rng.sample(range(1, 10600), 20))
+    bounds = list(zip([0] + cuts, cuts + [10600]))
+
+    def key(ent):
+        return ent.type, ent.offset, ent.length
+
+    for (start, end), chunk in zip(bounds, split_entities(entities, bounds)):
+        expected = []
+        for ent in entities:
+            clipped_start, clipped_end = max(ent.offset, start), min(ent.offset + ent.length, end)
+            if clipped_end > clipped_start:
+                expected.append((ent.type, clipped_start - start, clipped_end - clipped_start))
+        assert sorted(map(key, chunk)) == sorted(expected)
+        assert all(0 <= ent.offset and ent.offset + ent.length <= end - start for ent in chunk)
+
+def test_split_entities_reuses_unchanged_and_keeps_fields():
+    plain = MessageEntity(type="bold", offset=0, length=5)
+    emoji = MessageEntity(type="custom_emoji", offset=5000, length=2, custom_emoji_id="42")
+    first, second = split_entities([emoji, plain], [(0, 4096), (4096, 8192)])
+
+    assert first == [plain] and first[0] is plain
+    assert second[0].offset == 904
+    assert second[0].custom_emoji_id == "42"
+
+def test_slice_entities_clips_to_range():
+    ent = MessageEntity(type="text_link", offset=2, length=10, url="https://example.com")
+    sliced = slice_entities([ent], 5, 8)
+    assert (sliced[0].offset, sliced[0].length, sliced[0].url) == (0, 3, "https://example.com")
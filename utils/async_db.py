@@ -0,0 +1,384 @@
+# utils/async_db.py
+#
+# Асинхронная обёртка над синхронными DB-хелперами.
+# Все записи выполняются на одном выделенном потоке-писателе (SQLite допускает
+# только одного писателя, так что очередь из одного потока не даёт "database is locked"),
+# чтения — на небольшом пуле потоков-читателей (WAL позволяет читать параллельно с записью).
+# Event loop при этом не блокируется дисковым I/O.
+
+from __future__ import annotations
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, TypeVar
+
+from utils import db, news_db, thanks_db
+from utils.config import (
+    DB_LOOKUP_CACHE_SIZE,
+    DB_READER_THREADS,
+    DB_WRITE_BEHIND_INTERVAL_MS,
+    DB_WRITE_BEHIND_MAX_ROWS,
+)
+from utils.logger import get_logger
+from utils.lookup_cache import MISS, LookupCache
+from utils.mute_scheduler import MuteExpiryScheduler
+from utils.write_behind import WriteBehindBuffer
+
+T = TypeVar("T")
+
+logger = get_logger("db")
+
+
+class AsyncDB:
+    """
+    Исполнитель DB-вызовов вне event loop.
+
+    Args:
+        readers: Размер пула потоков для чтения.
+    """
+
+    def __init__(self, readers: int = 2) -> None:
+        self._readers_count = readers
+        self._writer: ThreadPoolExecutor | None = None
+        self._readers: ThreadPoolExecutor | None = None
+
+    def _get_writer(self) -> ThreadPoolExecutor:
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        return self._writer
+
+    def _get_readers(self) -> ThreadPoolExecutor:
+        if self._readers is None:
+            self._readers = ThreadPoolExecutor(
+                max_workers=self._readers_count, thread_name_prefix="db-reader"
+            )
+        return self._readers
+
+    async def write(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Выполняет fn на потоке-писателе."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_writer(), functools.partial(fn, *args, **kwargs))
+
+    async def read(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Выполняет fn на пуле читателей."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_readers(), functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self) -> None:
+        """Дожидается завершения поставленных запросов и останавливает потоки."""
+        for executor in (self._writer, self._readers):
+            if executor is not None:
+                executor.shutdown(wait=True)
+        self._writer = None
+        self._readers = None
+        logger.debug("[DB] Потоки асинхронного DB-слоя остановлены")
+
+
+_db = AsyncDB(readers=DB_READER_THREADS)
+_pending = WriteBehindBuffer(
+    _db.write,
+    interval_ms=DB_WRITE_BEHIND_INTERVAL_MS,
+    max_rows=DB_WRITE_BEHIND_MAX_ROWS,
+)
+mute_scheduler = MuteExpiryScheduler(db.moderation_cache, _db.write, db.expire_mutes)
+
+# Фоновые задачи слоя (ссылки держим, чтобы их не собрал GC)
+_background: set[asyncio.Task] = set()
+
+# Кэши поиска по связям: forwarded_id -> user_id и admin_msg_id -> (user_id, user_msg_id)
+relay_cache = LookupCache("relay_map", DB_LOOKUP_CACHE_SIZE)
+reply_cache = LookupCache("reply_map", DB_LOOKUP_CACHE_SIZE)
+
+
+def load_lookup_keys() -> None:
+    """
+    Загружает ключи reply_map в кэш (при старте после init_db): правка сообщения админа,
+    которое не было ответом пользователю, не доходит до SQLite.
+    """
+    reply_cache.load_keys(db.get_reply_keys())
+
+
+async def flush_pending_writes() -> None:
+    """Дописывает write-behind буфер (вызывается при остановке бота до shutdown_async_db)."""
+    await _pending.close()
+
+
+def shutdown_async_db() -> None:
+    _db.shutdown()
+
+
+async def run_in_writer(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Выполняет произвольную синхронную запись на потоке-писателе."""
+    return await _db.write(fn, *args, **kwargs)
+
+
+def _reader(fn: Callable[..., T]) -> Callable[..., Awaitable[T]]:
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> T:
+        return await _db.read(fn, *args, **kwargs)
+    return wrapper
+
+
+def _writer(fn: Callable[..., T]) -> Callable[..., Awaitable[T]]:
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> T:
+        return await _db.write(fn, *args, **kwargs)
+    return wrapper
+
+
+# --- utils/db.py ---
+init_db = _writer(db.init_db)
+_user_exists_db = _reader(db.user_exists)
+_get_user_by_forwarded_db = _reader(db.get_user_by_forwarded)
+unmute_user = _writer(db.unmute_user)
+ban_user = _writer(db.ban_user)
+unban_user = _writer(db.unban_user)
+_get_admin_msg_id_db = _reader(db.get_admin_msg_id)
+_get_user_reply_msg_db = _reader(db.get_user_reply_msg)
+_get_forwarded_originals_db = _reader(db.get_forwarded_originals)
+_get_admin_msg_ids_db = _reader(db.get_admin_msg_ids)
+_delete_mappings_db = _writer(db.delete_mappings)
+_get_content_hashes_db = _reader(db.get_content_hashes)
+
+# --- utils/thanks_db.py ---
+_get_top_thanked_db = _reader(thanks_db.get_top_thanked)
+_get_top_thanked_for_period_db = _reader(thanks_db.get_top_thanked_for_period)
+
+# --- utils/news_db.py ---
+_is_hash_already_forwarded_db = _reader(news_db.is_hash_already_forwarded)
+_get_group_msg_id_db = _reader(news_db.get_group_msg_id)
+_get_group_msg_ids_db = _reader(news_db.get_group_msg_ids)
+_get_forwarded_hashes_db = _reader(news_db.get_forwarded_hashes)
+_delete_news_parts_db = _writer(news_db.delete_news_parts)
+
+
+# Новый срок мута сразу попадает в планировщик истечения
+async def mute_user(user_id: int, muted_until: int) -> None:
+    await _db.write(db.mute_user, user_id, muted_until)
+    mute_scheduler.schedule(user_id, muted_until)
+
+
+# --- Кэш модерации: ответ из памяти, без перехода на поток ---
+
+async def get_restriction(user_id: int) -> str | None:
+    return db.get_restriction(user_id)
+
+
+async def is_banned(user_id: int) -> bool:
+    return db.is_banned(user_id)
+
+
+async def is_muted(user_id: int) -> bool:
+    return db.is_muted(user_id)
+
+
+async def get_user_status(user_id: int) -> dict:
+    return db.get_user_status(user_id)
+
+
+# --- Write-behind: записи уходят в буфер, чтения сначала смотрят в него ---
+
+async def save_mapping(forwarded_id: int, user_id: int, original_id: int) -> None:
+    _pending.save_mapping(forwarded_id, user_id, original_id)
+    relay_cache.put(forwarded_id, user_id)
+
+
+async def save_mappings(rows: list[tuple[int, int, int]]) -> None:
+    """Все части и элементы альбома: (forwarded_id, user_id, original_id); пишутся одним executemany."""
+    _pending.save_mappings(rows)
+    for forwarded_id, user_id, _ in rows:
+        relay_cache.put(forwarded_id, user_id)
+
+
+async def delete_mappings(forwarded_ids: list[int]) -> None:
+    _pending.discard_mappings(forwarded_ids)
+    relay_cache.discard(forwarded_ids)
+    await _delete_mappings_db(forwarded_ids)
+
+
+async def save_reply_mapping(admin_msg_id: int, user_id: int, user_msg_id: int) -> None:
+    _pending.save_reply_mapping(admin_msg_id, user_id, user_msg_id)
+    reply_cache.put(admin_msg_id, (user_id, user_msg_id))
+
+
+async def save_reply_mappings(rows: list[tuple[int, int, int]]) -> None:
+    _pending.save_reply_mappings(rows)
+    for admin_msg_id, user_id, user_msg_id in rows:
+        reply_cache.put(admin_msg_id, (user_id, user_msg_id))
+
+
+async def mark_user_sent(user_id: int) -> None:
+    _pending.mark_user_sent(user_id)
+
+
+async def save_forwarded_news(message_id: int, content_hash: str, group_msg_id: int = None) -> None:
+    _pending.save_forwarded_news(message_id, content_hash, group_msg_id)
+    news_db.dedup_index.add(content_hash)
+
+
+async def save_content_hashes(chat_id: int, hashes: dict[int, str]) -> None:
+    _pending.save_content_hashes(chat_id, hashes)
+
+
+async def get_content_hashes(chat_id: int, message_ids: list[int]) -> list[str | None]:
+    """Хеши содержимого по порядку message_ids (None — хеша нет)."""
+    pending = {mid: _pending.get_content_hash(chat_id, mid) for mid in message_ids}
+    missing = [mid for mid, h in pending.items() if h is None]
+    stored = await _get_content_hashes_db(chat_id, missing) if missing else {}
+    return [pending[mid] or stored.get(mid) for mid in message_ids]
+
+
+async def save_news_parts(message_id: int, group_msg_ids: list[int]) -> None:
+    _pending.save_news_parts(message_id, group_msg_ids)
+
+
+async def delete_news_parts(message_id: int, group_msg_ids: list[int]) -> None:
+    _pending.discard_news_parts(message_id, group_msg_ids)
+    await _delete_news_parts_db(message_id, group_msg_ids)
+
+
+async def increment_thanks(user_id: int, name: str) -> None:
+    _pending.increment_thanks(user_id, name)
+
+
+async def get_user_by_forwarded(forwarded_id: int) -> int | None:
+    cached = relay_cache.get(forwarded_id)
+    if cached is not MISS:
+        return cached
+    pending = _pending.get_user_by_forwarded(forwarded_id)
+    if pending is not None:
+        return pending
+    version = relay_cache.version
+    user_id = await _get_user_by_forwarded_db(forwarded_id)
+    relay_cache.store_loaded(forwarded_id, user_id, version)
+    return user_id
+
+
+async def get_admin_msg_id(user_id: int, user_msg_id: int) -> int | None:
+    pending = _pending.get_admin_msg_id(user_id, user_msg_id)
+    if pending is not None:
+        return pending
+    return await _get_admin_msg_id_db(user_id, user_msg_id)
+
+
+async def get_admin_msg_ids(user_id: int, user_msg_id: int) -> list[int]:
+    pending = _pending.get_admin_msg_ids(user_id, user_msg_id)
+    return sorted(pending.union(await _get_admin_msg_ids_db(user_id, user_msg_id)))
+
+
+async def get_forwarded_originals(forwarded_id: int) -> set[int]:
+    return _pending.get_forwarded_originals(forwarded_id) | await _get_forwarded_originals_db(forwarded_id)
+
+
+async def get_user_reply_msg(admin_msg_id: int) -> tuple[int, int] | None:
+    cached = reply_cache.get(admin_msg_id)
+    if cached is not MISS:
+        return cached
+    pending = _pending.get_user_reply_msg(admin_msg_id)
+    if pending is not None:
+        return pending
+    version = reply_cache.version
+    result = await _get_user_reply_msg_db(admin_msg_id)
+    reply_cache.store_loaded(admin_msg_id, tuple(result) if result else None, version)
+    return result
+
+
+def on_retention_purged(table: str, cutoff: int) -> None:
+    """Очистка удалила строки старше cutoff — кэши не должны отдавать их дальше."""
+    if table == "forwarded_news":
+        news_db.dedup_index.expire(cutoff)
+        task = asyncio.get_running_loop().create_task(rebuild_news_dedup(), name="news_dedup_rebuild")
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+        return
+    cache = {"relay_map": relay_cache, "reply_map": reply_cache}.get(table)
+    if cache is not None:
+        evicted = cache.evict_older(cutoff)
+        logger.debug(f"[DB] Кэш {table}: после очистки выброшено {evicted} записей")
+
+
+async def user_exists(user_id: int) -> bool:
+    return _pending.user_exists(user_id) or await _user_exists_db(user_id)
+
+
+async def is_hash_already_forwarded(content_hash: str) -> bool:
+    # Индекс пополняется при сохранении, так что "точно нет" верно и для записей в буфере
+    known = news_db.dedup_index.check(content_hash)
+    if known is not None:
+        return known
+    return _pending.is_hash_pending(content_hash) or await _is_hash_already_forwarded_db(content_hash)
+
+
+async def rebuild_news_dedup() -> None:
+    """Пересобирает фильтр Блума после очистки forwarded_news."""
+    index = news_db.dedup_index
+    if not index.begin_rebuild():
+        return
+    try:
+        hashes = await _get_forwarded_hashes_db()
+    except Exception as e:
+        index.cancel_rebuild()
+        logger.error(f"[DB] Не удалось пересобрать индекс дедупликации новостей: {e}")
+        return
+    index.finish_rebuild(hashes)
+
+
+async def get_group_msg_id(message_id: int) -> int | None:
+    pending = _pending.get_group_msg_id(message_id)
+    if pending is not None:
+        return pending
+    return await _get_group_msg_id_db(message_id)
+
+
+async def get_group_msg_ids(message_id: int) -> list[int]:
+    pending = _pending.get_group_msg_ids(message_id)
+    stored = await _get_group_msg_ids_db(message_id)
+    if not pending and not stored:
+        group_msg_id = _pending.get_group_msg_id(message_id)
+        return [group_msg_id] if group_msg_id is not None else []
+    return sorted(pending.union(stored))
+
+
+# Сколько раз перечитывать счётчики, если за время чтения появились новые благодарности
+_TOP_SNAPSHOT_ATTEMPTS = 3
+
+
+async def get_top_thanked(limit: int = 10, period: str = thanks_db.PERIOD_ALL) -> list[tuple[str, int]]:
+    """
+    Топ благодарностей с учётом ещё не записанных: отложенные приращения прибавляются
+    к записанным счётчикам, сброс буфера остаётся за таймером write-behind.
+    """
+    if not _pending.has_pending_thanks():
+        if period != thanks_db.PERIOD_ALL:
+            return await _get_top_thanked_for_period_db(period, limit)
+        if limit <= thanks_db.leaderboard.k:
+            return thanks_db.get_top_thanked(limit)  # из памяти, без перехода на поток
+        return await _get_top_thanked_db(limit)
+
+    if period == thanks_db.PERIOD_ALL and limit <= thanks_db.leaderboard.k:
+        base: dict[int, int] = {}
+        for _ in range(_TOP_SNAPSHOT_ATTEMPTS):
+            top, unknown = thanks_db.leaderboard.top_with_pending(_pending.pending_thanks(), limit, base)
+            if not unknown:
+                return top
+            # Счётчики вне топа читаем на потоке-писателе: он видит ровно записанные пачки,
+            # а отложенные приращения снимаются уже после чтения — без двойного счёта
+            _, counts = await _db.write(thanks_db.get_top_snapshot, period, 0, unknown)
+            base.update({user_id: counts.get(user_id, 0) for user_id in unknown})
+        return thanks_db.leaderboard.top_with_pending(_pending.pending_thanks(), limit, base)[0]
+
+    user_ids: list[int] = []
+    for _ in range(_TOP_SNAPSHOT_ATTEMPTS):
+        # Отложенные пользователи могут вытеснить из первых limit записанных — читаем с запасом
+        rows, counts = await _db.write(thanks_db.get_top_snapshot, period, limit + len(user_ids), user_ids)
+        pending = _pending.pending_thanks(period)
+        if set(pending) <= set(user_ids):
+            break
+        user_ids = sorted(pending)
+    merged = {user_id: (name, count) for user_id, name, count in rows}
+    for user_id, (name, delta) in pending.items():
+        base_count = counts.get(user_id, merged.get(user_id, (name, 0))[1])
+        merged[user_id] = (name, base_count + delta)
+    ranked = sorted(merged.items(), key=lambda item: (-item[1][1], item[0]))
+    return [entry for _, entry in ranked[:limit]]
@@ -0,0 +1,90 @@
+# utils/coalesce.py
+#
+# Объединение серий (burst) быстрых событий по ключу.
+# Элементы с одним ключом копятся, пока между ними проходит меньше window секунд;
+# после паузы вся серия одним вызовом уходит в flush(key, items) в фоновой задаче,
+# так что добавление никогда не блокирует обработчик.
+#
+# Порядок сохраняется: flush(key) вызывающего кода сначала дожидается уже идущей
+# отправки этого ключа, поэтому следующее сообщение пользователя не обгонит серию.
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+from utils.logger import get_logger
+
+logger = get_logger("relay")
+
+
+class BurstCoalescer:
+    """
+    Args:
+        window: Пауза (секунды) после последнего элемента, после которой серия отправляется.
+        flush: Корутина отправки серии: flush(key, items).
+    """
+
+    def __init__(self, window: float, flush: Callable[[Hashable, list], Awaitable[Any]]) -> None:
+        self.window = window
+        self._flush = flush
+        self._pending: dict[Hashable, list] = {}
+        self._timers: dict[Hashable, asyncio.TimerHandle] = {}
+        self._flushing: dict[Hashable, asyncio.Future] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+        # Метрики
+        self.bursts = 0
+        self.items = 0
+
+    def pending(self, key: Hashable) -> list:
+        return self._pending.get(key, [])
+
+    def add(self, key: Hashable, item: Any) -> None:
+        """Добавляет элемент в серию ключа и перезапускает таймер паузы."""
+        self._pending.setdefault(key, []).append(item)
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        self._timers[key] = asyncio.get_running_loop().call_later(self.window, self._on_timer, key)
+
+    def _on_timer(self, key: Hashable) -> None:
+        self._timers.pop(key, None)
+        task = asyncio.get_running_loop().create_task(self.flush(key))
+        # Держим ссылку, чтобы задачу не собрал GC до завершения
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self, key: Hashable) -> None:
+        """Отправляет накопленную серию ключа сразу и дожидается окончания отправки."""
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+
+        previous = self._flushing.get(key)
+        items = self._pending.pop(key, None)
+        if not items:
+            if previous is not None:
+                await previous
+            return
+
+        done = asyncio.get_running_loop().create_future()
+        self._flushing[key] = done
+        try:
+            if previous is not None:
+                await previous
+            self.bursts += 1
+            self.items += len(items)
+            await self._flush(key, items)
+        except Exception as e:
+            logger.error(f"[RELAY] Ошибка отправки серии сообщений ({len(items)} шт.): {e}")
+        finally:
+            done.set_result(None)
+            if self._flushing.get(key) is done:
+                del self._flushing[key]
+
+    async def flush_all(self) -> None:
+        """Отправляет все незавершённые серии (при остановке бота)."""
+        await asyncio.gather(*(self.flush(key) for key in list(self._pending)))
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -25,7 +25,7 @@ async def setup_bot_commands(bot: Bot):
 
     await bot.set_my_commands(
         commands=[
-            BotCommand(command="top10", description="Показать ТОП-10 по благодарностям"),
+            BotCommand(command="top10", description="ТОП-10 по благодарностям: week, month или all"),
         ],
         scope=BotCommandScopeChat(chat_id=MEDPHYSPRO_GROUP_ID)
     )
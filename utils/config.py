@@ -37,14 +37,18 @@ def resolve_int_env(
     *,
     min_value: int = 1,
     default: int | None = None,
-    allow_equal: bool = False
+    allow_equal: bool = False,
+    zero_disables: bool = False
 ) -> int | None:
     """
     Безопасно извлекает числовое значение из .env.
     Возвращает None, если значение отсутствует, некорректно или меньше (или меньше/равно) min_value.
+    "0" означает значение по умолчанию; с zero_disables=True явный 0 возвращается как есть (функция выключена).
     """
     raw = os.getenv(var_name)
     try:
+        if zero_disables and raw is not None and raw.strip() == "0":
+            return 0
         if not raw or str(raw).strip() in ("", "0"):
             return default
         value = int(raw)
@@ -98,6 +102,53 @@ LOG_CHANNEL_ID = resolve_int_env("LOG_CHANNEL_ID", min_value=-10**13, default=-1
 # Путь к базе данных
 DB_PATH = get_env_var("DB_PATH", str, required=False, default=os.path.join("data", "medphysbot.db"))
 
+# Тюнинг SQLite: кэш страниц (KiB) и memory-mapped I/O (MiB) на соединение
+DB_CACHE_SIZE_KIB = resolve_int_env("DB_CACHE_SIZE_KIB", min_value=0, default=8192)
+DB_MMAP_SIZE_MIB = resolve_int_env("DB_MMAP_SIZE_MIB", min_value=0, default=64, zero_disables=True)
+# Число потоков-читателей асинхронного DB-слоя (писатель всегда один)
+DB_READER_THREADS = resolve_int_env("DB_READER_THREADS", min_value=1, default=2, allow_equal=True)
+# Write-behind: пачка сбрасывается не реже чем раз в INTERVAL_MS или при накоплении MAX_ROWS строк
+DB_WRITE_BEHIND_INTERVAL_MS = resolve_int_env("DB_WRITE_BEHIND_INTERVAL_MS", min_value=1, default=200, allow_equal=True)
+DB_WRITE_BEHIND_MAX_ROWS = resolve_int_env("DB_WRITE_BEHIND_MAX_ROWS", min_value=1, default=50, allow_equal=True)
+# LRU-кэш поиска по relay_map / reply_map (utils/lookup_cache.py): записей в каждом кэше, 0 — без кэша
+DB_LOOKUP_CACHE_SIZE = resolve_int_env("DB_LOOKUP_CACHE_SIZE", min_value=0, default=4096, zero_disables=True)
+# Индекс дедупликации новостей (utils/news_dedup.py): ожидаемое число хешей за срок хранения
+# (размер фильтра Блума) и сколько последних хешей хранить точно
+NEWS_DEDUP_CAPACITY = resolve_int_env("NEWS_DEDUP_CAPACITY", min_value=1, default=10000, allow_equal=True)
+NEWS_DEDUP_RECENT = resolve_int_env("NEWS_DEDUP_RECENT", min_value=1, default=1000, allow_equal=True)
+
+# Сроки хранения (дни) и параметры инкрементальной очистки utils/retention.py
+RETENTION_RELAY_MAP_DAYS = resolve_int_env("RETENTION_RELAY_MAP_DAYS", min_value=1, default=14, allow_equal=True)
+RETENTION_REPLY_MAP_DAYS = resolve_int_env("RETENTION_REPLY_MAP_DAYS", min_value=1, default=14, allow_equal=True)
+RETENTION_FORWARDED_NEWS_DAYS = resolve_int_env("RETENTION_FORWARDED_NEWS_DAYS", min_value=1, default=7, allow_equal=True)
+RETENTION_CONTENT_HASHES_DAYS = resolve_int_env("RETENTION_CONTENT_HASHES_DAYS", min_value=1, default=14, allow_equal=True)
+RETENTION_THANKS_DAILY_DAYS = resolve_int_env("RETENTION_THANKS_DAILY_DAYS", min_value=1, default=90, allow_equal=True)
+RETENTION_BATCH_SIZE = resolve_int_env("RETENTION_BATCH_SIZE", min_value=1, default=500, allow_equal=True)
+RETENTION_BATCH_PAUSE_MS = resolve_int_env("RETENTION_BATCH_PAUSE_MS", min_value=1, default=200, allow_equal=True)
+RETENTION_INTERVAL_MIN = resolve_int_env("RETENTION_INTERVAL_MIN", min_value=1, default=60, allow_equal=True)
+
+# Уведомлять пользователя, когда срок мута истёк (utils/mute_scheduler.py); по умолчанию выключено
+MUTE_EXPIRY_NOTIFY = resolve_bool_env("MUTE_EXPIRY_NOTIFY", default=False)
+
+# Исходящий ограничитель запросов к Bot API (middlewares/rate_limit.py)
+RATE_LIMIT_GLOBAL_PER_SEC = resolve_int_env("RATE_LIMIT_GLOBAL_PER_SEC", min_value=1, default=30, allow_equal=True)
+RATE_LIMIT_GROUP_PER_MIN = resolve_int_env("RATE_LIMIT_GROUP_PER_MIN", min_value=1, default=20, allow_equal=True)
+RATE_LIMIT_PRIVATE_PER_SEC = resolve_int_env("RATE_LIMIT_PRIVATE_PER_SEC", min_value=1, default=1, allow_equal=True)
+
+# Объединение серии коротких текстов пользователя в одно сообщение админ-группы:
+# пауза (мс) после последнего сообщения серии; 0 — выключено, каждое сообщение отдельно
+RELAY_COALESCE_MS = resolve_int_env("RELAY_COALESCE_MS", min_value=0, default=0)
+
+# Сборка альбомов (middlewares/album.py): максимальная пауза после последнего элемента и
+# предел одновременно собираемых альбомов
+ALBUM_MAX_WAIT_MS = resolve_int_env("ALBUM_MAX_WAIT_MS", min_value=1, default=300, allow_equal=True)
+ALBUM_MAX_PENDING = resolve_int_env("ALBUM_MAX_PENDING", min_value=1, default=1000, allow_equal=True)
+
+# Обработка апдейтов (middlewares/ordering.py): сколько обработчиков выполняется одновременно
+# и сколько апдейтов одного чата может ждать очереди (остальные отбрасываются как флуд)
+UPDATE_WORKERS = resolve_int_env("UPDATE_WORKERS", min_value=1, default=8, allow_equal=True)
+UPDATE_QUEUE_PER_CHAT = resolve_int_env("UPDATE_QUEUE_PER_CHAT", min_value=1, default=50, allow_equal=True)
+
 # Интервалы backoff при недоступности Telegram (прокси, блокировка, обрыв сети)
 _TELEGRAM_BO_MIN = float(
     resolve_int_env("TELEGRAM_BACKOFF_MIN_SEC", min_value=1, default=2, allow_equal=True) or 2
@@ -1,103 +1,98 @@
 # utils/db.py
 
-import sqlite3
-import os
-from datetime import datetime, timedelta, timezone
 from utils.logger import get_logger
-from utils.config import DB_PATH
+from utils.db_connection import get_connection
+from utils.migrations import migrate
+from utils.moderation_cache import ModerationCache
+from utils import news_db, thanks_db
 
 logger = get_logger("db")
 logger.info("[DB] db.py загружен")
 
-def init_db():
-    os.makedirs("data", exist_ok=True)
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
+# Ограничения пользователей в памяти: is_banned / is_muted / get_user_status не ходят в SQLite
+moderation_cache = ModerationCache()
 
-        # Таблица пересылок
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS relay_map (
-                forwarded_id INTEGER PRIMARY KEY,
-                original_user_id INTEGER NOT NULL,
-                original_message_id INTEGER NOT NULL,
-                timestamp TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+def init_db():
+    """Применяет недостающие миграции схемы и загружает кэши модерации, топа благодарностей и хешей новостей."""
+    version = migrate(get_connection())
+    logger.debug(f"[DB] Версия схемы: {version}")
 
-        # Таблица пользователей
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                has_sent INTEGER DEFAULT 0
-            )
-        """)
+    load_moderation_cache()
+    thanks_db.load_leaderboard()
+    news_db.load_dedup_index()
 
-        # Таблица пользователей с ограничениями
+def load_moderation_cache():
+    with get_connection() as conn:
+        cursor = conn.cursor()
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS moderation (
-                user_id INTEGER PRIMARY KEY,
-                banned INTEGER DEFAULT 0,
-                banned_at TEXT DEFAULT NULL,
-                muted_until TEXT DEFAULT NULL
-            )
+            SELECT user_id, banned, banned_at, muted_until FROM moderation
+            WHERE banned = 1 OR muted_until IS NOT NULL
         """)
+        moderation_cache.load(cursor.fetchall())
+
+# SQL записей, которые также пишутся пачками через utils/write_behind.py
+SAVE_MAPPING_SQL = """
+    INSERT OR REPLACE INTO relay_map (forwarded_id, original_user_id, original_message_id)
+    VALUES (?, ?, ?)
+"""
+
+SAVE_REPLY_MAPPING_SQL = """
+    INSERT OR REPLACE INTO reply_map (admin_msg_id, user_id, user_msg_id)
+    VALUES (?, ?, ?)
+"""
+
+MARK_USER_SENT_SQL = """
+    INSERT INTO users (user_id, has_sent)
+    VALUES (?, 1)
+    ON CONFLICT(user_id) DO UPDATE SET has_sent = 1
+"""
+
+SAVE_CONTENT_HASH_SQL = """
+    INSERT OR REPLACE INTO content_hashes (chat_id, message_id, content_hash)
+    VALUES (?, ?, ?)
+"""
 
-        # Таблица пересланных новостей
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS forwarded_news (
-                message_id INTEGER PRIMARY KEY,
-                content_hash TEXT NOT NULL,
-                forwarded_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+def save_mapping(forwarded_id: int, user_id: int, original_id: int):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(SAVE_MAPPING_SQL, (forwarded_id, user_id, original_id))
+        conn.commit()
 
-        # Таблица ответов админов
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS reply_map (
-                admin_msg_id INTEGER PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                user_msg_id INTEGER NOT NULL,
-                timestamp TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+def save_mappings(rows: list[tuple[int, int, int]]):
+    """Связи (forwarded_id, user_id, original_id) одним executemany в одной транзакции."""
+    with get_connection() as conn:
+        conn.executemany(SAVE_MAPPING_SQL, rows)
         conn.commit()
 
-def save_mapping(forwarded_id: int, user_id: int, original_id: int):
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT OR REPLACE INTO relay_map (forwarded_id, original_user_id, original_message_id)
-            VALUES (?, ?, ?)
-        """, (forwarded_id, user_id, original_id))
+def delete_mappings(forwarded_ids: list[int]):
+    with get_connection() as conn:
+        conn.executemany("DELETE FROM relay_map WHERE forwarded_id = ?", [(fid,) for fid in forwarded_ids])
         conn.commit()
 
 def get_user_by_forwarded(forwarded_id: int) -> int | None:
-    with sqlite3.connect(DB_PATH) as conn:
+    with get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT original_user_id FROM relay_map WHERE forwarded_id = ?", (forwarded_id,))
+        cursor.execute("SELECT original_user_id FROM relay_map WHERE forwarded_id = ? LIMIT 1", (forwarded_id,))
         result = cursor.fetchone()
         return result[0] if result else None
 
 def user_exists(user_id: int) -> bool:
-    with sqlite3.connect(DB_PATH) as conn:
+    with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT has_sent FROM users WHERE user_id = ?", (user_id,))
         result = cursor.fetchone()
         return result is not None
 
 def mark_user_sent(user_id: int):
-    with sqlite3.connect(DB_PATH) as conn:
+    with get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO users (user_id, has_sent)
-            VALUES (?, 1)
-            ON CONFLICT(user_id) DO UPDATE SET has_sent = 1
-        """, (user_id,))
+        cursor.execute(MARK_USER_SENT_SQL, (user_id,))
         conn.commit()
 
-def mute_user(user_id: int, muted_until: str):
+def mute_user(user_id: int, muted_until: int):
+    """muted_until — момент окончания мута в Unix-секундах (UTC)."""
     logger.debug(f"[DB] mute_user: user_id={user_id}, until={muted_until}")
-    with sqlite3.connect(DB_PATH) as conn:
+    with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("""
             INSERT INTO moderation (user_id, muted_until)
@@ -105,16 +100,18 @@ def mute_user(user_id: int, muted_until: str):
             ON CONFLICT(user_id) DO UPDATE SET muted_until = ?
         """, (user_id, muted_until, muted_until))
         conn.commit()
+    moderation_cache.set_muted(user_id, muted_until)
 
 def unmute_user(user_id: int):
-    with sqlite3.connect(DB_PATH) as conn:
+    with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("UPDATE moderation SET muted_until = NULL WHERE user_id = ?", (user_id,))
         conn.commit()
+    moderation_cache.clear_mute(user_id)
 
-def ban_user(user_id: int, banned_at: str):
+def ban_user(user_id: int, banned_at: int):
     logger.debug(f"[DB] ban_user: user_id={user_id}, banned_at={banned_at}")
-    with sqlite3.connect(DB_PATH) as conn:
+    with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("""
             INSERT INTO moderation (user_id, banned, banned_at)
@@ -122,62 +119,97 @@ def ban_user(user_id: int, banned_at: str):
             ON CONFLICT(user_id) DO UPDATE SET banned = 1, banned_at = ?
         """, (user_id, banned_at, banned_at))
         conn.commit()
+    moderation_cache.set_banned(user_id, banned_at)
 
 def unban_user(user_id: int):
-    with sqlite3.connect(DB_PATH) as conn:
+    with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("UPDATE moderation SET banned = 0, banned_at = NULL WHERE user_id = ?", (user_id,))
         conn.commit()
+    moderation_cache.clear_ban(user_id)
+
+def get_restriction(user_id: int) -> str | None:
+    """Одна проверка на горячем пути: BANNED, MUTED или None."""
+    return moderation_cache.restriction(user_id)
 
 def is_banned(user_id: int) -> bool:
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT banned FROM moderation WHERE user_id = ?", (user_id,))
-        result = cursor.fetchone()
-        return result and result[0] == 1
+    return moderation_cache.is_banned(user_id)
 
 def is_muted(user_id: int) -> bool:
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT muted_until FROM moderation WHERE user_id = ?", (user_id,))
-        result = cursor.fetchone()
-
-    logger.debug(f"[DB] is_muted check: user_id={user_id}, muted_until={result}")
-
-    if result and result[0]:
-        try:
-            until = datetime.fromisoformat(result[0])
-            if datetime.now(timezone.utc) >= until:
-                unmute_user(user_id)
-                logger.info(f"[DB] mute expired — user_id={user_id} размьючен автоматически")
-                return False
-            return True
-        except ValueError:
-            return False
-    return False
+    # Истёкшие муты снимает utils/mute_scheduler.py — здесь только чтение
+    return moderation_cache.is_muted(user_id)
+
+def expire_mutes(user_ids: list[int], now: int) -> list[int]:
+    """
+    Снимает истёкшие к моменту now муты одной транзакцией.
+    Возвращает user_id, у которых мут действительно снят (не продлён за это время).
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            "UPDATE moderation SET muted_until = NULL WHERE user_id = ? AND muted_until <= ?",
+            [(user_id, now) for user_id in user_ids],
+        )
+        conn.commit()
+    expired = []
+    for user_id in user_ids:
+        muted_until = moderation_cache.muted_until(user_id)
+        if muted_until is not None and muted_until <= now:
+            moderation_cache.clear_mute(user_id)
+            expired.append(user_id)
+    return expired
 
 def get_admin_msg_id(user_id: int, user_msg_id: int) -> int | None:
-    with sqlite3.connect(DB_PATH) as conn:
+    with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("""
             SELECT forwarded_id FROM relay_map
             WHERE original_user_id = ? AND original_message_id = ?
+            ORDER BY forwarded_id DESC LIMIT 1
         """, (user_id, user_msg_id))
         result = cursor.fetchone()
         return result[0] if result else None
 
+def get_admin_msg_ids(user_id: int, user_msg_id: int) -> list[int]:
+    """Все сообщения админ-группы для сообщения пользователя — части по порядку отправки."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT forwarded_id FROM relay_map
+            WHERE original_user_id = ? AND original_message_id = ?
+            ORDER BY forwarded_id
+        """, (user_id, user_msg_id))
+        return [row[0] for row in cursor.fetchall()]
+
+def get_forwarded_originals(forwarded_id: int) -> set[int]:
+    """Сообщения пользователя, объединённые в одно сообщение админ-группы."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT original_message_id FROM relay_map WHERE forwarded_id = ?", (forwarded_id,))
+        return {row[0] for row in cursor.fetchall()}
+
 def save_reply_mapping(admin_msg_id: int, user_id: int, user_msg_id: int):
     logger.debug(f"[DB] save_reply_mapping: admin_msg_id={admin_msg_id}, user_id={user_id}, user_msg_id={user_msg_id}")
-    with sqlite3.connect(DB_PATH) as conn:
+    with get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            INSERT OR REPLACE INTO reply_map (admin_msg_id, user_id, user_msg_id)
-            VALUES (?, ?, ?)
-        """, (admin_msg_id, user_id, user_msg_id))
+        cursor.execute(SAVE_REPLY_MAPPING_SQL, (admin_msg_id, user_id, user_msg_id))
         conn.commit()
 
+def save_reply_mappings(rows: list[tuple[int, int, int]]):
+    """Связи (admin_msg_id, user_id, user_msg_id) одним executemany в одной транзакции."""
+    with get_connection() as conn:
+        conn.executemany(SAVE_REPLY_MAPPING_SQL, rows)
+        conn.commit()
+
+def get_reply_keys() -> list[tuple[int, int]]:
+    """Все (admin_msg_id, timestamp) из reply_map — набор ключей для кэша поиска."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT admin_msg_id, timestamp FROM reply_map")
+        return cursor.fetchall()
+
 def get_user_reply_msg(admin_msg_id: int) -> tuple[int, int] | None:
-    with sqlite3.connect(DB_PATH) as conn:
+    with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("""
             SELECT user_id, user_msg_id FROM reply_map WHERE admin_msg_id = ?
@@ -185,40 +217,23 @@ def get_user_reply_msg(admin_msg_id: int) -> tuple[int, int] | None:
         result = cursor.fetchone()
         return result if result else None
 
-def get_user_status(user_id: int) -> dict:
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT banned, banned_at, muted_until FROM moderation WHERE user_id = ?
-        """, (user_id,))
-        result = cursor.fetchone()
-
-    status = {
-        "banned": False,
-        "banned_at": None,
-        "muted": False,
-        "muted_until": None
-    }
-
-    if result:
-        status["banned"] = result[0] == 1
-        status["banned_at"] = result[1]
-        if result[2]:
-            try:
-                muted_until = datetime.fromisoformat(result[2]).replace(tzinfo=timezone.utc)
-                status["muted"] = datetime.now(timezone.utc) < muted_until
-                status["muted_until"] = result[2]
-            except ValueError:
-                status["muted"] = False
-
-    return status
-
-def cleanup_old_mappings(days: int = 2):
-    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM relay_map WHERE timestamp < ?", (cutoff,))
-        cursor.execute("DELETE FROM reply_map WHERE timestamp < ?", (cutoff,))
+def save_content_hashes(chat_id: int, hashes: dict[int, str]):
+    with get_connection() as conn:
+        conn.executemany(SAVE_CONTENT_HASH_SQL, [(chat_id, mid, h) for mid, h in hashes.items()])
         conn.commit()
 
-    logger.debug(f"[DB] Очистка связей: удалено всё старше {cutoff}")
+def get_content_hashes(chat_id: int, message_ids: list[int]) -> dict[int, str]:
+    """Хеши последнего записанного содержимого сообщений бота в чате (message_id -> hash)."""
+    if not message_ids:
+        return {}
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT message_id, content_hash FROM content_hashes "
+            f"WHERE chat_id = ? AND message_id IN ({', '.join('?' * len(message_ids))})",
+            (chat_id, *message_ids),
+        )
+        return dict(cursor.fetchall())
+
+def get_user_status(user_id: int) -> dict:
+    return moderation_cache.status(user_id)
@@ -0,0 +1,126 @@
+# utils/db_connection.py
+#
+# Долгоживущие соединения SQLite вместо sqlite3.connect() на каждый вызов.
+# Каждый поток получает своё соединение (sqlite3 не любит делить одно соединение
+# между потоками), настроенное один раз: WAL, synchronous=NORMAL, кэш страниц,
+# mmap и кэш подготовленных выражений.
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+
+from utils.config import DB_PATH, DB_CACHE_SIZE_KIB, DB_MMAP_SIZE_MIB
+from utils.logger import get_logger
+
+logger = get_logger("db")
+
+# Размер кэша подготовленных выражений на соединение (по умолчанию в sqlite3 — 128).
+CACHED_STATEMENTS = 256
+
+
+class ConnectionManager:
+    """
+    Process-wide менеджер соединений SQLite.
+
+    Соединение создаётся лениво, по одному на поток, и живёт до close_all().
+    PRAGMA применяются один раз при открытии, а не на каждый запрос.
+
+    Args:
+        path: Путь к файлу базы данных.
+        cache_size_kib: Размер кэша страниц в KiB (PRAGMA cache_size = -N).
+        mmap_size_mib: Размер memory-mapped I/O в MiB (0 — отключено).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        cache_size_kib: int = DB_CACHE_SIZE_KIB,
+        mmap_size_mib: int = DB_MMAP_SIZE_MIB,
+    ) -> None:
+        self.path = path
+        self._cache_size_kib = cache_size_kib
+        self._mmap_size_mib = mmap_size_mib
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: list[sqlite3.Connection] = []
+        # Увеличивается при close_all(): потоки с устаревшим поколением переоткрывают соединение
+        self._generation = 0
+
+    def get(self) -> sqlite3.Connection:
+        """Возвращает соединение текущего потока, открывая его при первом обращении."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.generation == self._generation:
+            return conn
+
+        conn = self._open()
+        self._local.conn = conn
+        self._local.generation = self._generation
+        return conn
+
+    def _open(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(
+            self.path,
+            cached_statements=CACHED_STATEMENTS,
+            check_same_thread=False,  # close_all() закрывает соединения из другого потока
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{int(self._cache_size_kib)}")
+        conn.execute(f"PRAGMA mmap_size={int(self._mmap_size_mib) * 1024 * 1024}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+
+        with self._lock:
+            self._connections.append(conn)
+            count = len(self._connections)
+
+        logger.debug(
+            f"[DB] Открыто соединение ({threading.current_thread().name}), "
+            f"всего соединений: {count}"
+        )
+        return conn
+
+    def close_all(self) -> None:
+        """Закрывает все открытые соединения (вызывается при остановке бота)."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._generation += 1
+
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"[DB] Ошибка при закрытии соединения: {e}")
+
+        if connections:
+            logger.debug(f"[DB] Закрыто соединений: {len(connections)}")
+
+
+_manager = ConnectionManager(DB_PATH)
+
+
+def get_connection() -> sqlite3.Connection:
+    """Соединение с основной БД для текущего потока."""
+    return _manager.get()
+
+
+def close_connections() -> None:
+    """Закрывает все соединения с основной БД."""
+    _manager.close_all()
+
+
+def reset_connections(path: str | None = None) -> None:
+    """
+    Закрывает текущие соединения и, если передан path, переключает менеджер на другой файл.
+    Используется в тестах и бенчмарках.
+    """
+    global _manager
+    _manager.close_all()
+    if path is not None:
+        _manager = ConnectionManager(path)
@@ -0,0 +1,124 @@
+# utils/html_split.py
+#
+# Разбиение HTML-разметки Telegram (parse_mode="HTML") на части по лимиту.
+# Лимит Telegram относится к отображаемому тексту после разбора разметки и
+# считается в единицах UTF-16, поэтому длину определяет только видимый текст:
+# теги не считаются, &amp; / &lt; / &#128512; — как один символ.
+#
+# Разметка разбирается за один проход в поток токенов (текст, мнемоника, тег)
+# с позициями в отображаемом тексте. Границы частей выбираются по этому тексту
+# тем же utils/text_split.py (абзац, строка, предложение, слово), поэтому разрез
+# никогда не попадает внутрь тега или мнемоники. На границе открытые теги
+# закрываются, а в начале следующей части открываются заново с теми же
+# атрибутами (ссылка, спойлер, язык блока кода продолжаются).
+
+from __future__ import annotations
+
+import html
+import re
+from typing import NamedTuple
+
+from utils.text_split import Utf16Index, split_spans
+
+_TOKEN = re.compile(r"(<[^<>]*>)|(&#?[0-9A-Za-z]+;)|([^<&]+|[<&])")
+_TAG_NAME = re.compile(r"</?\s*([A-Za-z][\w-]*)")
+
+TEXT = 0
+ENTITY = 1
+OPEN = 2
+CLOSE = 3
+
+
+class HtmlToken(NamedTuple):
+    kind: int
+    start: int   # позиция в отображаемом тексте (индекс символа)
+    end: int
+    source: str  # исходная разметка токена
+    name: str    # имя тега (для OPEN/CLOSE)
+
+
+def tokenize(markup: str) -> tuple[list[HtmlToken], str]:
+    """Токены разметки и отображаемый текст, который из неё получится."""
+    tokens = []
+    rendered = []
+    pos = 0
+    for tag, entity, text in _TOKEN.findall(markup):
+        if tag:
+            match = _TAG_NAME.match(tag)
+            if not match:
+                # "<" без имени тега Telegram отклонит и так — считаем текстом
+                rendered.append(tag)
+                tokens.append(HtmlToken(TEXT, pos, pos + len(tag), tag, ""))
+                pos += len(tag)
+                continue
+            kind = CLOSE if tag.startswith("</") else OPEN
+            tokens.append(HtmlToken(kind, pos, pos, tag, match.group(1).lower()))
+        elif entity:
+            decoded = html.unescape(entity)
+            rendered.append(decoded)
+            tokens.append(HtmlToken(ENTITY, pos, pos + len(decoded), entity, ""))
+            pos += len(decoded)
+        else:
+            rendered.append(text)
+            tokens.append(HtmlToken(TEXT, pos, pos + len(text), text, ""))
+            pos += len(text)
+    return tokens, "".join(rendered)
+
+
+def rendered_utf16_len(markup: str) -> int:
+    """Длина отображаемого текста разметки в единицах UTF-16 — то, что проверяет Telegram."""
+    return Utf16Index(tokenize(markup)[1]).length
+
+
+def split_html(markup: str, limit: int) -> list[str]:
+    """
+    Разбивает HTML-разметку на части, отображаемый текст каждой не длиннее limit единиц UTF-16.
+    Каждая часть — самостоятельная корректная разметка.
+    """
+    tokens, rendered = tokenize(markup)
+    index = Utf16Index(rendered)
+    if index.length <= limit:
+        return [markup] if markup else []
+
+    total = len(rendered)
+    spans = split_spans(rendered, limit, index)
+    chunks = []
+    stack: list[tuple[str, str]] = []  # открытые теги: (имя, исходный открывающий тег)
+    i = 0
+
+    for start, end in spans:
+        last = end == total
+        out = [source for _, source in stack]
+        while i < len(tokens):
+            token = tokens[i]
+            if token.kind == TEXT:
+                if token.start >= end:
+                    break
+                out.append(token.source[max(token.start, start) - token.start:min(token.end, end) - token.start])
+                if token.end > end:
+                    break  # остаток текста — в следующую часть
+            elif token.kind == ENTITY:
+                if token.start >= end:
+                    break
+                out.append(token.source)
+            elif token.kind == OPEN:
+                # Тег, открывающийся ровно на границе, начинает следующую часть
+                if token.start >= end and not last:
+                    break
+                stack.append((token.name, token.source))
+                out.append(token.source)
+            else:
+                # Закрывающий тег на границе ещё принадлежит текущей части
+                if token.start > end:
+                    break
+                for j in range(len(stack) - 1, -1, -1):
+                    if stack[j][0] == token.name:
+                        del stack[j]
+                        break
+                out.append(token.source)
+            i += 1
+
+        out.extend(f"</{name}>" for name, _ in reversed(stack))
+        chunks.append("".join(out))
+
+    return chunks
@@ -0,0 +1,108 @@
+# utils/leaderboard.py
+#
+# In-memory топ-K по благодарностям для /top10.
+# Загружается из таблицы thanks при старте (init_db) и обновляется инкрементально
+# итоговыми счётчиками, которые возвращает INSERT ... RETURNING при записи благодарностей.
+# Счётчики только растут, поэтому для точного топа достаточно хранить K лидеров:
+# пользователь вне топа может попасть в него лишь после собственного инкремента.
+
+from __future__ import annotations
+
+from typing import Iterable
+
+from utils.logger import get_logger
+
+logger = get_logger("thanks_db")
+
+
+def _rank(user_id: int, count: int) -> tuple[int, int]:
+    # Больше — выше; при равенстве выше меньший user_id (как ORDER BY count DESC, user_id)
+    return count, -user_id
+
+
+class Leaderboard:
+    """
+    Точный топ-K пользователей по счётчику благодарностей.
+
+    Обновления приходят с потока-писателя, чтения — из event loop:
+    отсортированный снимок заменяется целиком, поэтому чтение не требует блокировок.
+    """
+
+    def __init__(self, k: int = 10) -> None:
+        self.k = k
+        self._members: dict[int, tuple[str, int]] = {}  # user_id -> (name, count)
+        self._top: tuple[tuple[str, int], ...] = ()
+
+    def load(self, rows: Iterable[tuple[int, str, int]]) -> None:
+        """Заполняет топ строками (user_id, name, count), уже отсортированными по убыванию."""
+        self._members = {}
+        for user_id, name, count in rows:
+            if len(self._members) >= self.k:
+                break
+            self._members[user_id] = (name, count)
+        self._publish()
+        logger.info(f"[THANKS_DB] Топ благодарностей загружен: {len(self._members)} записей")
+
+    def update(self, user_id: int, name: str, count: int) -> None:
+        """Учитывает новый итоговый счётчик пользователя (после commit)."""
+        self.update_many([(user_id, name, count)])
+
+    def update_many(self, rows: Iterable[tuple[int, str, int]]) -> None:
+        changed = False
+        for user_id, name, count in rows:
+            if user_id in self._members or len(self._members) < self.k:
+                self._members[user_id] = (name, count)
+                changed = True
+                continue
+
+            weakest = min(self._members, key=lambda uid: _rank(uid, self._members[uid][1]))
+            if _rank(user_id, count) > _rank(weakest, self._members[weakest][1]):
+                del self._members[weakest]
+                self._members[user_id] = (name, count)
+                changed = True
+        if changed:
+            self._publish()
+
+    def _publish(self) -> None:
+        ordered = sorted(
+            self._members.items(),
+            key=lambda item: _rank(item[0], item[1][1]),
+            reverse=True,
+        )
+        self._top = tuple((name, count) for _, (name, count) in ordered)
+
+    def top_with_pending(
+        self,
+        pending: dict[int, tuple[str, int]],
+        limit: int,
+        base: dict[int, int] | None = None,
+    ) -> tuple[list[tuple[str, int]], list[int]]:
+        """
+        Топ с учётом ещё не записанных приращений pending (user_id -> (name, delta)).
+        У участников топа к счётчику прибавляется delta. Счётчик пользователя вне топа не выше
+        последнего места (топ точный), а при неполном топе равен нулю. Если пользователь вне топа
+        с приращением может попасть в первые limit, а его счётчика нет в base, его user_id
+        возвращается вторым элементом: счётчик нужно прочитать из базы и повторить вызов.
+        """
+        base = base or {}
+        full = len(self._members) >= self.k
+        floor = min((count for _, count in self._members.values()), default=0)
+        merged = dict(self._members)
+        unknown = []
+        for user_id, (name, delta) in pending.items():
+            if user_id in merged:
+                merged[user_id] = (name, merged[user_id][1] + delta)
+            elif user_id in base or not full:
+                merged[user_id] = (name, base.get(user_id, 0) + delta)
+            else:
+                unknown.append(user_id)
+
+        ranked = sorted(merged.items(), key=lambda item: _rank(item[0], item[1][1]), reverse=True)[:limit]
+        if unknown and len(ranked) >= limit:
+            last = _rank(ranked[-1][0], ranked[-1][1][1])
+            unknown = [uid for uid in unknown if _rank(uid, floor + pending[uid][1]) > last]
+        return [(name, count) for _, (name, count) in ranked], unknown
+
+    def top(self, limit: int | None = None) -> list[tuple[str, int]]:
+        """Пары (name, count) по убыванию; limit не больше k."""
+        return list(self._top[:limit])
@@ -80,7 +80,8 @@ def init_all_loggers(bot: Bot) -> None:
     for name in [
         "bot", "topics", "db", "moderation", "relay", "news", "startup",
         "cleanup", "errors", "commands", "status", "thanks", "thanks_db",
-        "thanks_words", "sender", "telegram_logger"
+        "news_db", "thanks_words", "sender", "telegram_logger", "rate_limit",
+        "album", "updates"
     ]:
         setup_logger(name=name, level=LOG_LEVEL)
 
@@ -0,0 +1,172 @@
+# utils/lookup_cache.py
+#
+# LRU-кэш горячих поисков по relay_map / reply_map перед SQLite.
+# get_user_by_forwarded вызывается на каждый ответ админа и каждую команду модерации,
+# get_user_reply_msg — на каждую правку в админ-группе; без кэша это поход на
+# поток-читатель и запрос к базе даже для только что сохранённой связи.
+#
+# - Запись сквозная: save_mapping / save_reply_mapping сразу кладут связь в кэш.
+# - Набор ключей (load_keys): все ключи таблицы с отметками времени загружаются при старте
+#   и пополняются сквозной записью. Ключа нет в наборе — связи точно нет, и даже первый
+#   поиск (правка обычного сообщения админа) не доходит до SQLite. Набор ограничен сроком
+#   хранения таблицы: очистка выбрасывает из него те же ключи, что и из базы.
+# - Без набора ключей работает отрицательный фильтр: ключи, которых не оказалось в базе,
+#   запоминаются в отдельном ограниченном LRU, и повторный поиск не доходит до SQLite.
+#   Сохранение связи снимает ключ с фильтра.
+# - Очистка по сроку хранения вызывает evict_older(cutoff): записи с отметкой времени
+#   старше cutoff выбрасываются. У прочитанных из базы записей время неизвестно
+#   (отметка 0) — они выбрасываются при любой очистке, в которой что-то удалено.
+# - Результат чтения из базы кладётся в кэш, только если за время чтения кэш не
+#   менялся (version): иначе параллельное сохранение могло бы быть перекрыто
+#   устаревшим "нет связи".
+
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable
+
+from utils.logger import get_logger
+from utils.stats_window import StatsWindow
+
+logger = get_logger("db")
+
+# Результат get(), когда о ключе ничего не известно и нужно идти в базу
+MISS = object()
+
+
+class LookupCache:
+    """
+    Args:
+        name: Имя кэша для логов и метрик.
+        maxsize: Сколько найденных связей держать (0 — кэш выключен, все поиски идут в базу).
+        negative_size: Сколько ключей без связи держать в отрицательном фильтре.
+    """
+
+    def __init__(self, name: str, maxsize: int, negative_size: int | None = None) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.negative_size = maxsize if negative_size is None else negative_size
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._missing: OrderedDict[Hashable, None] = OrderedDict()
+        self._keys: dict[Hashable, int] | None = None  # все ключи таблицы -> отметка времени
+        self.version = 0
+
+        # Метрики
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._window = StatsWindow()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any:
+        """Значение, None (связи точно нет) или MISS (нужно читать из базы)."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            result = entry[0]
+        elif self._keys is not None and key not in self._keys:
+            self.negative_hits += 1
+            result = None
+        elif key in self._missing:
+            self._missing.move_to_end(key)
+            self.negative_hits += 1
+            result = None
+        else:
+            self.misses += 1
+            result = MISS
+        self._maybe_log()
+        return result
+
+    def load_keys(self, rows: Iterable[tuple[Hashable, int | None]]) -> None:
+        """Полный набор ключей таблицы (key, timestamp): чего нет в наборе, того нет и в базе."""
+        self.version += 1
+        self._keys = {key: stamp or 0 for key, stamp in rows}
+        logger.info(f"[DB] Кэш {self.name}: загружено ключей={len(self._keys)}")
+
+    def put(self, key: Hashable, value: Any, stamp: int | None = None) -> None:
+        """Сквозная запись при сохранении связи. stamp — Unix-секунды создания связи."""
+        self.version += 1
+        stamp = int(time.time()) if stamp is None else stamp
+        self._missing.pop(key, None)
+        if self._keys is not None:
+            self._keys[key] = stamp
+        self._store(key, value, stamp)
+
+    def store_loaded(self, key: Hashable, value: Any, version: int) -> None:
+        """Кладёт результат чтения из базы, начатого при данной version."""
+        if version != self.version or key in self._entries:
+            return
+        if value is None:
+            if self._keys is not None:
+                self._keys.pop(key, None)
+            elif self.negative_size:
+                self._missing[key] = None
+                if len(self._missing) > self.negative_size:
+                    self._missing.popitem(last=False)
+        else:
+            self._store(key, value, 0)
+
+    def _store(self, key: Hashable, value: Any, stamp: int) -> None:
+        if not self.maxsize:
+            return
+        self._entries[key] = (value, stamp)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def discard(self, keys: Iterable[Hashable]) -> None:
+        """Связи удалены из базы — забываем их (ключи без связи в фильтр не попадают)."""
+        self.version += 1
+        for key in keys:
+            self._entries.pop(key, None)
+            if self._keys is not None:
+                self._keys.pop(key, None)
+
+    def evict_older(self, cutoff: int) -> int:
+        """Выбрасывает записи старше cutoff (после очистки по сроку хранения)."""
+        self.version += 1
+        stale = [key for key, (_, stamp) in self._entries.items() if stamp < cutoff]
+        for key in stale:
+            del self._entries[key]
+        self.evicted += len(stale)
+        if self._keys is not None:
+            for key in [key for key, stamp in self._keys.items() if stamp < cutoff]:
+                del self._keys[key]
+        return len(stale)
+
+    def clear(self) -> None:
+        self.version += 1
+        self._entries.clear()
+        self._missing.clear()
+        self._keys = None
+
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.negative_hits + self.misses
+        return (self.hits + self.negative_hits) / lookups if lookups else 0.0
+
+    def _maybe_log(self) -> None:
+        if self._window.elapsed() is None:
+            return
+        logger.info(
+            f"[DB] Кэш {self.name}: попаданий={self.hits}, в фильтре отсутствующих={self.negative_hits}, "
+            f"промахов={self.misses}, доля попаданий={self.hit_ratio():.1%}, записей={len(self._entries)}"
+        )
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "negative_size": len(self._missing),
+            "keys": len(self._keys) if self._keys is not None else None,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_ratio": self.hit_ratio(),
+            "miss_ratio": self.misses / lookups if lookups else 0.0,
+            "evicted": self.evicted,
+        }
@@ -0,0 +1,345 @@
+# utils/migrations.py
+#
+# Версионированные миграции схемы на основе PRAGMA user_version.
+# Каждая миграция применяется ровно один раз в собственной транзакции вместе
+# с повышением user_version. Если база уже на последней версии, старт стоит
+# одного чтения PRAGMA — DDL не выполняются вовсе.
+#
+# Новую миграцию добавляют в конец MIGRATIONS; уже выпущенные не меняют.
+
+from __future__ import annotations
+
+import sqlite3
+import time
+from typing import Callable
+
+from utils.logger import get_logger
+
+logger = get_logger("db")
+
+
+def _column_exists(conn: sqlite3.Connection, table: str, column: str) -> bool:
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+
+def _initial_schema(conn: sqlite3.Connection) -> None:
+    """Базовая схема. IF NOT EXISTS — для баз, созданных до появления миграций."""
+    # Таблица пересылок
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS relay_map (
+            forwarded_id INTEGER PRIMARY KEY,
+            original_user_id INTEGER NOT NULL,
+            original_message_id INTEGER NOT NULL,
+            timestamp TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Таблица пользователей
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            has_sent INTEGER DEFAULT 0
+        )
+    """)
+
+    # Таблица пользователей с ограничениями
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS moderation (
+            user_id INTEGER PRIMARY KEY,
+            banned INTEGER DEFAULT 0,
+            banned_at TEXT DEFAULT NULL,
+            muted_until TEXT DEFAULT NULL
+        )
+    """)
+
+    # Таблица пересланных новостей
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS forwarded_news (
+            message_id INTEGER PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            group_msg_id INTEGER,
+            forwarded_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Таблица ответов админов
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS reply_map (
+            admin_msg_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            user_msg_id INTEGER NOT NULL,
+            timestamp TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Таблица благодарностей
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS thanks (
+            user_id INTEGER PRIMARY KEY,
+            name TEXT,
+            count INTEGER DEFAULT 0
+        )
+    """)
+
+
+def _forwarded_news_group_msg_id(conn: sqlite3.Connection) -> None:
+    """forwarded_news, созданная старым init_db(), не имела колонки group_msg_id."""
+    if not _column_exists(conn, "forwarded_news", "group_msg_id"):
+        conn.execute("ALTER TABLE forwarded_news ADD COLUMN group_msg_id INTEGER")
+
+
+def _hot_query_indexes(conn: sqlite3.Connection) -> None:
+    """Индексы под синхронизацию правок, дедупликацию новостей и очистку."""
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_relay_map_user_msg
+        ON relay_map (original_user_id, original_message_id)
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_relay_map_timestamp ON relay_map (timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reply_map_timestamp ON reply_map (timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_forwarded_news_hash ON forwarded_news (content_hash)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_forwarded_news_forwarded_at ON forwarded_news (forwarded_at)")
+
+
+# Текущее время в Unix-секундах как DEFAULT колонки (unixepoch() есть только с SQLite 3.38)
+NOW_EPOCH = "(CAST(strftime('%s', 'now') AS INTEGER))"
+
+
+def _rebuild_table(conn: sqlite3.Connection, table: str, ddl: str, columns: str) -> None:
+    """Пересоздаёт таблицу по новой DDL, перенося данные выражениями columns из старой."""
+    conn.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+    conn.execute(ddl)
+    conn.execute(f"INSERT INTO {table} SELECT {columns} FROM {table}_old")
+    conn.execute(f"DROP TABLE {table}_old")  # вместе со старыми индексами
+
+
+def _to_epoch(column: str, default: str | None = None) -> str:
+    """SQL-выражение: TEXT-дата → Unix-секунды; нераспознанное значение → default (или NULL)."""
+    expr = f"CAST(strftime('%s', {column}) AS INTEGER)"
+    return f"COALESCE({expr}, {default})" if default else expr
+
+
+def _integer_timestamps(conn: sqlite3.Connection) -> None:
+    """
+    TEXT-даты (CURRENT_TIMESTAMP и ISO-строки модерации) → INTEGER Unix-секунды.
+    Сравнения в очистке и проверке мута становятся целочисленными, индексы — меньше.
+    """
+    _rebuild_table(conn, "relay_map", f"""
+        CREATE TABLE relay_map (
+            forwarded_id INTEGER PRIMARY KEY,
+            original_user_id INTEGER NOT NULL,
+            original_message_id INTEGER NOT NULL,
+            timestamp INTEGER NOT NULL DEFAULT {NOW_EPOCH}
+        )
+    """, f"forwarded_id, original_user_id, original_message_id, {_to_epoch('timestamp', NOW_EPOCH)}")
+
+    _rebuild_table(conn, "reply_map", f"""
+        CREATE TABLE reply_map (
+            admin_msg_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            user_msg_id INTEGER NOT NULL,
+            timestamp INTEGER NOT NULL DEFAULT {NOW_EPOCH}
+        )
+    """, f"admin_msg_id, user_id, user_msg_id, {_to_epoch('timestamp', NOW_EPOCH)}")
+
+    _rebuild_table(conn, "forwarded_news", f"""
+        CREATE TABLE forwarded_news (
+            message_id INTEGER PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            group_msg_id INTEGER,
+            forwarded_at INTEGER NOT NULL DEFAULT {NOW_EPOCH}
+        )
+    """, f"message_id, content_hash, group_msg_id, {_to_epoch('forwarded_at', NOW_EPOCH)}")
+
+    _rebuild_table(conn, "moderation", """
+        CREATE TABLE moderation (
+            user_id INTEGER PRIMARY KEY,
+            banned INTEGER DEFAULT 0,
+            banned_at INTEGER DEFAULT NULL,
+            muted_until INTEGER DEFAULT NULL
+        )
+    """, f"user_id, banned, {_to_epoch('banned_at')}, {_to_epoch('muted_until')}")
+
+    _hot_query_indexes(conn)
+
+
+def _thanks_count_index(conn: sqlite3.Connection) -> None:
+    """Индекс под загрузку топа благодарностей при старте: LIMIT k без сортировки таблицы."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_thanks_count ON thanks (count DESC, user_id)")
+
+
+def _thanks_rollups(conn: sqlite3.Connection) -> None:
+    """
+    Бакеты благодарностей по дню, неделе и месяцу (bucket — начало периода в Unix-секундах, UTC).
+    Накопленные ранее счётчики в thanks по датам не разложить — периоды стартуют с нуля.
+    """
+    for table in ("thanks_daily", "thanks_weekly", "thanks_monthly"):
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                bucket INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (bucket, user_id)
+            )
+        """)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_top ON {table} (bucket, count DESC, user_id)")
+
+
+def _relay_map_composite_key(conn: sqlite3.Connection) -> None:
+    """
+    Ключ relay_map — (forwarded_id, original_message_id): одно сообщение в админ-группе
+    может объединять несколько сообщений пользователя (серия коротких текстов).
+    Индекс по сообщению пользователя включает forwarded_id — последняя связь без сортировки.
+    """
+    _rebuild_table(conn, "relay_map", f"""
+        CREATE TABLE relay_map (
+            forwarded_id INTEGER NOT NULL,
+            original_user_id INTEGER NOT NULL,
+            original_message_id INTEGER NOT NULL,
+            timestamp INTEGER NOT NULL DEFAULT {NOW_EPOCH},
+            PRIMARY KEY (forwarded_id, original_message_id)
+        )
+    """, "forwarded_id, original_user_id, original_message_id, timestamp")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_relay_map_user_msg
+        ON relay_map (original_user_id, original_message_id, forwarded_id)
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_relay_map_timestamp ON relay_map (timestamp)")
+
+
+def _news_parts(conn: sqlite3.Connection) -> None:
+    """
+    Все сообщения группы, на которые разошёлся один пост канала (длинный текст режется на части).
+    forwarded_news.group_msg_id остаётся первой частью; порядок частей — порядок group_msg_id.
+    """
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS news_parts (
+            message_id INTEGER NOT NULL,
+            group_msg_id INTEGER NOT NULL,
+            forwarded_at INTEGER NOT NULL DEFAULT {NOW_EPOCH},
+            PRIMARY KEY (message_id, group_msg_id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_news_parts_forwarded_at ON news_parts (forwarded_at)")
+
+
+def _content_hashes(conn: sqlite3.Connection) -> None:
+    """
+    Хеш содержимого, которое бот последним записал в своё сообщение (chat_id, message_id):
+    правка с тем же содержимым не отправляется, из частей длинного поста правятся только изменённые.
+    """
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS content_hashes (
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            content_hash TEXT NOT NULL,
+            timestamp INTEGER NOT NULL DEFAULT {NOW_EPOCH},
+            PRIMARY KEY (chat_id, message_id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_content_hashes_timestamp ON content_hashes (timestamp)")
+
+
+def _without_rowid(conn: sqlite3.Connection) -> None:
+    """
+    Таблицы с составным первичным ключом → WITHOUT ROWID: строки хранятся прямо в B-дереве
+    ключа, без отдельного rowid и дублирующего индекса PRIMARY KEY. Таблицы с INTEGER PRIMARY KEY
+    (reply_map, forwarded_news, moderation, thanks) остаются обычными — там ключ и есть rowid.
+    Очистка выбирает пачки по ключу, а не по rowid (utils/retention.py).
+    """
+    _rebuild_table(conn, "relay_map", f"""
+        CREATE TABLE relay_map (
+            forwarded_id INTEGER NOT NULL,
+            original_user_id INTEGER NOT NULL,
+            original_message_id INTEGER NOT NULL,
+            timestamp INTEGER NOT NULL DEFAULT {NOW_EPOCH},
+            PRIMARY KEY (forwarded_id, original_message_id)
+        ) WITHOUT ROWID
+    """, "forwarded_id, original_user_id, original_message_id, timestamp")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_relay_map_user_msg
+        ON relay_map (original_user_id, original_message_id, forwarded_id)
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_relay_map_timestamp ON relay_map (timestamp)")
+
+    _rebuild_table(conn, "news_parts", f"""
+        CREATE TABLE news_parts (
+            message_id INTEGER NOT NULL,
+            group_msg_id INTEGER NOT NULL,
+            forwarded_at INTEGER NOT NULL DEFAULT {NOW_EPOCH},
+            PRIMARY KEY (message_id, group_msg_id)
+        ) WITHOUT ROWID
+    """, "message_id, group_msg_id, forwarded_at")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_news_parts_forwarded_at ON news_parts (forwarded_at)")
+
+    _rebuild_table(conn, "content_hashes", f"""
+        CREATE TABLE content_hashes (
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            content_hash TEXT NOT NULL,
+            timestamp INTEGER NOT NULL DEFAULT {NOW_EPOCH},
+            PRIMARY KEY (chat_id, message_id)
+        ) WITHOUT ROWID
+    """, "chat_id, message_id, content_hash, timestamp")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_content_hashes_timestamp ON content_hashes (timestamp)")
+
+    for table in ("thanks_daily", "thanks_weekly", "thanks_monthly"):
+        _rebuild_table(conn, table, f"""
+            CREATE TABLE {table} (
+                bucket INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (bucket, user_id)
+            ) WITHOUT ROWID
+        """, "bucket, user_id, count")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_top ON {table} (bucket, count DESC, user_id)")
+
+
+# Порядковый номер миграции = значение user_version после её применения
+MIGRATIONS: list[tuple[str, Callable[[sqlite3.Connection], None]]] = [
+    ("initial schema", _initial_schema),
+    ("forwarded_news.group_msg_id", _forwarded_news_group_msg_id),
+    ("hot query indexes", _hot_query_indexes),
+    ("integer epoch timestamps", _integer_timestamps),
+    ("thanks count index", _thanks_count_index),
+    ("thanks rollups", _thanks_rollups),
+    ("relay_map composite key", _relay_map_composite_key),
+    ("news parts", _news_parts),
+    ("content hashes", _content_hashes),
+    ("without rowid", _without_rowid),
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Доводит схему до SCHEMA_VERSION. Возвращает итоговую версию."""
+    current = get_schema_version(conn)
+    if current == SCHEMA_VERSION:
+        return current
+    if current > SCHEMA_VERSION:
+        logger.warning(
+            f"[DB] Версия схемы {current} новее известной коду ({SCHEMA_VERSION}) — миграции пропущены"
+        )
+        return current
+
+    for version, (description, apply) in enumerate(MIGRATIONS[current:], start=current + 1):
+        started = time.perf_counter()
+        conn.execute("BEGIN")
+        try:
+            apply(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"[DB] Миграция {version} ({description}) не применена")
+            raise
+        logger.info(
+            f"[DB] Миграция {version} ({description}) применена "
+            f"за {(time.perf_counter() - started) * 1000:.1f} мс"
+        )
+
+    return SCHEMA_VERSION
@@ -0,0 +1,122 @@
+# utils/moderation_cache.py
+#
+# In-memory копия таблицы moderation для горячего пути личных сообщений.
+# Загружается целиком при старте (init_db) и обновляется на месте функциями
+# mute_user / unmute_user / ban_user / unban_user из utils/db.py.
+# Проверка "можно ли пересылать" — один dict lookup без обращения к SQLite;
+# muted_until хранится в Unix-секундах, так что проверка — сравнение целых чисел.
+
+from __future__ import annotations
+
+import time
+from typing import Iterable, NamedTuple
+
+from utils.logger import get_logger
+
+logger = get_logger("db")
+
+BANNED = "banned"
+MUTED = "muted"
+
+
+class ModerationEntry(NamedTuple):
+    banned: bool
+    banned_at: int | None    # Unix-секунды
+    muted_until: int | None  # Unix-секунды
+
+
+class ModerationCache:
+    """
+    Кэш ограничений пользователей: user_id -> ModerationEntry.
+
+    В кэше хранятся только пользователи с активным баном или заданным muted_until,
+    поэтому его размер не растёт с числом обычных пользователей.
+    Записи неизменяемы и заменяются целиком — чтение из event loop безопасно
+    при обновлении с потока-писателя.
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[int, ModerationEntry] = {}
+
+    def load(self, rows: Iterable[tuple[int, int, int | None, int | None]]) -> None:
+        """Заполняет кэш строками (user_id, banned, banned_at, muted_until)."""
+        entries = {}
+        for user_id, banned, banned_at, muted_until in rows:
+            entry = ModerationEntry(bool(banned), banned_at, muted_until)
+            if entry.banned or entry.muted_until is not None:
+                entries[user_id] = entry
+        self._entries = entries
+        logger.info(f"[DB] Кэш модерации загружен: {len(entries)} пользователей с ограничениями")
+
+    # --- Обновления (вызываются после успешного commit) ---
+
+    def _store(self, user_id: int, entry: ModerationEntry) -> None:
+        if entry.banned or entry.muted_until is not None:
+            self._entries[user_id] = entry
+        else:
+            self._entries.pop(user_id, None)
+
+    def _current(self, user_id: int) -> ModerationEntry:
+        return self._entries.get(user_id) or ModerationEntry(False, None, None)
+
+    def set_muted(self, user_id: int, muted_until: int) -> None:
+        self._store(user_id, self._current(user_id)._replace(muted_until=muted_until))
+
+    def clear_mute(self, user_id: int) -> None:
+        self._store(user_id, self._current(user_id)._replace(muted_until=None))
+
+    def set_banned(self, user_id: int, banned_at: int) -> None:
+        self._store(user_id, self._current(user_id)._replace(banned=True, banned_at=banned_at))
+
+    def clear_ban(self, user_id: int) -> None:
+        self._store(user_id, self._current(user_id)._replace(banned=False, banned_at=None))
+
+    # --- Чтение ---
+
+    def restriction(self, user_id: int) -> str | None:
+        """BANNED, MUTED или None — единственная проверка на каждое личное сообщение."""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if entry.banned:
+            return BANNED
+        if entry.muted_until is not None and time.time() < entry.muted_until:
+            return MUTED
+        return None
+
+    def is_banned(self, user_id: int) -> bool:
+        entry = self._entries.get(user_id)
+        return entry is not None and entry.banned
+
+    def is_muted(self, user_id: int) -> bool:
+        entry = self._entries.get(user_id)
+        return (
+            entry is not None
+            and entry.muted_until is not None
+            and time.time() < entry.muted_until
+        )
+
+    def muted_until(self, user_id: int) -> int | None:
+        entry = self._entries.get(user_id)
+        return entry.muted_until if entry is not None else None
+
+    def mute_deadlines(self) -> list[tuple[int, int]]:
+        """Пары (muted_until, user_id) всех заданных мутов — для планировщика истечения."""
+        return [
+            (entry.muted_until, user_id)
+            for user_id, entry in self._entries.items()
+            if entry.muted_until is not None
+        ]
+
+    def status(self, user_id: int) -> dict:
+        entry = self._current(user_id)
+        return {
+            "banned": entry.banned,
+            "banned_at": entry.banned_at,
+            "muted": self.is_muted(user_id),
+            "muted_until": entry.muted_until,
+        }
+
+    @property
+    def size(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,141 @@
+# utils/mute_scheduler.py
+#
+# Снятие мутов точно в момент истечения вместо ленивого unmute внутри is_muted().
+# Сроки muted_until лежат в min-куче (heapq); фоновая задача спит до ближайшего
+# срока, снимает все истёкшие муты одной транзакцией на потоке-писателе и, если
+# задан notify, уведомляет пользователей. Проверка на горячем пути только читает кэш.
+#
+# Куча не чистится при повторном /mute или /unmute: устаревший элемент
+# распознаётся при извлечении по несовпадению с muted_until в кэше модерации.
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import time
+from typing import Awaitable, Callable
+
+from utils.logger import get_logger
+from utils.moderation_cache import ModerationCache
+
+logger = get_logger("db")
+
+
+class MuteExpiryScheduler:
+    """
+    Планировщик истечения мутов.
+
+    Args:
+        cache: Кэш модерации — источник актуальных muted_until.
+        run: Корутина-исполнитель синхронной функции (в боте — поток-писатель utils/async_db.py).
+        expire: Синхронная функция снятия мутов: (user_ids, now) -> список реально размьюченных.
+        batch_size: Максимум пользователей в одной транзакции.
+    """
+
+    def __init__(
+        self,
+        cache: ModerationCache,
+        run: Callable[..., Awaitable[list[int]]],
+        expire: Callable[[list[int], int], list[int]],
+        batch_size: int = 100,
+    ) -> None:
+        self._cache = cache
+        self._run = run
+        self._expire = expire
+        self.batch_size = batch_size
+        # Уведомление пользователя; подставляется при старте бота (бот пересоздаётся при рестарте polling)
+        self.notify: Callable[[int], Awaitable[None]] | None = None
+
+        self._heap: list[tuple[int, int]] = []  # (muted_until, user_id)
+        self._wakeup: asyncio.Event | None = None
+
+    def load(self) -> None:
+        """Заполняет кучу сроками из кэша модерации (после init_db)."""
+        self._heap = self._cache.mute_deadlines()
+        heapq.heapify(self._heap)
+        logger.info(f"[DB] Планировщик мутов: загружено сроков={len(self._heap)}")
+        self._wake()
+
+    def schedule(self, user_id: int, muted_until: int) -> None:
+        """Добавляет срок нового мута; будит задачу, если он ближе текущего."""
+        heapq.heappush(self._heap, (muted_until, user_id))
+        if self._heap[0] == (muted_until, user_id):
+            self._wake()
+
+    def _wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    @property
+    def size(self) -> int:
+        return len(self._heap)
+
+    def next_deadline(self) -> int | None:
+        return self._heap[0][0] if self._heap else None
+
+    def _pop_due(self, now: int) -> list[int]:
+        """Извлекает до batch_size истёкших и ещё актуальных мутов."""
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            muted_until, user_id = heapq.heappop(self._heap)
+            if self._cache.muted_until(user_id) == muted_until:
+                due.append(user_id)
+        return due
+
+    async def run_once(self, now: int | None = None) -> list[int]:
+        """Снимает все истёкшие на момент now муты. Возвращает размьюченных пользователей."""
+        now = int(time.time()) if now is None else now
+        expired = []
+        while True:
+            due = self._pop_due(now)
+            if not due:
+                break
+            started = time.perf_counter()
+            try:
+                unmuted = await self._run(self._expire, due, now)
+            except Exception:
+                # Вернуть сроки в кучу, чтобы повторить на следующем проходе
+                for user_id in due:
+                    muted_until = self._cache.muted_until(user_id)
+                    if muted_until is not None:
+                        heapq.heappush(self._heap, (muted_until, user_id))
+                raise
+            logger.info(
+                f"[DB] Муты истекли: размьючено={len(unmuted)} "
+                f"за {(time.perf_counter() - started) * 1000:.1f} мс"
+            )
+            expired.extend(unmuted)
+
+        if self.notify is not None:
+            for user_id in expired:
+                try:
+                    await self.notify(user_id)
+                except Exception as e:
+                    logger.warning(f"[DB] Не удалось уведомить об окончании мута user_id={user_id}: {e}")
+        return expired
+
+    async def run_forever(self) -> None:
+        self._wakeup = asyncio.Event()
+        try:
+            while True:
+                self._wakeup.clear()
+                deadline = self.next_deadline()
+                if deadline is None:
+                    await self._wakeup.wait()
+                    continue
+
+                delay = deadline - time.time()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                        continue  # появился более ранний срок — пересчитать
+                    except asyncio.TimeoutError:
+                        pass
+
+                try:
+                    await self.run_once()
+                except Exception as e:
+                    logger.error(f"[DB] Ошибка снятия истёкших мутов: {e}")
+                    await asyncio.sleep(5)
+        finally:
+            self._wakeup = None
@@ -0,0 +1,84 @@
+# utils/news_db.py
+
+from utils.config import NEWS_DEDUP_CAPACITY, NEWS_DEDUP_RECENT
+from utils.db_connection import get_connection
+from utils.logger import get_logger
+from utils.news_dedup import NewsDedupIndex
+
+logger = get_logger("news_db")
+logger.info("[NEWS_DB] news_db.py загружен")
+
+# Хеши пересланных постов в памяти: новый пост проверяется без обращения к SQLite
+dedup_index = NewsDedupIndex(capacity=NEWS_DEDUP_CAPACITY, recent_size=NEWS_DEDUP_RECENT)
+
+def load_dedup_index():
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT content_hash, forwarded_at FROM forwarded_news ORDER BY forwarded_at")
+        dedup_index.load(cursor.fetchall())
+
+def get_forwarded_hashes() -> list[str]:
+    """Все хеши в пределах срока хранения — для пересборки фильтра после очистки."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT content_hash FROM forwarded_news")
+        return [row[0] for row in cursor.fetchall()]
+
+def is_hash_already_forwarded(content_hash: str) -> bool:
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM forwarded_news WHERE content_hash = ?", (content_hash,))
+        result = cursor.fetchone()
+        return result is not None
+
+SAVE_FORWARDED_NEWS_SQL = """
+    INSERT OR REPLACE INTO forwarded_news (message_id, content_hash, group_msg_id)
+    VALUES (?, ?, ?)
+"""
+
+def save_forwarded_news(message_id: int, content_hash: str, group_msg_id: int = None):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(SAVE_FORWARDED_NEWS_SQL, (message_id, content_hash, group_msg_id))
+        conn.commit()
+    dedup_index.add(content_hash)
+
+SAVE_NEWS_PART_SQL = """
+    INSERT OR IGNORE INTO news_parts (message_id, group_msg_id)
+    VALUES (?, ?)
+"""
+
+def save_news_parts(message_id: int, group_msg_ids: list[int]):
+    with get_connection() as conn:
+        conn.executemany(SAVE_NEWS_PART_SQL, [(message_id, gid) for gid in group_msg_ids])
+        conn.commit()
+
+def delete_news_parts(message_id: int, group_msg_ids: list[int]):
+    with get_connection() as conn:
+        conn.executemany(
+            "DELETE FROM news_parts WHERE message_id = ? AND group_msg_id = ?",
+            [(message_id, gid) for gid in group_msg_ids],
+        )
+        conn.commit()
+
+def get_group_msg_ids(message_id: int) -> list[int]:
+    """Все части поста в группе по порядку; для записей без частей — только group_msg_id."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT group_msg_id FROM news_parts WHERE message_id = ? ORDER BY group_msg_id",
+            (message_id,),
+        )
+        parts = [row[0] for row in cursor.fetchall()]
+        if parts:
+            return parts
+        cursor.execute("SELECT group_msg_id FROM forwarded_news WHERE message_id = ?", (message_id,))
+        result = cursor.fetchone()
+        return [result[0]] if result and result[0] is not None else []
+
+def get_group_msg_id(message_id: int) -> int | None:
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT group_msg_id FROM forwarded_news WHERE message_id = ?", (message_id,))
+        result = cursor.fetchone()
+        return result[0] if result else None
@@ -0,0 +1,157 @@
+# utils/news_dedup.py
+#
+# In-memory индекс дедупликации новостей для forward_news.
+# Проверка "пост уже пересылался" идёт на каждый пост канала, и почти всегда ответ —
+# "нет": индекс отвечает на него без обращения к SQLite.
+#
+# - Точное множество последних хешей (recent): повторы свежих постов — самый частый
+#   случай дубля — подтверждаются сразу.
+# - Фильтр Блума по всем хешам в пределах срока хранения forwarded_news: если хеша нет
+#   в фильтре, поста точно не было. Ложноположительный ответ фильтра ("может быть")
+#   лишь отправляет проверку в базу, поэтому на корректность не влияет.
+#
+# Загружается из forwarded_news при старте (init_db), пополняется при каждом
+# save_forwarded_news (до записи в базу — через write-behind). Из фильтра Блума
+# удалять нельзя, поэтому после очистки forwarded_news он пересобирается из базы
+# (rebuild); хеши, добавленные во время пересборки, и recent переносятся в новый фильтр.
+
+from __future__ import annotations
+
+import hashlib
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Iterable
+
+from utils.logger import get_logger
+
+logger = get_logger("news_db")
+
+
+class BloomFilter:
+    """
+    Args:
+        capacity: Ожидаемое число элементов.
+        error_rate: Допустимая доля ложноположительных ответов при capacity элементах.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01) -> None:
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str) -> list[int]:
+        # Двойное хеширование: k позиций из двух 64-битных половин одного blake2b
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class NewsDedupIndex:
+    """
+    Args:
+        capacity: Ожидаемое число хешей за срок хранения (размер фильтра Блума).
+        recent_size: Сколько последних хешей хранить точно.
+        error_rate: Доля ложноположительных ответов фильтра при capacity хешах.
+    """
+
+    def __init__(self, capacity: int = 10000, recent_size: int = 1000, error_rate: float = 0.01) -> None:
+        self.capacity = capacity
+        self.recent_size = recent_size
+        self.error_rate = error_rate
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._recent: OrderedDict[str, int] = OrderedDict()  # content_hash -> forwarded_at
+        self._added_during_rebuild: list[str] | None = None
+
+        # Метрики
+        self.known = 0      # дубль найден в recent
+        self.new = 0        # фильтр Блума: точно новый пост
+        self.uncertain = 0  # "может быть" — решает база
+
+    def _bloom_for(self, count: int) -> BloomFilter:
+        # Фильтр с запасом: переполненный фильтр быстро теряет точность
+        return BloomFilter(max(self.capacity, count * 2), self.error_rate)
+
+    def load(self, rows: Iterable[tuple[str, int]]) -> None:
+        """Заполняет индекс строками (content_hash, forwarded_at), упорядоченными по времени."""
+        rows = list(rows)
+        bloom = self._bloom_for(len(rows))
+        recent: OrderedDict[str, int] = OrderedDict()
+        for content_hash, forwarded_at in rows:
+            bloom.add(content_hash)
+            recent[content_hash] = forwarded_at or 0
+            recent.move_to_end(content_hash)
+            if len(recent) > self.recent_size:
+                recent.popitem(last=False)
+        self._bloom = bloom
+        self._recent = recent
+        logger.info(f"[NEWS_DB] Индекс дедупликации загружен: {len(rows)} хешей")
+
+    def add(self, content_hash: str, forwarded_at: int | None = None) -> None:
+        """Пост переслан — его хеш сразу виден проверкам."""
+        self._bloom.add(content_hash)
+        self._recent[content_hash] = int(time.time()) if forwarded_at is None else forwarded_at
+        self._recent.move_to_end(content_hash)
+        if len(self._recent) > self.recent_size:
+            self._recent.popitem(last=False)
+        if self._added_during_rebuild is not None:
+            self._added_during_rebuild.append(content_hash)
+
+    def check(self, content_hash: str) -> bool | None:
+        """True — пост уже пересылался, False — точно нет, None — нужно проверить в базе."""
+        if content_hash in self._recent:
+            self.known += 1
+            return True
+        if content_hash not in self._bloom:
+            self.new += 1
+            return False
+        self.uncertain += 1
+        return None
+
+    def expire(self, cutoff: int) -> None:
+        """Очистка удалила записи старше cutoff — убираем их из точного множества."""
+        for content_hash in [h for h, ts in self._recent.items() if ts < cutoff]:
+            del self._recent[content_hash]
+
+    def begin_rebuild(self) -> bool:
+        """Начинает пересборку; False — пересборка уже идёт."""
+        if self._added_during_rebuild is not None:
+            return False
+        self._added_during_rebuild = []
+        return True
+
+    def cancel_rebuild(self) -> None:
+        """Чтение из базы не удалось — остаёмся со старым фильтром (он лишь менее точен)."""
+        self._added_during_rebuild = None
+
+    def finish_rebuild(self, hashes: Iterable[str]) -> None:
+        """Новый фильтр из хешей базы плюс всё, что ещё не в базе или добавлено во время чтения."""
+        hashes = list(hashes)
+        added = self._added_during_rebuild or []
+        self._added_during_rebuild = None
+        bloom = self._bloom_for(len(hashes))
+        for content_hash in (*hashes, *self._recent, *added):
+            bloom.add(content_hash)
+        self._bloom = bloom
+        logger.debug(f"[NEWS_DB] Фильтр дедупликации пересобран: {bloom.count} хешей")
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "recent": len(self._recent),
+            "bloom_items": self._bloom.count,
+            "bloom_bits": self._bloom.size,
+            "known": self.known,
+            "new": self.new,
+            "uncertain": self.uncertain,
+        }
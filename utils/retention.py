@@ -0,0 +1,132 @@
+# utils/retention.py
+#
+# Инкрементальная очистка устаревших записей вместо суточного DELETE без LIMIT.
+# Каждая таблица чистится небольшими пачками (batch_size строк, отдельная
+# короткая транзакция на потоке-писателе), между пачками — пауза, чтобы
+# блокировка записи не удерживалась долго и обычные записи успевали проходить.
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Awaitable, Callable, NamedTuple
+
+from utils.config import (
+    RETENTION_BATCH_PAUSE_MS,
+    RETENTION_BATCH_SIZE,
+    RETENTION_CONTENT_HASHES_DAYS,
+    RETENTION_FORWARDED_NEWS_DAYS,
+    RETENTION_INTERVAL_MIN,
+    RETENTION_RELAY_MAP_DAYS,
+    RETENTION_REPLY_MAP_DAYS,
+    RETENTION_THANKS_DAILY_DAYS,
+)
+from utils.db_connection import get_connection
+from utils.logger import get_logger
+
+logger = get_logger("cleanup")
+
+
+class RetentionPolicy(NamedTuple):
+    table: str
+    key_column: str   # первичный ключ (составной — через запятую), по нему удаляется пачка
+    time_column: str  # Unix-секунды, по нему выбираются устаревшие строки (индексирован)
+    days: int
+
+
+DEFAULT_POLICIES = [
+    # Таблицы с составным ключом — WITHOUT ROWID, пачка выбирается по полному ключу
+    RetentionPolicy("relay_map", "forwarded_id, original_message_id", "timestamp", RETENTION_RELAY_MAP_DAYS),
+    RetentionPolicy("reply_map", "admin_msg_id", "timestamp", RETENTION_REPLY_MAP_DAYS),
+    RetentionPolicy("forwarded_news", "message_id", "forwarded_at", RETENTION_FORWARDED_NEWS_DAYS),
+    RetentionPolicy("news_parts", "message_id, group_msg_id", "forwarded_at", RETENTION_FORWARDED_NEWS_DAYS),
+    RetentionPolicy("content_hashes", "chat_id, message_id", "timestamp", RETENTION_CONTENT_HASHES_DAYS),
+    # Недельные и месячные итоги хранятся отдельно — дневные бакеты нужны только для истории
+    RetentionPolicy("thanks_daily", "bucket, user_id", "bucket", RETENTION_THANKS_DAILY_DAYS),
+]
+
+
+def delete_batch(policy: RetentionPolicy, cutoff: int, limit: int) -> int:
+    """Удаляет не более limit самых старых строк старше cutoff. Возвращает число удалённых."""
+    with get_connection() as conn:
+        cursor = conn.execute(
+            f"""
+            DELETE FROM {policy.table} WHERE ({policy.key_column}) IN (
+                SELECT {policy.key_column} FROM {policy.table}
+                WHERE {policy.time_column} < ?
+                ORDER BY {policy.time_column}
+                LIMIT ?
+            )
+            """,
+            (cutoff, limit),
+        )
+        return cursor.rowcount
+
+
+class RetentionEngine:
+    """
+    Фоновая очистка по политикам хранения.
+
+    Args:
+        run: Корутина-исполнитель синхронной функции (в боте — поток-писатель utils/async_db.py).
+        policies: Таблицы и сроки хранения.
+        batch_size: Максимум строк в одной транзакции DELETE.
+        batch_pause: Пауза между пачками, секунды.
+        interval: Пауза между полными проходами, секунды.
+        on_purged: Вызывается on_purged(table, cutoff), когда из таблицы что-то удалено
+            (в боте — сброс устаревших записей кэшей utils/lookup_cache.py).
+    """
+
+    def __init__(
+        self,
+        run: Callable[..., Awaitable[int]],
+        policies: list[RetentionPolicy] = DEFAULT_POLICIES,
+        batch_size: int = RETENTION_BATCH_SIZE,
+        batch_pause: float = RETENTION_BATCH_PAUSE_MS / 1000,
+        interval: float = RETENTION_INTERVAL_MIN * 60,
+        on_purged: Callable[[str, int], None] | None = None,
+    ) -> None:
+        self._run = run
+        self.policies = policies
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.interval = interval
+        self.on_purged = on_purged
+
+    async def purge(self, policy: RetentionPolicy) -> int:
+        """Чистит одну таблицу до конца, пачками. Возвращает общее число удалённых строк."""
+        cutoff = int(time.time()) - policy.days * 86400
+        total = 0
+        while True:
+            started = time.perf_counter()
+            deleted = await self._run(delete_batch, policy, cutoff, self.batch_size)
+            total += deleted
+            logger.debug(
+                f"[CLEANUP] {policy.table}: пачка удалено={deleted} "
+                f"за {(time.perf_counter() - started) * 1000:.1f} мс"
+            )
+            if deleted < self.batch_size:
+                if total and self.on_purged is not None:
+                    self.on_purged(policy.table, cutoff)
+                return total
+            await asyncio.sleep(self.batch_pause)
+
+    async def run_once(self) -> dict[str, int]:
+        """Один полный проход по всем политикам."""
+        report = {}
+        for policy in self.policies:
+            started = time.perf_counter()
+            report[policy.table] = await self.purge(policy)
+            logger.info(
+                f"[CLEANUP] {policy.table}: удалено {report[policy.table]} строк старше "
+                f"{policy.days} дн. за {(time.perf_counter() - started) * 1000:.1f} мс"
+            )
+        return report
+
+    async def run_forever(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as exc:
+                logger.error(f"[CLEANUP] Ошибка очистки: {exc}")
+            await asyncio.sleep(self.interval)
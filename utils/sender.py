@@ -1,10 +1,15 @@
 # utils/sender.py
 
+import hashlib
+from typing import NamedTuple
+
 from aiogram import Bot
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import Message, MessageEntity, InputMediaPhoto, InputMediaVideo, InputMediaDocument, InputMediaAudio, InputMediaAnimation
 from aiogram.client.default import Default
 from utils.logger import get_logger
+from utils.html_split import rendered_utf16_len, split_html
+from utils.text_split import Utf16Index, split_spans
 
 logger = get_logger("sender")
 logger.info("[SENDER] sender.py загружен")
@@ -12,67 +17,362 @@ logger.info("[SENDER] sender.py загружен")
 MAX_CAPTION = 1024
 MAX_TEXT = 4096
 
-def split_text(text: str, limit: int) -> list[str]:
-    """Разбивает текст на части по limit символов."""
-    return [text[i:i+limit] for i in range(0, len(text), limit)]
-
 def utf16_len(s: str) -> int:
     """Возвращает длину строки в единицах UTF-16 (как ожидает Telegram API)."""
     return len(s.encode('utf-16-le')) // 2
 
+def split_entities(
+    entities: list[MessageEntity] | None,
+    bounds: list[tuple[int, int]],
+) -> list[list[MessageEntity]]:
+    """
+    Раскладывает entities по кускам текста за один проход.
+
+    bounds — возрастающие непересекающиеся границы кусков [start, end) в единицах UTF-16.
+    Entities сортируются один раз, затем границы кусков "заметаются" слева направо:
+    в активном списке остаются только entities, выходящие за конец текущего куска.
+    Новый MessageEntity создаётся (model_copy, без повторной валидации) лишь когда
+    меняются offset или length; прочие поля (url, user, custom_emoji_id...) сохраняются.
+    """
+    result: list[list[MessageEntity]] = [[] for _ in bounds]
+    if not entities:
+        return result
+
+    ordered = sorted(entities, key=lambda ent: (ent.offset, -ent.length))
+    active: list[MessageEntity] = []
+    i = 0
+    for chunk, (start, end) in zip(result, bounds):
+        while i < len(ordered) and ordered[i].offset < end:
+            active.append(ordered[i])
+            i += 1
+
+        spanning = []
+        for ent in active:
+            ent_end = ent.offset + ent.length
+            clipped_start = max(ent.offset, start)
+            clipped_end = min(ent_end, end)
+            if clipped_end > clipped_start:
+                offset = clipped_start - start
+                length = clipped_end - clipped_start
+                if offset == ent.offset and length == ent.length:
+                    chunk.append(ent)
+                else:
+                    chunk.append(ent.model_copy(update={"offset": offset, "length": length}))
+            if ent_end > end:
+                spanning.append(ent)
+        active = spanning
+
+    return result
+
 def slice_entities(entities: list[MessageEntity] | None, start: int, end: int) -> list[MessageEntity]:
     """Пересчитывает entities для куска текста [start, end)."""
-    new_entities = []
-    for ent in entities or []:
-        ent_start = ent.offset
-        ent_end = ent.offset + ent.length
-
-        # полностью внутри куска
-        if ent_start >= start and ent_end <= end:
-            new_entities.append(
-                MessageEntity(
-                    type=ent.type,
-                    offset=ent_start - start,
-                    length=ent.length,
-                    url=ent.url,
-                    user=ent.user,
-                    language=ent.language
-                )
-            )
-        # пересекает границу — обрезаем
-        elif ent_start < end and ent_end > start:
-            clipped_start = max(ent_start, start)
-            clipped_end = min(ent_end, end)
-            new_entities.append(
-                MessageEntity(
-                    type=ent.type,
-                    offset=clipped_start - start,
-                    length=clipped_end - clipped_start,
-                    url=ent.url,
-                    user=ent.user,
-                    language=ent.language
-                )
-            )
-    return new_entities
+    return split_entities(entities, [(start, end)])[0]
 
 def shift_entities(entities: list[MessageEntity] | None, offset: int) -> list[MessageEntity]:
     """Смещает все entities на заданный offset."""
     if not entities or offset == 0:
         return entities or []
-    
-    new_entities = []
-    for ent in entities:
-        new_entities.append(
-            MessageEntity(
-                type=ent.type,
-                offset=ent.offset + offset,
-                length=ent.length,
-                url=ent.url,
-                user=ent.user,
-                language=ent.language
+
+    return [ent.model_copy(update={"offset": ent.offset + offset}) for ent in entities]
+
+def split_message_text(
+    text: str,
+    entities: list[MessageEntity] | None,
+    limit: int,
+    parse_mode: str | None,
+) -> list[tuple[str, list[MessageEntity] | None]]:
+    """
+    Части текста не длиннее limit единиц UTF-16 вместе с их entities.
+    HTML режется с сохранением тегов (utils/html_split.py), обычный текст — по границам
+    из utils/text_split.py с пересчётом entities по смещениям UTF-16.
+    """
+    if parse_mode == "HTML":
+        return [(chunk, None) for chunk in split_html(text, limit)]
+
+    text_index = Utf16Index(text)
+    spans = split_spans(text, limit, text_index)
+    bounds = [(text_index.offset(start), text_index.offset(end)) for start, end in spans]
+    chunk_entities = split_entities(entities, bounds)
+    return [(text[start:end], ents) for (start, end), ents in zip(spans, chunk_entities)]
+
+def split_caption_text(
+    text: str,
+    entities: list[MessageEntity] | None,
+    parse_mode: str | None,
+) -> list[tuple[str, list[MessageEntity] | None]]:
+    """
+    Части подписи медиа: первая — не длиннее MAX_CAPTION, хвост уходит обычными
+    сообщениями и режется заново по MAX_TEXT.
+    """
+    head, *rest = split_message_text(text, entities, MAX_CAPTION, parse_mode) or [("", None)]
+    if not rest:
+        return [head] if head[0] else []
+    if parse_mode == "HTML":
+        # Части склеиваются в ту же отображаемую строку, каждая — корректная разметка
+        remainder, remainder_entities = "".join(chunk for chunk, _ in rest), None
+    else:
+        remainder = text[len(head[0]):]
+        remainder_entities = slice_entities(entities, utf16_len(head[0]), utf16_len(text))
+    return [head, *split_message_text(remainder, remainder_entities, MAX_TEXT, parse_mode)]
+
+def compose_text(
+    message: Message,
+    prefix: str = "",
+    prefix_entities: list[MessageEntity] | None = None,
+    suffix: str = "",
+    parse_mode: str | None = "HTML",
+) -> tuple[str, list[MessageEntity] | None]:
+    """
+    Текст/подпись сообщения с префиксом и суффиксом.
+    В режиме HTML entities уже "зашиты" в разметку и возвращается None,
+    иначе entities сообщения смещаются на длину префикса (UTF-16).
+    """
+    if parse_mode == "HTML":
+        # Используем встроенный метод aiogram для получения HTML-разметки
+        # Он корректно обрабатывает и text, и caption.
+        return prefix + (message.html_text or "") + (suffix or ""), None
+
+    raw_content = message.caption or message.text or ""
+    entities = list(prefix_entities or [])
+    original_entities = message.caption_entities or message.entities or []
+    if original_entities:
+        entities.extend(shift_entities(original_entities, utf16_len(prefix)))
+    return prefix + raw_content + (suffix or ""), entities or None
+
+def album_caption_index(album: list[Message]) -> int:
+    """Индекс элемента с подписью в упорядоченном альбоме (0, если подписи нет)."""
+    return next((i for i, msg in enumerate(album) if msg.caption), 0)
+
+class SentAlbum(list):
+    """
+    Сообщения, отправленные send_album_to_group, и их источники.
+    sources[i] — message_id элемента альбома, к которому относится i-е отправленное сообщение.
+    headers — message_id отдельных сообщений с префиксом/суффиксом (при copy_messages):
+    они относятся к элементу с подписью, но не содержат её текста.
+    copied — альбом ушёл через copy_messages с исходными подписями.
+    """
+
+    def __init__(self, messages=(), sources: list[int] = (), copied: bool = False) -> None:
+        super().__init__(messages)
+        self.sources = list(sources)
+        self.headers: set[int] = set()
+        self.copied = copied
+
+def sent_part_pairs(sources: list[Message], sent: list, headers: bool = True) -> list[tuple[int, int]]:
+    """
+    Пары (message_id источника, message_id отправленного) для отправленных сообщений.
+    Одиночное сообщение: все его части — к нему. Альбом: как записал send_album_to_group (SentAlbum) —
+    при send_media_group подпись перенесена в первый элемент, при copy_messages элементы идут попарно,
+    а отдельное сообщение с префиксом/суффиксом относится к элементу с подписью.
+    headers=False — без таких сообщений: правка подписи и хеши частей их не касаются.
+    Части одного источника идут по возрастанию message_id — это и есть порядок частей.
+    """
+    if isinstance(sent, SentAlbum):
+        return [
+            (source_id, msg.message_id)
+            for source_id, msg in zip(sent.sources, sent)
+            if headers or msg.message_id not in sent.headers
+        ]
+    if len(sources) <= 1:
+        return [(sources[0].message_id, msg.message_id) for msg in sent] if sources else []
+    ordered = sorted(sources, key=lambda m: m.message_id)
+    return [(source.message_id, msg.message_id) for source, msg in zip(ordered, sent)]
+
+def _input_media(msg: Message, caption: str, entities: list[MessageEntity] | None, parse_mode: str | None):
+    """InputMedia для элемента альбома или None, если тип нельзя отправить через send_media_group."""
+    kwargs = {
+        "caption": caption or None,
+        "caption_entities": entities if not parse_mode else None,
+        "parse_mode": parse_mode,
+    }
+    if msg.photo:
+        return InputMediaPhoto(media=msg.photo[-1].file_id, **kwargs)
+    if msg.video:
+        return InputMediaVideo(media=msg.video.file_id, **kwargs)
+    if msg.document:
+        return InputMediaDocument(media=msg.document.file_id, **kwargs)
+    if msg.audio:
+        return InputMediaAudio(media=msg.audio.file_id, **kwargs)
+    return None
+
+async def send_album_to_group(
+    album: list[Message],
+    bot: Bot,
+    chat_id: int,
+    prefix: str = "",
+    prefix_entities: list[MessageEntity] | None = None,
+    suffix: str = "",
+    thread_id: int | None = None,
+    parse_mode: str | None = "HTML"
+) -> SentAlbum:
+    """
+    Пересылка альбома целиком одним send_media_group.
+    Префикс и суффикс попадают в подпись первого элемента (её Telegram показывает под альбомом),
+    хвост подписи длиннее 1024 уходит отдельными сообщениями (по 4096).
+    Если в альбоме есть тип, который нельзя собрать в InputMedia, или Telegram отклонил группу,
+    альбом копируется одним copy_messages, а префикс/суффикс — отдельным сообщением перед ним.
+    Возвращает все отправленные сообщения (для copy_messages — MessageId с тем же message_id)
+    вместе с элементом-источником каждого (SentAlbum.sources).
+    """
+    album = sorted(album, key=lambda m: m.message_id)
+    logger.info(f"[SENDER] send_album_to_group: items={len(album)}, chat_id={chat_id}, thread_id={thread_id}, suffix_len={len(suffix)}")
+
+    thread = {"message_thread_id": int(thread_id)} if thread_id is not None else {}
+
+    # Подпись альбома обычно у одного элемента; переносим её с префиксом/суффиксом в первый
+    caption_idx = album_caption_index(album)
+    caption, caption_entities = compose_text(album[caption_idx], prefix, prefix_entities, suffix, parse_mode)
+    caption_len = rendered_utf16_len(caption) if parse_mode == "HTML" else utf16_len(caption)
+    overflow: list[tuple[str, list[MessageEntity] | None]] = []
+    if caption_len > MAX_CAPTION:
+        (caption, caption_entities), *overflow = split_caption_text(caption, caption_entities, parse_mode)
+
+    media = []
+    for i, msg in enumerate(album):
+        if i == 0:
+            item_caption, item_entities = caption, caption_entities
+        elif i == caption_idx:
+            item_caption, item_entities = "", None
+        else:
+            item_caption, item_entities = compose_text(msg, parse_mode=parse_mode)
+        media.append(_input_media(msg, item_caption, item_entities, parse_mode))
+
+    sent_messages = SentAlbum()
+    if all(media):
+        try:
+            sent_messages.extend(await bot.send_media_group(chat_id=chat_id, media=media, **thread))
+            # Подпись (и её хвост) относится к элементу с подписью, а его позиция — к первому элементу
+            order = list(range(len(album)))
+            order[0], order[caption_idx] = caption_idx, 0
+            sent_messages.sources = [album[i].message_id for i in order] + [album[caption_idx].message_id] * len(overflow)
+            logger.info("[SENDER] Использован send_media_group (album)")
+        except TelegramBadRequest as e:
+            logger.warning(f"[SENDER] send_media_group failed: {e}, fallback на copy_messages")
+
+    if not sent_messages:
+        # copy_messages сохраняет группировку и исходные подписи; префикс/суффикс — отдельным
+        # сообщением перед альбомом, как заголовок в подписи send_media_group
+        sent_messages.copied = True
+        extra_text = prefix + (suffix or "")
+        header = split_message_text(extra_text, prefix_entities, MAX_TEXT, parse_mode) if extra_text.strip() else []
+        try:
+            for chunk, chunk_entities in header:
+                extra = await bot.send_message(
+                    chat_id=chat_id,
+                    text=chunk,
+                    entities=chunk_entities if not parse_mode else None,
+                    parse_mode=parse_mode,
+                    **thread
+                )
+                # Заголовок — к элементу с подписью: ответ на него тоже находит автора
+                sent_messages.append(extra)
+                sent_messages.sources.append(album[caption_idx].message_id)
+                sent_messages.headers.add(extra.message_id)
+            copied = await bot.copy_messages(
+                chat_id=chat_id,
+                from_chat_id=album[0].chat.id,
+                message_ids=[msg.message_id for msg in album],
+                **thread
             )
-        )
-    return new_entities
+            sent_messages.extend(copied)
+            sent_messages.sources += [msg.message_id for msg in album]
+            logger.info("[SENDER] Использован copy_messages (album)")
+        except TelegramBadRequest as e:
+            # Как и для одиночного сообщения: ошибку пишем в лог и возвращаем то, что успели отправить
+            logger.error(f"[SENDER] copy_messages failed: {e}")
+        return sent_messages
+
+    try:
+        for chunk, chunk_entities in overflow:
+            sent_messages.append(await bot.send_message(
+                chat_id=chat_id,
+                text=chunk,
+                entities=chunk_entities if not parse_mode else None,
+                parse_mode=parse_mode,
+                **thread
+            ))
+    except TelegramBadRequest as e:
+        logger.error(f"[SENDER] Не удалось отправить хвост подписи альбома: {e}")
+
+    return sent_messages
+
+def content_hash(chunk: str, parse_mode: str | None = "HTML") -> str:
+    """Короткий хеш содержимого части — с ним сравнивается правка."""
+    return hashlib.blake2b(f"{parse_mode}\x00{chunk}".encode("utf-8"), digest_size=8).hexdigest()
+
+def chunk_hashes(text: str, caption: bool = False, parse_mode: str | None = "HTML") -> list[str]:
+    """Хеши частей текста так, как их режут отправка и edit_parts."""
+    parts = split_caption_text(text, None, parse_mode) if caption else split_message_text(text, None, MAX_TEXT, parse_mode)
+    return [content_hash(chunk, parse_mode) for chunk, _ in parts]
+
+class EditResult(NamedTuple):
+    message_ids: list[int]  # актуальные части после правки, по порядку
+    hashes: list[str]       # хеши их содержимого
+    added: list[Message]    # досланные части
+    removed: list[int]      # удалённые лишние части
+    edited: int             # сколько частей реально отредактировано
+
+async def edit_parts(
+    bot: Bot,
+    chat_id: int,
+    message_ids: list[int],
+    text: str,
+    caption: bool = False,
+    parse_mode: str | None = "HTML",
+    hashes: list[str | None] | None = None
+) -> EditResult:
+    """
+    Правка сообщения, разошедшегося на части message_ids (по порядку).
+    Новый текст режется по тем же лимитам, что и при отправке; части правятся на месте,
+    лишние старые части удаляются, недостающие новые отправляются ответом на последнюю.
+    caption=True — первая часть это подпись медиа.
+    hashes — хеши текущего содержимого частей (content_hash): часть с тем же хешем не правится,
+    поэтому правка без изменений не стоит ни одного запроса и не ловит "message is not modified".
+    """
+    parts = split_caption_text(text, None, parse_mode) if caption else split_message_text(text, None, MAX_TEXT, parse_mode)
+    chunks = [chunk for chunk, _ in parts]
+    new_hashes = [content_hash(chunk, parse_mode) for chunk in chunks]
+    hashes = hashes or []
+
+    edited = 0
+    for idx, (message_id, chunk) in enumerate(zip(message_ids, chunks)):
+        if idx < len(hashes) and hashes[idx] == new_hashes[idx]:
+            continue
+        try:
+            if idx == 0 and caption:
+                await bot.edit_message_caption(chat_id=chat_id, message_id=message_id, caption=chunk, parse_mode=parse_mode)
+            else:
+                await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=chunk, parse_mode=parse_mode)
+            edited += 1
+        except TelegramBadRequest as e:
+            # Содержимое уже такое (хеш ещё не был известен) — часть актуальна
+            if "not modified" not in str(e):
+                raise
+
+    added = []
+    for chunk in chunks[len(message_ids):]:
+        added.append(await bot.send_message(
+            chat_id=chat_id,
+            text=chunk,
+            parse_mode=parse_mode,
+            reply_to_message_id=(added[-1].message_id if added else message_ids[-1])
+        ))
+
+    kept = max(len(chunks), 1)
+    removed = message_ids[kept:]
+    for message_id in removed:
+        try:
+            await bot.delete_message(chat_id=chat_id, message_id=message_id)
+        except TelegramBadRequest as e:
+            logger.warning(f"[SENDER] Не удалось удалить лишнюю часть {message_id}: {e}")
+
+    return EditResult(
+        message_ids=message_ids[:kept] + [m.message_id for m in added],
+        hashes=new_hashes,
+        added=added,
+        removed=removed,
+        edited=edited,
+    )
 
 async def send_content_to_group(
     message: Message,
@@ -82,14 +382,23 @@ async def send_content_to_group(
     prefix_entities: list[MessageEntity] | None = None,
     suffix: str = "",
     thread_id: int | None = None,
-    parse_mode: str | None = "HTML"
+    parse_mode: str | None = "HTML",
+    album: list[Message] | None = None
 ) -> list[Message]:
     """
     Универсальная пересылка сообщений в группу.
     Длинные подписи (>1024) и тексты (>4096) автоматически режутся.
     Сохраняет entities/caption_entities для форматирования и скрытых ссылок.
+    Альбом (album из AlbumMiddleware) уходит целиком через send_album_to_group.
     Возвращает список всех отправленных сообщений.
     """
+    if album and len(album) > 1:
+        return await send_album_to_group(
+            album, bot, chat_id,
+            prefix=prefix, prefix_entities=prefix_entities, suffix=suffix,
+            thread_id=thread_id, parse_mode=parse_mode,
+        )
+
     logger.info(f"[SENDER] send_content_to_group: type={message.content_type}, chat_id={chat_id}, thread_id={thread_id}, suffix_len={len(suffix)}")
 
     def add_thread(kwargs: dict):
@@ -97,56 +406,19 @@ async def send_content_to_group(
             kwargs["message_thread_id"] = int(thread_id)
         return kwargs
 
-    raw_content = ""
-    if parse_mode == "HTML":
-        # Используем встроенный метод aiogram для получения HTML-разметки
-        # Он корректно обрабатывает и text, и caption.
-        raw_content = message.html_text or ""
-    else:
-        raw_content = message.caption or message.text or ""
-
-    base_text = prefix + raw_content + (suffix or "")
-    
-    # Если мы НЕ в режиме HTML, используем ручное смещение entities
-    if parse_mode != "HTML":
-        entities = prefix_entities or []
-        original_entities = message.caption_entities or message.entities or []
-        if original_entities:
-            offset = utf16_len(prefix)
-            entities.extend(shift_entities(original_entities, offset))
-        
-        if not entities:
-            entities = None
-    else:
-        # В режиме HTML сущности уже "зашиты" в текст
-        entities = None
+    base_text, entities = compose_text(message, prefix, prefix_entities, suffix, parse_mode)
 
     sent_messages: list[Message] = []
     has_media = bool(message.photo or message.video or message.document or message.audio or message.voice or message.animation or message.sticker or message.video_note)
 
     try:
-        # Добавлено: Проверка на альбом (media group)
-        if message.media_group_id:
-            logger.info(f"[SENDER] Обнаружен альбом: media_group_id={message.media_group_id}")
-            # Для альбомов используем forward_message как fallback, т.к. разбиение не подходит
-            sent = await bot.forward_message(
-                chat_id=chat_id,
-                from_chat_id=message.chat.id,
-                message_id=message.message_id,
-                **add_thread({})
-            )
-            sent_messages.append(sent)
-            if suffix:
-                extra = await bot.send_message(chat_id=chat_id, text=suffix, **add_thread({}))
-                sent_messages.append(extra)
-            return sent_messages
-
         # Оптимизированная отправка для коротких сообщений
         # ВАЖНО: используем utf16_len для проверки лимитов Telegram
-        base_text_len = utf16_len(base_text)
+        # В режиме HTML лимит относится к отображаемому тексту, разметка не считается
+        base_text_len = rendered_utf16_len(base_text) if parse_mode == "HTML" else utf16_len(base_text)
         limit = MAX_CAPTION if has_media else MAX_TEXT
         
-        if base_text_len <= limit and not message.poll and not message.media_group_id:
+        if base_text_len <= limit and not message.poll:
             # Для медиа: используем copy_message с caption_entities
             if has_media:
                 sent = await bot.copy_message(
@@ -181,9 +453,7 @@ async def send_content_to_group(
     # Manual для длинных или специальных
     try:
         if has_media:
-            parts = split_text(base_text, MAX_CAPTION)
-            for idx, chunk in enumerate(parts):
-                chunk_entities = slice_entities(entities, idx * MAX_CAPTION, (idx + 1) * MAX_CAPTION)
+            for idx, (chunk, chunk_entities) in enumerate(split_caption_text(base_text, entities, parse_mode)):
                 kwargs = add_thread({
                     "caption": chunk,
                     "caption_entities": chunk_entities if not parse_mode else None,
@@ -240,9 +510,7 @@ async def send_content_to_group(
                     sent_messages.append(sent)
 
         elif message.text:
-            parts = split_text(base_text, MAX_TEXT)
-            for idx, chunk in enumerate(parts):
-                chunk_entities = slice_entities(entities, idx * MAX_TEXT, (idx + 1) * MAX_TEXT)
+            for chunk, chunk_entities in split_message_text(base_text, entities, MAX_TEXT, parse_mode):
                 sent = await bot.send_message(
                     chat_id=chat_id,
                     text=chunk,
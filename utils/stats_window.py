@@ -0,0 +1,29 @@
+# utils/stats_window.py
+#
+# Окно периодического лога метрик: ограничитель запросов, очередь апдейтов и кэши
+# поиска копят счётчики и раз в STATS_LOG_INTERVAL секунд пишут их одной строкой.
+
+from __future__ import annotations
+
+import time
+
+STATS_LOG_INTERVAL = 60.0
+
+
+class StatsWindow:
+    """
+    Args:
+        interval: Длина окна в секундах.
+    """
+
+    def __init__(self, interval: float = STATS_LOG_INTERVAL) -> None:
+        self.interval = interval
+        self._start = time.monotonic()
+
+    def elapsed(self) -> float | None:
+        """Длина окна, если оно истекло (и начинается новое), иначе None."""
+        now = time.monotonic()
+        if now - self._start < self.interval:
+            return None
+        elapsed, self._start = now - self._start, now
+        return elapsed
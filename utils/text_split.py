@@ -0,0 +1,116 @@
+# utils/text_split.py
+#
+# Разбиение длинного текста на части по лимиту Telegram, который считается
+# в единицах UTF-16, а не в символах Python: каждый символ вне BMP (большинство
+# эмодзи) занимает две единицы.
+#
+# Utf16Index за один проход регулярного выражения запоминает позиции таких
+# символов; перевод "индекс символа <-> смещение UTF-16" дальше — бинарный поиск,
+# без повторного кодирования строки. Границы частей выбираются по абзацу,
+# строке, концу предложения или пробелу в пределах лимита; разрыв посреди
+# слова — только если подходящей границы нет.
+
+from __future__ import annotations
+
+import re
+import unicodedata
+from bisect import bisect_left
+
+_ASTRAL = re.compile("[\U00010000-\U0010FFFF]")
+
+# Символы, перед которыми нельзя резать: склеивают эмодзи-последовательности
+_JOINERS = {"\u200d", "\ufe0e", "\ufe0f"}
+
+# Границы по убыванию предпочтения; режем после разделителя, он остаётся в текущей части
+_PARAGRAPH = ("\n\n",)
+_LINE = ("\n",)
+_SENTENCE = (". ", "! ", "? ", "… ", ".\n", "!\n", "?\n")
+_WORD = (" ", "\t")
+_BOUNDARIES = (_PARAGRAPH, _LINE, _SENTENCE, _WORD)
+
+
+class Utf16Index:
+    """Перевод между индексами символов строки и смещениями UTF-16."""
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        # Позиции символов, занимающих в UTF-16 две единицы (суррогатная пара)
+        self._astral = [m.start() for m in _ASTRAL.finditer(text)]
+
+    @property
+    def length(self) -> int:
+        """Длина всей строки в единицах UTF-16."""
+        return len(self.text) + len(self._astral)
+
+    def offset(self, index: int) -> int:
+        """Смещение UTF-16 начала символа index."""
+        return index + bisect_left(self._astral, index)
+
+    def index(self, offset: int) -> int:
+        """Наибольший индекс символа, начало которого не дальше offset единиц UTF-16."""
+        if not self._astral:
+            return min(offset, len(self.text))
+        lo, hi = 0, min(offset, len(self.text))
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.offset(mid) <= offset:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+
+def _safe_cut(text: str, start: int, cut: int) -> int:
+    """Сдвигает жёсткий разрез назад, чтобы не оторвать ZWJ/селектор/диакритику от символа."""
+    pos = cut
+    while pos > start + 1 and (
+        text[pos] in _JOINERS or text[pos - 1] == "\u200d" or unicodedata.combining(text[pos])
+    ):
+        pos -= 1
+    return pos if pos > start else cut
+
+
+def _find_boundary(text: str, start: int, end: int) -> int:
+    """Лучшая граница в text[start:end]; не ближе середины окна, иначе жёсткий разрез."""
+    floor = start + (end - start) // 2
+    for separators in _BOUNDARIES:
+        best = -1
+        for sep in separators:
+            pos = text.rfind(sep, floor, end)
+            if pos != -1 and pos + len(sep) <= end:
+                best = max(best, pos + len(sep))
+        if best > start:
+            return best
+    return _safe_cut(text, start, end)
+
+
+def split_spans(text: str, limit: int, index: Utf16Index | None = None) -> list[tuple[int, int]]:
+    """
+    Границы частей [start, end) в индексах символов.
+    Каждая часть не длиннее limit единиц UTF-16; склеенные части дают исходный текст.
+    """
+    if limit <= 0:
+        raise ValueError("limit должен быть положительным")
+    if not text:
+        return []
+
+    index = index or Utf16Index(text)
+    spans = []
+    start = 0
+    total = len(text)
+    while start < total:
+        end = index.index(index.offset(start) + limit)
+        if end >= total:
+            spans.append((start, total))
+            break
+        if end == start:
+            end = start + 1  # лимит меньше одного символа — не зацикливаемся
+        cut = _find_boundary(text, start, end)
+        spans.append((start, cut))
+        start = cut
+    return spans
+
+
+def split_text(text: str, limit: int) -> list[str]:
+    """Разбивает текст на части не длиннее limit единиц UTF-16 по естественным границам."""
+    return [text[start:end] for start, end in split_spans(text, limit)]
@@ -1,45 +1,151 @@
 # utils/thanks_db.py
 
 import sqlite3
-from utils.config import DB_PATH
+import time
+from datetime import datetime, timezone
+
+from utils.db_connection import get_connection
+from utils.leaderboard import Leaderboard
 from utils.logger import get_logger
 
 logger = get_logger("thanks_db")
 logger.info("[THANKS_DB] thanks_db.py загружен")
 
-def init_thanks_table():
-    with sqlite3.connect(DB_PATH) as conn:
+TOP_SIZE = 10
+
+# Топ-10 в памяти: /top10 не выполняет ORDER BY по всей таблице thanks
+leaderboard = Leaderboard(TOP_SIZE)
+
+# Параметры: (user_id, name, delta) — delta > 1 приходит из пакетной записи utils/write_behind.py.
+# RETURNING отдаёт итоговый счётчик для инкрементального обновления leaderboard.
+INCREMENT_THANKS_SQL = """
+    INSERT INTO thanks (user_id, name, count)
+    VALUES (?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        count = count + excluded.count,
+        name = excluded.name
+    RETURNING user_id, name, count
+"""
+
+# Периоды /top10: "all" — счётчик за всё время, "week"/"month" — текущая неделя (с понедельника)
+# и текущий месяц по UTC. Каждый благодарности-инкремент сразу прибавляется к дневному,
+# недельному и месячному бакету, поэтому топ за период — LIMIT по индексу одного бакета,
+# сколько бы ни было истории.
+PERIOD_ALL = "all"
+PERIOD_WEEK = "week"
+PERIOD_MONTH = "month"
+PERIODS = (PERIOD_WEEK, PERIOD_MONTH, PERIOD_ALL)
+
+ROLLUP_TABLES = {
+    "day": "thanks_daily",
+    PERIOD_WEEK: "thanks_weekly",
+    PERIOD_MONTH: "thanks_monthly",
+}
+
+def day_start(ts: int) -> int:
+    return ts - ts % 86400
+
+def week_start(ts: int) -> int:
+    # 1970-01-01 — четверг: сдвиг на 3 дня выравнивает недели по понедельникам
+    return day_start(ts) - ((ts // 86400 + 3) % 7) * 86400
+
+def month_start(ts: int) -> int:
+    dt = datetime.fromtimestamp(ts, timezone.utc)
+    return int(datetime(dt.year, dt.month, 1, tzinfo=timezone.utc).timestamp())
+
+def rollup_buckets(ts: int) -> dict[str, int]:
+    """Начала бакетов (Unix-секунды) дня, недели и месяца, в которые попадает ts."""
+    return {"day": day_start(ts), PERIOD_WEEK: week_start(ts), PERIOD_MONTH: month_start(ts)}
+
+# Параметры: (bucket, user_id, delta)
+INCREMENT_ROLLUP_SQL = {
+    period: f"""
+        INSERT INTO {table} (bucket, user_id, count)
+        VALUES (?, ?, ?)
+        ON CONFLICT(bucket, user_id) DO UPDATE SET count = count + excluded.count
+    """
+    for period, table in ROLLUP_TABLES.items()
+}
+
+def increment_rollups(conn: sqlite3.Connection, rows: list[tuple[int, int, int]]):
+    """Прибавляет (ts, user_id, delta) к бакетам; вызывается в транзакции записи благодарностей."""
+    for period, sql in INCREMENT_ROLLUP_SQL.items():
+        conn.executemany(
+            sql,
+            [(rollup_buckets(ts)[period], user_id, delta) for ts, user_id, delta in rows],
+        )
+
+def load_leaderboard():
+    with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS thanks (
-                user_id INTEGER PRIMARY KEY,
-                name TEXT,
-                count INTEGER DEFAULT 0
-            )
-        """)
-        conn.commit()
+            SELECT user_id, name, count FROM thanks
+            ORDER BY count DESC, user_id
+            LIMIT ?
+        """, (leaderboard.k,))
+        leaderboard.load(cursor.fetchall())
 
-def increment_thanks(user_id: int, name: str):
-    with sqlite3.connect(DB_PATH) as conn:
+def increment_thanks(user_id: int, name: str, ts: int | None = None):
+    ts = int(time.time()) if ts is None else ts
+    with get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO thanks (user_id, name, count)
-            VALUES (?, ?, 1)
-            ON CONFLICT(user_id) DO UPDATE SET
-                count = count + 1,
-                name = excluded.name
-        """, (user_id, name))
+        cursor.execute(INCREMENT_THANKS_SQL, (user_id, name, 1))
+        row = cursor.fetchone()
+        increment_rollups(conn, [(ts, user_id, 1)])
         conn.commit()
+    leaderboard.update(*row)
 
 def get_top_thanked(limit: int = 10) -> list[tuple[str, int]]:
-    with sqlite3.connect(DB_PATH) as conn:
+    if limit <= leaderboard.k:
+        return leaderboard.top(limit)
+
+    with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("""
             SELECT name, count FROM thanks
-            ORDER BY count DESC
+            ORDER BY count DESC, user_id
             LIMIT ?
         """, (limit,))
         result = cursor.fetchall()
     return result
 
-init_thanks_table()
+def get_top_thanked_for_period(period: str, limit: int = 10, now: int | None = None) -> list[tuple[str, int]]:
+    """Топ за текущую неделю или месяц: один бакет, обход индекса (count DESC) с LIMIT."""
+    rows, _ = get_top_snapshot(period, limit, [], now)
+    return [(name, count) for _, name, count in rows]
+
+def get_top_snapshot(
+    period: str, limit: int, user_ids: list[int], now: int | None = None
+) -> tuple[list[tuple[int, str, int]], dict[int, int]]:
+    """
+    Первые limit строк (user_id, name, count) топа периода и счётчики user_ids в нём —
+    для слияния с ещё не записанными благодарностями.
+    """
+    if period == PERIOD_ALL:
+        source, where, params = "thanks r", "", ()
+        name = "r.name"
+    else:
+        now = int(time.time()) if now is None else now
+        source = f"{ROLLUP_TABLES[period]} r LEFT JOIN thanks t ON t.user_id = r.user_id"
+        where, params = "WHERE r.bucket = ?", (rollup_buckets(now)[period],)
+        name = "COALESCE(t.name, r.user_id)"
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT r.user_id, {name}, r.count
+            FROM {source}
+            {where}
+            ORDER BY r.count DESC, r.user_id
+            LIMIT ?
+        """, (*params, limit))
+        rows = cursor.fetchall()
+        counts = {}
+        if user_ids:
+            condition = f"r.user_id IN ({', '.join('?' * len(user_ids))})"
+            cursor.execute(
+                f"SELECT r.user_id, r.count FROM {source} "
+                f"{where + ' AND' if where else 'WHERE'} {condition}",
+                (*params, *user_ids),
+            )
+            counts = dict(cursor.fetchall())
+    return rows, counts
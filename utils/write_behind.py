@@ -0,0 +1,377 @@
+# utils/write_behind.py
+#
+# Write-behind буфер для частых мелких записей: relay/reply-связи, отметки users,
+# пересланные новости и счётчики благодарностей.
+# Вместо отдельного commit (и fsync) на каждую запись строки копятся в памяти и
+# сбрасываются одной транзакцией каждые interval_ms или при накоплении max_rows строк.
+# Чтения через utils/async_db.py сначала смотрят в буфер, поэтому видят свои же
+# ещё не записанные данные.
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+from utils.db import MARK_USER_SENT_SQL, SAVE_CONTENT_HASH_SQL, SAVE_MAPPING_SQL, SAVE_REPLY_MAPPING_SQL
+from utils.db_connection import get_connection
+from utils.logger import get_logger
+from utils.news_db import SAVE_FORWARDED_NEWS_SQL, SAVE_NEWS_PART_SQL
+from utils.thanks_db import INCREMENT_THANKS_SQL, PERIOD_ALL, day_start, increment_rollups, leaderboard, rollup_buckets
+
+logger = get_logger("db")
+
+# Повтор неудавшегося сброса: пауза удваивается с каждой ошибкой, но не больше этой (секунды)
+MAX_RETRY_DELAY = 30.0
+
+
+class WriteBatch:
+    """Набор отложенных строк. Повторная запись по тому же ключу перезаписывает предыдущую."""
+
+    def __init__(self) -> None:
+        self.relay: dict[tuple[int, int], int] = {}       # (forwarded_id, original_id) -> user_id
+        self.reply: dict[int, tuple[int, int]] = {}       # admin_msg_id -> (user_id, user_msg_id)
+        self.users: set[int] = set()
+        self.news: dict[int, tuple[str, int | None]] = {} # message_id -> (content_hash, group_msg_id)
+        self.news_parts: set[tuple[int, int]] = set()     # (message_id, group_msg_id)
+        self.hashes: dict[tuple[int, int], str] = {}      # (chat_id, message_id) -> content_hash
+        self.thanks: dict[int, list] = {}                 # user_id -> [name, delta]
+        # Те же благодарности по дням для недельных/месячных топов: (day_start, user_id) -> delta
+        self.thanks_days: dict[tuple[int, int], int] = {}
+
+    def __len__(self) -> int:
+        return (
+            len(self.relay) + len(self.reply) + len(self.users)
+            + len(self.news) + len(self.news_parts) + len(self.hashes) + len(self.thanks)
+            + len(self.thanks_days)
+        )
+
+    def merge_into(self, other: "WriteBatch") -> None:
+        """Возвращает строки неудавшегося сброса в other, не затирая более свежие."""
+        for key, value in self.relay.items():
+            other.relay.setdefault(key, value)
+        for key, value in self.reply.items():
+            other.reply.setdefault(key, value)
+        other.users |= self.users
+        for key, value in self.news.items():
+            other.news.setdefault(key, value)
+        other.news_parts |= self.news_parts
+        for key, value in self.hashes.items():
+            other.hashes.setdefault(key, value)
+        for user_id, (name, delta) in self.thanks.items():
+            entry = other.thanks.setdefault(user_id, [name, 0])
+            entry[1] += delta
+        for key, delta in self.thanks_days.items():
+            other.thanks_days[key] = other.thanks_days.get(key, 0) + delta
+
+
+def commit_batch(batch: WriteBatch) -> list[tuple[int, str, int]]:
+    """
+    Записывает пачку одной транзакцией (выполняется на потоке-писателе).
+    Возвращает итоговые счётчики (user_id, name, count) благодарностей из пачки.
+    """
+    totals = []
+    with get_connection() as conn:
+        if batch.relay:
+            conn.executemany(
+                SAVE_MAPPING_SQL,
+                [(fid, uid, mid) for (fid, mid), uid in batch.relay.items()],
+            )
+        if batch.reply:
+            conn.executemany(
+                SAVE_REPLY_MAPPING_SQL,
+                [(aid, uid, mid) for aid, (uid, mid) in batch.reply.items()],
+            )
+        if batch.users:
+            conn.executemany(MARK_USER_SENT_SQL, [(uid,) for uid in batch.users])
+        if batch.news:
+            conn.executemany(
+                SAVE_FORWARDED_NEWS_SQL,
+                [(mid, h, gid) for mid, (h, gid) in batch.news.items()],
+            )
+        if batch.news_parts:
+            conn.executemany(SAVE_NEWS_PART_SQL, sorted(batch.news_parts))
+        if batch.hashes:
+            conn.executemany(
+                SAVE_CONTENT_HASH_SQL,
+                [(cid, mid, h) for (cid, mid), h in batch.hashes.items()],
+            )
+        # executemany не отдаёт строки RETURNING, поэтому по одному execute в той же транзакции
+        totals = [
+            conn.execute(INCREMENT_THANKS_SQL, (uid, name, delta)).fetchone()
+            for uid, (name, delta) in batch.thanks.items()
+        ]
+        if batch.thanks_days:
+            increment_rollups(
+                conn,
+                [(day, uid, delta) for (day, uid), delta in batch.thanks_days.items()],
+            )
+    return totals
+
+
+class WriteBehindBuffer:
+    """
+    Буфер отложенной записи с групповым commit.
+
+    Args:
+        write: Корутина-исполнитель, которой передаётся commit_batch и пачка
+               (в боте — запись на потоке-писателе utils/async_db.py); возвращает результат commit_batch.
+        interval_ms: Максимальная задержка строки в буфере.
+        max_rows: Порог числа строк, при котором сброс запускается сразу.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[Callable[[WriteBatch], list], WriteBatch], Awaitable[list]],
+        interval_ms: int = 200,
+        max_rows: int = 50,
+    ) -> None:
+        self._write = write
+        self._interval = interval_ms / 1000
+        self._max_rows = max_rows
+
+        self._pending = WriteBatch()
+        # Пачки, уже отданные писателю, но ещё не закоммиченные, — тоже видны чтениям
+        self._in_flight: list[WriteBatch] = []
+        self._timer: asyncio.Task | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._flush_lock = asyncio.Lock()
+        self._failures = 0
+
+    # ------------------------------------------------------------------
+    # Запись
+    # ------------------------------------------------------------------
+
+    def save_mapping(self, forwarded_id: int, user_id: int, original_id: int) -> None:
+        self.save_mappings([(forwarded_id, user_id, original_id)])
+
+    def save_mappings(self, rows: list[tuple[int, int, int]]) -> None:
+        for forwarded_id, user_id, original_id in rows:
+            self._pending.relay[(forwarded_id, original_id)] = user_id
+        self._schedule()
+
+    def discard_mappings(self, forwarded_ids: list[int]) -> None:
+        """Убирает ещё не записанные связи удалённых сообщений."""
+        ids = set(forwarded_ids)
+        for batch in self._batches():
+            for key in [key for key in batch.relay if key[0] in ids]:
+                del batch.relay[key]
+
+    def save_reply_mapping(self, admin_msg_id: int, user_id: int, user_msg_id: int) -> None:
+        self.save_reply_mappings([(admin_msg_id, user_id, user_msg_id)])
+
+    def save_reply_mappings(self, rows: list[tuple[int, int, int]]) -> None:
+        for admin_msg_id, user_id, user_msg_id in rows:
+            self._pending.reply[admin_msg_id] = (user_id, user_msg_id)
+        self._schedule()
+
+    def mark_user_sent(self, user_id: int) -> None:
+        self._pending.users.add(user_id)
+        self._schedule()
+
+    def save_forwarded_news(self, message_id: int, content_hash: str, group_msg_id: int | None = None) -> None:
+        self._pending.news[message_id] = (content_hash, group_msg_id)
+        self._schedule()
+
+    def save_news_parts(self, message_id: int, group_msg_ids: list[int]) -> None:
+        self._pending.news_parts.update((message_id, gid) for gid in group_msg_ids)
+        self._schedule()
+
+    def discard_news_parts(self, message_id: int, group_msg_ids: list[int]) -> None:
+        for batch in self._batches():
+            batch.news_parts.difference_update((message_id, gid) for gid in group_msg_ids)
+
+    def save_content_hashes(self, chat_id: int, hashes: dict[int, str]) -> None:
+        for message_id, content_hash in hashes.items():
+            self._pending.hashes[(chat_id, message_id)] = content_hash
+        self._schedule()
+
+    def increment_thanks(self, user_id: int, name: str) -> None:
+        entry = self._pending.thanks.setdefault(user_id, [name, 0])
+        entry[0] = name
+        entry[1] += 1
+        day_key = (day_start(int(time.time())), user_id)
+        self._pending.thanks_days[day_key] = self._pending.thanks_days.get(day_key, 0) + 1
+        self._schedule()
+
+    # ------------------------------------------------------------------
+    # Чтение своих отложенных записей (None — в буфере ничего нет)
+    # ------------------------------------------------------------------
+
+    def _batches(self) -> list[WriteBatch]:
+        # Сначала самые свежие данные
+        return [self._pending, *reversed(self._in_flight)]
+
+    def get_user_by_forwarded(self, forwarded_id: int) -> int | None:
+        for batch in self._batches():
+            for (fid, _), user_id in batch.relay.items():
+                if fid == forwarded_id:
+                    return user_id
+        return None
+
+    def get_admin_msg_id(self, user_id: int, user_msg_id: int) -> int | None:
+        for batch in self._batches():
+            for (forwarded_id, original_id), uid in reversed(batch.relay.items()):
+                if (uid, original_id) == (user_id, user_msg_id):
+                    return forwarded_id
+        return None
+
+    def get_admin_msg_ids(self, user_id: int, user_msg_id: int) -> set[int]:
+        return {
+            forwarded_id
+            for batch in self._batches()
+            for (forwarded_id, original_id), uid in batch.relay.items()
+            if (uid, original_id) == (user_id, user_msg_id)
+        }
+
+    def get_forwarded_originals(self, forwarded_id: int) -> set[int]:
+        return {
+            original_id
+            for batch in self._batches()
+            for (fid, original_id) in batch.relay
+            if fid == forwarded_id
+        }
+
+    def get_user_reply_msg(self, admin_msg_id: int) -> tuple[int, int] | None:
+        for batch in self._batches():
+            if admin_msg_id in batch.reply:
+                return batch.reply[admin_msg_id]
+        return None
+
+    def user_exists(self, user_id: int) -> bool:
+        return any(user_id in batch.users for batch in self._batches())
+
+    def is_hash_pending(self, content_hash: str) -> bool:
+        return any(
+            row[0] == content_hash
+            for batch in self._batches()
+            for row in batch.news.values()
+        )
+
+    def get_group_msg_id(self, message_id: int) -> int | None:
+        for batch in self._batches():
+            if message_id in batch.news:
+                return batch.news[message_id][1]
+        return None
+
+    def get_group_msg_ids(self, message_id: int) -> set[int]:
+        return {
+            gid
+            for batch in self._batches()
+            for mid, gid in batch.news_parts
+            if mid == message_id
+        }
+
+    def get_content_hash(self, chat_id: int, message_id: int) -> str | None:
+        for batch in self._batches():
+            if (chat_id, message_id) in batch.hashes:
+                return batch.hashes[(chat_id, message_id)]
+        return None
+
+    def has_pending_thanks(self) -> bool:
+        return any(batch.thanks for batch in self._batches())
+
+    def pending_thanks(self, period: str = PERIOD_ALL, now: int | None = None) -> dict[int, tuple[str, int]]:
+        """Не записанные приращения благодарностей user_id -> (name, delta) за всё время или за текущий период."""
+        names: dict[int, str] = {}
+        deltas: dict[int, int] = {}
+        bucket = None if period == PERIOD_ALL else rollup_buckets(int(time.time()) if now is None else now)[period]
+        for batch in reversed(self._batches()):  # от старых к новым: остаётся последнее имя
+            for user_id, (name, delta) in batch.thanks.items():
+                names[user_id] = name
+                if bucket is None:
+                    deltas[user_id] = deltas.get(user_id, 0) + delta
+            if bucket is not None:
+                for (day, user_id), delta in batch.thanks_days.items():
+                    if rollup_buckets(day)[period] == bucket:
+                        deltas[user_id] = deltas.get(user_id, 0) + delta
+        return {user_id: (names[user_id], delta) for user_id, delta in deltas.items()}
+
+    @property
+    def size(self) -> int:
+        """Число строк, ожидающих записи (включая сбрасываемые прямо сейчас)."""
+        return sum(len(batch) for batch in self._batches())
+
+    # ------------------------------------------------------------------
+    # Сброс
+    # ------------------------------------------------------------------
+
+    def _schedule(self) -> None:
+        if len(self._pending) >= self._max_rows:
+            task = asyncio.get_running_loop().create_task(self.flush())
+            # Держим ссылку, чтобы задачу не собрал GC до завершения
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.get_running_loop().create_task(
+                self._flush_later(), name="write_behind_flush"
+            )
+
+    async def _flush_later(self, delay: float | None = None) -> None:
+        await asyncio.sleep(self._interval if delay is None else delay)
+        # Таймер отработал: новые записи и повтор после ошибки заводят следующий
+        if self._timer is asyncio.current_task():
+            self._timer = None
+        # shield: отмена таймера в close() не должна обрывать уже начатую запись
+        await asyncio.shield(self.flush())
+
+    def _retry_later(self) -> None:
+        """Повтор сброса с нарастающей паузой — без новых записей строки не должны зависать в памяти."""
+        self._failures += 1
+        delay = min(self._interval * 2 ** self._failures, MAX_RETRY_DELAY)
+        if self._timer is not None and not self._timer.done():
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().create_task(
+            self._flush_later(delay), name="write_behind_retry"
+        )
+
+    async def flush(self) -> None:
+        """Сбрасывает всё накопленное одной транзакцией и дожидается уже идущих сбросов."""
+        if not self._pending:
+            async with self._flush_lock:
+                return
+
+        batch, self._pending = self._pending, WriteBatch()
+        self._in_flight.append(batch)
+        try:
+            # Сбросы идут строго по очереди, чтобы поздняя пачка не обогнала раннюю
+            async with self._flush_lock:
+                started = time.perf_counter()
+                totals = await self._write(commit_batch, batch)
+            # Топ обновляется в том же шаге цикла, где пачка уходит из _in_flight, —
+            # чтение топа не посчитает её дважды и не пропустит
+            if totals:
+                leaderboard.update_many(totals)
+            self._failures = 0
+            logger.debug(
+                f"[DB] write-behind: записано строк={len(batch)} "
+                f"за {(time.perf_counter() - started) * 1000:.1f} мс"
+            )
+        except Exception as e:
+            logger.error(f"[DB] write-behind: ошибка записи пачки ({len(batch)} строк): {e}")
+            batch.merge_into(self._pending)
+            self._retry_later()
+        finally:
+            self._in_flight.remove(batch)
+
+    async def close(self) -> None:
+        """Останавливает таймер и синхронно дописывает всё, что осталось в буфере."""
+        if self._timer and not self._timer.done():
+            self._timer.cancel()
+            try:
+                await self._timer
+            except asyncio.CancelledError:
+                pass
+        self._timer = None
+
+        async with self._flush_lock:
+            pass  # дождаться сброса, который уже выполняется
+        if self._pending:
+            batch, self._pending = self._pending, WriteBatch()
+            totals = await self._write(commit_batch, batch)
+            if totals:
+                leaderboard.update_many(totals)
+            logger.info(f"[DB] write-behind: при остановке записано строк={len(batch)}")
+
+        # Новый lock: буфер может пережить event loop, к которому был привязан старый
+        self._flush_lock = asyncio.Lock()